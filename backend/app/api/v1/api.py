@@ -1,5 +1,5 @@
 from fastapi import APIRouter
-from app.api.v1 import websocket, options
+from app.api.v1 import websocket, options, stream
 
 api_router = APIRouter()
 
@@ -8,3 +8,6 @@ api_router.include_router(websocket.router, tags=["websocket"])
 
 # Include Options routes
 api_router.include_router(options.router, prefix="/options", tags=["options"])
+
+# Include Server-Sent Events routes
+api_router.include_router(stream.router, prefix="/options", tags=["stream"])
@@ -8,6 +8,13 @@ from app.schemas.market_data import (
     KiteTick, MarketDepth, WebSocketSubscription,
     InstrumentType, OptionInstrument, FutureInstrument
 )
+from app.core.tick_record import TickRecord
+from app.core.admission import admission
+from app.core.client_queue import ClientSender
+from app.core.compact_protocol import batch_frames, negotiate, pack_record
+from app.core.config import settings
+from app.core.encoding import batch_json, dumps
+import asyncio
 import logging
 import json
 
@@ -73,14 +80,61 @@ async def get_market_depth(
         logger.error(f"Error getting market depth: {e}")
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.get("/writer/stats")
+async def get_writer_stats():
+    """Database tick writer queue depth, flush latency and throughput."""
+    if not market_data_service.writer:
+        raise HTTPException(status_code=404, detail="Tick writer not started")
+    return market_data_service.writer.stats()
+
 @router.websocket("/ws/market-data")
 async def websocket_endpoint(websocket: WebSocket, db: AsyncSession = Depends(get_db)):
-    """WebSocket endpoint for real-time market data."""
-    await websocket.accept()
+    """WebSocket endpoint for real-time market data.
+
+    Clients offering the ``kc.bin.v1`` subprotocol get ticks as compact
+    binary frames, everyone else gets JSON. With ``WS_MARKET_DATA_BATCH_MS``
+    set, the ticks of each window go out as one frame.
+    """
+    refusal = admission.admit()
+    if refusal:
+        await websocket.accept()
+        await websocket.close(code=1013, reason=refusal)
+        return
+    admission.start()
+    subprotocol = negotiate(websocket)
+    binary = subprotocol is not None
+    await websocket.accept(subprotocol=subprotocol)
+
+    async def send(message):
+        if isinstance(message, str):
+            await websocket.send_text(message)
+        else:
+            await websocket.send_bytes(message)
+        admission.record_sent(len(message))
+
+    def drop_client(client_id: str):
+        """Given up on by the slow client policy: stop feeding it and tell it to retry later"""
+        if send_tick in market_data_service.tick_callbacks:
+            market_data_service.tick_callbacks.remove(send_tick)
+        asyncio.create_task(websocket.close(code=1013, reason="Send queue full"))
+
+    sender = ClientSender(
+        str(id(websocket)),
+        send,
+        policy=settings.WS_SLOW_CLIENT_POLICY,
+        maxsize=settings.WS_CLIENT_QUEUE_SIZE,
+        flush_interval=settings.WS_MARKET_DATA_BATCH_MS / 1000,
+        on_close=drop_client,
+        batch=batch_frames if binary else (batch_json if settings.WS_MARKET_DATA_BATCH_MS else None),
+    )
+    sender.start()
+    admission.track(sender)
     
-    async def send_tick(tick: KiteTick):
+    async def send_tick(tick: TickRecord):
         try:
-            await websocket.send_json(tick.dict())
+            message = pack_record(tick) if binary else dumps(tick.to_dict())
+            # Keyed, so a backed-up client gets each token's latest tick rather than all of them
+            sender.offer(message, key=tick.instrument_token)
         except Exception as e:
             logger.error(f"Error sending tick data: {e}")
     
@@ -127,3 +181,6 @@ async def websocket_endpoint(websocket: WebSocket, db: AsyncSession = Depends(ge
         # Clean up on disconnect
         if send_tick in market_data_service.tick_callbacks:
             market_data_service.tick_callbacks.remove(send_tick)
+        sender.close()
+        admission.untrack(sender)
+        admission.release()
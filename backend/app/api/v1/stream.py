@@ -0,0 +1,99 @@
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from app.api.v1.websocket import manager, market_data_callback
+from app.core.admission import admission
+from typing import Optional, Tuple
+import asyncio
+import logging
+from datetime import datetime
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+KEEPALIVE_SECONDS = 15  # comment line sent on idle streams so proxies keep them open
+
+
+def parse_event_id(event_id: Optional[str]) -> Tuple[Optional[int], Optional[int]]:
+    """(epoch, seq) from an ``epoch-seq`` event id, (None, None) if absent or malformed"""
+    if not event_id:
+        return None, None
+    try:
+        epoch, seq = event_id.split("-", 1)
+        return int(epoch), int(seq)
+    except ValueError:
+        return None, None
+
+
+@router.get("/stream/{symbol}/{expiry}")
+async def stream_option_chain(
+    symbol: str,
+    expiry: str,
+    window: Optional[int] = Query(None, ge=0),
+    last_event_id: Optional[str] = Query(None),
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID")
+):
+    """Server-Sent Events stream of an option chain topic
+
+    Carries the same sequenced deltas as the websocket topic, from the same
+    shared producer: an ``OPTION_CHAIN`` snapshot, then ``MARKET_DATA``
+    events. The snapshot and ``POSITION`` events carry an ``epoch-seq`` id,
+    the position every earlier delta was delivered up to; a reconnect with
+    ``Last-Event-ID`` (or ``?last_event_id=``) gets only the missed deltas
+    and ``RESUMED`` while they are still buffered, a fresh snapshot otherwise.
+    """
+    refusal = admission.admit()
+    if refusal:
+        raise HTTPException(status_code=503, detail=refusal, headers={"Retry-After": "5"})
+
+    client_id = f"sse_{symbol}_{expiry}_{datetime.now().timestamp()}"
+    key = (symbol, expiry, window)
+    # Small, so a slow reader backs up into its sender queue where the overflow policy applies
+    events: asyncio.Queue = asyncio.Queue(maxsize=1)
+
+    async def send(event: str):
+        await events.put(event)
+        admission.record_sent(len(event))
+
+    async def close():
+        await manager.disconnect(client_id)
+        manager.release(client_id)
+        admission.release()
+
+    sender = manager.add_stream(client_id, key, send)
+    manager.kite_service.add_market_data_callback(market_data_callback)
+    try:
+        topic = await manager.chains.join(client_id, key)
+    except Exception as e:
+        logger.error(f"Error fetching option chain for stream {client_id}: {e}")
+        await close()
+        raise HTTPException(status_code=502, detail=str(e))
+
+    epoch, last_seq = parse_event_id(last_event_id_header or last_event_id)
+    first = None
+    if last_seq is None or not manager.resume(client_id, epoch, last_seq):
+        message = manager.snapshot_message(topic)
+        first = manager.sse_frame(message, message["seq"])
+    logger.info(f"Stream {client_id} opened for {symbol} {expiry}")
+
+    async def event_stream():
+        try:
+            if first:
+                yield first
+            while True:
+                try:
+                    yield await asyncio.wait_for(events.get(), timeout=KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if sender.closed:
+                        # Given up on by the slow client policy; the client reconnects with Last-Event-ID
+                        break
+                    yield ": keepalive\n\n"
+        finally:
+            await close()
+            logger.info(f"Stream {client_id} closed")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
@@ -2,10 +2,21 @@ from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query, HTTPExcept
 from starlette.websockets import WebSocketState
 from app.services.kite_service import KiteService
 from app.core.redis import get_redis
-from typing import Dict, Any, Optional
+from app.core.config import settings
+from app.core.admission import CONFLATE, admission
+from app.core.binary_relay import SUBPROTOCOL as RAW_SUBPROTOCOL, frame_for_client, split_frame
+from app.core.client_queue import ClientSender
+from app.core.compact_protocol import batch_frames, negotiate, pack_tick
+from app.core.encoding import Encoded, EncodingCache, batch_json, dumps, sse_event
+from app.core.filters import SubscriptionFilter
+from app.core.resume import TopicBuffers
+from app.core.subscriptions import MODE_FULL, project
+from app.services.chain_topics import ChainTopic, ChainTopics, TopicKey
+from typing import Dict, Any, Optional, Set
 import json
 import logging
 import asyncio
+import time
 from datetime import datetime
 
 router = APIRouter()
@@ -14,9 +25,22 @@ logger = logging.getLogger(__name__)
 class ConnectionManager:
     def __init__(self):
         self.active_connections: Dict[str, WebSocket] = {}
+        self.senders: Dict[str, ClientSender] = {}  # per-client bounded queue and writer task
+        self.binary_clients: Set[str] = set()  # clients that negotiated kc.bin.v1
+        self.raw_clients: Set[str] = set()  # clients that negotiated kite.raw.v1, relayed Kite frames
+        self.sse_clients: Set[str] = set()  # read-only Server-Sent Events viewers
+        self.client_topics: Dict[str, TopicKey] = {}  # client: (symbol, expiry, window)
+        self.topics = TopicBuffers(settings.WS_RESUME_BUFFER_SIZE)  # sequenced deltas per topic
+        # client: {token: filter}, the None entry applying to every token without its own
+        self.client_filters: Dict[str, Dict[Optional[int], SubscriptionFilter]] = {}
+        self.flush_interval = settings.WS_CONFLATION_INTERVAL_MS / 1000
         self.kite_service = KiteService()
+        self.chains = ChainTopics(self.kite_service)  # option chains shared by their viewers
+        admission.on_level = self.apply_load_level
+        self.encodes = 0  # messages serialised
+        self.sends = 0  # messages sent, each reusing an encoded buffer
 
-    async def connect(self, websocket: WebSocket, client_id: str, token: str):
+    async def connect(self, websocket: WebSocket, client_id: str, token: str, topic: TopicKey):
         """Connect a client and initialize their session"""
         try:
             # Verify token from Redis
@@ -33,9 +57,37 @@ class ConnectionManager:
             # Set up Kite connection with the stored token
             self.kite_service.set_access_token(stored_token)
             
-            # Accept WebSocket connection
-            await websocket.accept()
+            # Accept WebSocket connection, in the raw Kite or compact binary protocol if the client asked for it
+            raw = self.kite_service.relays_frames and RAW_SUBPROTOCOL in (websocket.scope.get("subprotocols") or ())
+            subprotocol = RAW_SUBPROTOCOL if raw else negotiate(websocket)
+            await websocket.accept(subprotocol=subprotocol)
             self.active_connections[client_id] = websocket
+            self.client_topics[client_id] = topic
+            if raw:
+                self.raw_clients.add(client_id)
+                self.kite_service.add_frame_callback(self.relay_frame)
+            elif subprotocol:
+                self.binary_clients.add(client_id)
+            sender = ClientSender(
+                client_id,
+                lambda message: self.send_encoded(client_id, message),
+                policy=settings.WS_SLOW_CLIENT_POLICY,
+                maxsize=settings.WS_CLIENT_QUEUE_SIZE,
+                flush_interval=self.current_flush_interval(),
+                max_per_flush=self.current_max_per_flush(),
+                # 1013 (try again later), so the client reconnects and resumes
+                on_close=lambda cid: asyncio.create_task(self.disconnect(cid, code=1013)),
+                # Relayed Kite frames go out as they are
+                batch=None if raw else (
+                    batch_frames if subprotocol else (batch_json if settings.WS_OPTIONS_BATCH_FRAMES else None)
+                ),
+                # Binary clients cannot resume, so they get no positions
+                mark=None if subprotocol else lambda seq: dumps(self.position_message(seq)),
+            )
+            sender.start()
+            self.senders[client_id] = sender
+            admission.track(sender)
+            admission.start()
             logger.info(f"Client {client_id} connected successfully")
         except Exception as e:
             logger.error(f"Failed to connect client {client_id}: {str(e)}")
@@ -43,84 +95,399 @@ class ConnectionManager:
                 await websocket.close(code=4000, reason=str(e))
             raise
 
-    async def disconnect(self, client_id: str):
+    async def disconnect(self, client_id: str, code: int = 1000):
         """Disconnect a client and clean up their session"""
         try:
+            sender = self.senders.pop(client_id, None)
+            if sender:
+                sender.close()
+                admission.untrack(sender)
+            self.binary_clients.discard(client_id)
+            self.raw_clients.discard(client_id)
+            if not self.raw_clients:
+                self.kite_service.remove_frame_callback(self.relay_frame)
+            self.sse_clients.discard(client_id)
+            self.client_filters.pop(client_id, None)
             if client_id in self.active_connections:
                 websocket = self.active_connections[client_id]
                 if websocket.client_state != WebSocketState.DISCONNECTED:
-                    await websocket.close()
+                    await websocket.close(code=code)
                 del self.active_connections[client_id]
+            if sender:
+                logger.info(f"Client {client_id} send queue stats: {sender.stats()}")
             logger.info(f"Client {client_id} disconnected and cleaned up")
         except Exception as e:
             logger.error(f"Error during client {client_id} cleanup: {str(e)}")
 
     async def send_market_data(self, client_id: str, data: Dict[str, Any]):
-        """Send market data to a specific client"""
-        if client_id in self.active_connections:
-            try:
-                websocket = self.active_connections[client_id]
-                if websocket.client_state != WebSocketState.DISCONNECTED:
-                    await websocket.send_json(data)
-                else:
-                    await self.disconnect(client_id)
-            except Exception as e:
-                logger.error(f"Error sending market data to {client_id}: {str(e)}")
+        """Queue market data for a specific client"""
+        sender = self.senders.get(client_id)
+        if sender is not None:
+            self.encodes += 1
+            sender.offer(dumps(data))
+
+    async def send_encoded(self, client_id: str, message: Encoded):
+        """Send an already encoded message to a specific client"""
+        websocket = self.active_connections.get(client_id)
+        if websocket is None:
+            return
+        try:
+            if websocket.client_state == WebSocketState.DISCONNECTED:
                 await self.disconnect(client_id)
+            elif isinstance(message, str):
+                await websocket.send_text(message)
+            else:
+                await websocket.send_bytes(message)
+            self.sends += 1
+            admission.record_sent(len(message))
+        except Exception as e:
+            logger.error(f"Error sending market data to {client_id}: {str(e)}")
+            await self.disconnect(client_id)
+
+    def queue_market_data(self, client_id: str, instrument_token: int, message: Encoded, seq: Optional[int] = None):
+        """Queue an encoded update at topic position ``seq``; the overflow policy decides what a full queue does"""
+        sender = self.senders.get(client_id)
+        if sender is not None:
+            sender.offer(message, key=instrument_token, position=seq)
+
+    def current_flush_interval(self) -> float:
+        """Client flush interval, stretched while the server sheds load"""
+        if admission.level >= CONFLATE:
+            return max(self.flush_interval, settings.WS_SHED_FLUSH_MS / 1000)
+        return self.flush_interval
+
+    def current_max_per_flush(self) -> int:
+        """Messages per flush that keep clients at WS_MAX_CLIENT_MESSAGES_PER_SEC at the current interval"""
+        return max(1, int(settings.WS_MAX_CLIENT_MESSAGES_PER_SEC * self.current_flush_interval()))
+
+    def apply_load_level(self, level: int):
+        # Flushing less often sends the same tokens' latest values, not fewer tokens per second
+        flush_interval = self.current_flush_interval()
+        max_per_flush = self.current_max_per_flush()
+        for sender in self.senders.values():
+            sender.flush_interval = flush_interval
+            sender.max_per_flush = max_per_flush
+
+    def set_filter(self, client_id: str, tokens: Optional[list], subscription: Optional[SubscriptionFilter]):
+        """Attach a subscription's projection and thresholds to tokens, or to the whole client"""
+        filters = self.client_filters.setdefault(client_id, {})
+        for token in tokens or [None]:
+            if subscription is None:
+                filters.pop(token, None)
+            else:
+                filters[token] = subscription
+
+    def filter_for(self, client_id: str, instrument_token: int) -> Optional[SubscriptionFilter]:
+        filters = self.client_filters.get(client_id)
+        if not filters:
+            return None
+        return filters.get(instrument_token) or filters.get(None)
+
+    def release(self, client_id: str):
+        """Drop a disconnected client's subscriptions once the resume grace period is over
+
+        Until then its topic keeps receiving and buffering deltas, so the
+        client can reconnect and resume from where it left off.
+        """
+        grace = settings.WS_RESUME_GRACE_SECONDS
+        if grace > 0:
+            asyncio.get_running_loop().call_later(grace, self._release, client_id)
+        else:
+            self._release(client_id)
+
+    def _release(self, client_id: str):
+        self.kite_service.remove_client(client_id)
+        key = self.client_topics.pop(client_id, None)
+        if key is not None and self.chains.leave(client_id, key):
+            # The topic is gone and its deltas stop flowing; resuming from before here needs a snapshot
+            self.topics.drop(key)
+        # The callback fans out to every client, keep it while any remain
+        if not self.client_topics:
+            self.kite_service.remove_market_data_callback(market_data_callback)
+
+    def add_stream(self, client_id: str, key: TopicKey, send) -> ClientSender:
+        """Register a Server-Sent Events viewer of a topic; ``send`` receives SSE text"""
+        sender = ClientSender(
+            client_id,
+            send,
+            policy=settings.WS_SLOW_CLIENT_POLICY,
+            maxsize=settings.WS_CLIENT_QUEUE_SIZE,
+            flush_interval=self.current_flush_interval(),
+            max_per_flush=self.current_max_per_flush(),
+            # Consecutive events are a valid event stream, write each flush at once
+            batch=lambda events: ["".join(events)],
+            mark=lambda seq: self.sse_frame(self.position_message(seq), seq),
+        )
+        sender.start()
+        self.senders[client_id] = sender
+        admission.track(sender)
+        self.client_topics[client_id] = key
+        self.sse_clients.add(client_id)
+        admission.start()
+        return sender
+
+    def sse_frame(self, message: Dict[str, Any], seq: Optional[int] = None) -> str:
+        """A message as a Server-Sent Event; with ``seq`` its id is that stream position, for Last-Event-ID
+
+        Only snapshots and ``POSITION`` events carry an id: deltas arrive
+        out of order, and the browser resends the last id it saw.
+        """
+        if seq is None:
+            return sse_event(message["type"], dumps(message))
+        return sse_event(message["type"], dumps(message), f"{self.topics.epoch}-{seq}")
+
+    def position_message(self, seq: int) -> Dict[str, Any]:
+        """Everything up to ``seq`` was delivered to the client, the place to resume from"""
+        return {"type": "POSITION", "epoch": self.topics.epoch, "seq": seq}
+
+    def snapshot_message(self, topic: ChainTopic) -> Dict[str, Any]:
+        return {
+            "type": "OPTION_CHAIN",
+            "epoch": self.topics.epoch,
+            "seq": self.topics.seq(topic.key),
+            "data": topic.snapshot()
+        }
+
+    def _frame(self, client_id: str, message: Dict[str, Any]) -> str:
+        if client_id in self.sse_clients:
+            return self.sse_frame(message)
+        return dumps(message)
+
+    async def send_snapshot(self, websocket: WebSocket, topic: ChainTopic):
+        """Send the topic's current option chain, stamped with the sequence it is current at"""
+        await websocket.send_json(self.snapshot_message(topic))
+
+    def resume(self, client_id: str, epoch: Optional[int], last_seq: Optional[int]) -> bool:
+        """Queue the deltas a reconnecting client missed; False if they are gone
+
+        Call right after the client joins its topic, so live deltas queue
+        behind the replayed ones and none fall in between.
+        """
+        sender = self.senders.get(client_id)
+        key = self.client_topics.get(client_id)
+        topic = self.chains.topics.get(key)
+        if sender is None or topic is None or client_id in self.binary_clients or client_id in self.raw_clients:
+            return False
+        missed = self.topics.resume(key, epoch, last_seq)
+        if missed is None:
+            return False
+        # Topic deltas, not the extra instruments other viewers subscribed themselves
+        wanted = set(topic.tokens)
+        replayed = 0
+        for seq, delta in missed:
+            instrument_token = delta.get("instrument_token")
+            if instrument_token in wanted:
+                # Keyed by token, so only the latest missed delta per token is sent
+                sender.offer(
+                    self._frame(client_id, {"type": "MARKET_DATA", "seq": seq, "data": delta}),
+                    key=instrument_token,
+                    position=seq,
+                )
+                replayed += 1
+        seq = self.topics.seq(key)
+        sender.offer(self._frame(client_id, {"type": "RESUMED", "epoch": self.topics.epoch, "seq": seq}), position=seq)
+        logger.info(f"Client {client_id} resumed from seq {last_seq}, {replayed} missed deltas")
+        return True
+
+    def relay_frame(self, payload: bytes):
+        """Queue a raw Kite frame for the raw clients, cut down to the packets of tokens each one receives"""
+        if not self.raw_clients:
+            return
+        packets = split_frame(payload)
+        if not packets:
+            return
+        for client_id in list(self.raw_clients):
+            sender = self.senders.get(client_id)
+            topic = self.chains.topics.get(self.client_topics.get(client_id))
+            if sender is None or topic is None:
+                continue
+            held = self.kite_service.client_tokens(client_id)
+            frame = frame_for_client(payload, packets, topic.token_set | held if held else topic.token_set)
+            if frame:
+                sender.offer(frame)
+
+    def stats(self) -> Dict[str, Any]:
+        """Send queue statistics per connected client"""
+        clients = {client_id: sender.stats() for client_id, sender in self.senders.items()}
+        return {
+            "flush_interval_ms": settings.WS_CONFLATION_INTERVAL_MS,
+            "max_messages_per_flush": self.current_max_per_flush(),
+            "slow_client_policy": settings.WS_SLOW_CLIENT_POLICY,
+            "queue_size": settings.WS_CLIENT_QUEUE_SIZE,
+            "binary_clients": len(self.binary_clients),
+            "raw_clients": len(self.raw_clients),
+            "sse_clients": len(self.sse_clients),
+            "clients": clients,
+            "conflated_total": sum(c.get("conflated", 0) for c in clients.values()),
+            "dropped_total": sum(c["dropped"] for c in clients.values()),
+            "encodes": self.encodes,
+            "sends": self.sends,
+            "filtered_total": sum(
+                subscription.suppressed
+                for filters in self.client_filters.values()
+                for subscription in set(filters.values())
+            ),
+            "admission": admission.stats(),
+            "resume": self.topics.stats(),
+            "chains": self.chains.stats(),
+            "ticker_shards": self.kite_service.ticker_metrics(),
+        }
 
 async def market_data_callback(data: Dict[str, Any]):
     """Callback function for market data updates"""
-    for client_id in list(manager.active_connections.keys()):
-        await manager.send_market_data(client_id, {
-            "type": "MARKET_DATA",
-            "data": data
-        })
+    payload = data.get("data", data)
+    instrument_token = payload.get("instrument_token")
+    if instrument_token is None:
+        return
+    kite_service = manager.kite_service
+    # Topic subscribers stand for all their viewers; a client's own subscription mode wins
+    recipients: Dict[str, Optional[int]] = {}
+    for subscriber in list(kite_service.subscribers(instrument_token)):
+        topic = manager.chains.get(subscriber)
+        if topic is not None:
+            topic.apply(payload)
+            for client_id in topic.viewers:
+                recipients.setdefault(client_id, MODE_FULL)
+        else:
+            recipients[subscriber] = kite_service.client_mode(subscriber, instrument_token)
+    # Under load every update goes out in ltp mode
+    capped = {client_id: admission.cap_mode(mode) for client_id, mode in recipients.items()}
+    # Serialise once per protocol, mode and topic, every subscriber in that variant gets the same buffer
+    cache = EncodingCache()
+    topic_seqs: Dict[TopicKey, int] = {}
+    now = time.monotonic()
+    for client_id, mode in capped.items():
+        if client_id in manager.raw_clients:
+            continue  # relayed the Kite frame itself by relay_frame
+        topic = manager.client_topics.get(client_id)
+        if topic in topic_seqs:
+            seq = topic_seqs[topic]
+        else:
+            # Buffered once per topic so reconnecting clients can catch up; tokens the
+            # viewer holds beyond its chain are not part of the topic and carry no seq
+            chain = manager.chains.topics.get(topic)
+            in_topic = chain is not None and instrument_token in chain.token_set
+            seq = topic_seqs[topic] = manager.topics.append(topic, payload) if in_topic else None
+        # Unchanged and below-threshold updates are dropped before anything is encoded
+        subscription = manager.filter_for(client_id, instrument_token)
+        if subscription is not None and not subscription.accept(instrument_token, payload, now):
+            continue
+        # Only send the fields of the mode this client asked for
+        if client_id in manager.binary_clients:
+            # A packed record, the sender batches records into frames
+            message = cache.get(("bin", mode), lambda: project(payload, mode), encode=pack_tick)
+        elif client_id in manager.sse_clients:
+            message = cache.get(
+                ("sse", mode, topic),
+                lambda: {"type": "MARKET_DATA", "seq": seq, "data": project(payload, mode)},
+                encode=manager.sse_frame,
+            )
+        elif subscription is not None and subscription.fields is not None:
+            message = cache.get(
+                ("json", mode, topic, subscription.fields),
+                lambda: {"type": "MARKET_DATA", "seq": seq, "data": subscription.project(project(payload, mode))},
+            )
+        else:
+            message = cache.get(
+                ("json", mode, topic),
+                lambda: {"type": "MARKET_DATA", "seq": seq, "data": project(payload, mode)},
+            )
+        manager.queue_market_data(client_id, instrument_token, message, seq)
+    manager.encodes += cache.encodes
 
 manager = ConnectionManager()
 
+@router.get("/ws/stats")
+async def websocket_stats() -> Dict[str, Any]:
+    """Per-client send queue and per-shard ticker statistics"""
+    return manager.stats()
+
 @router.websocket("/options/{symbol}/{expiry}")
 async def websocket_endpoint(
     websocket: WebSocket,
     symbol: str,
     expiry: str,
-    token: str = Query(...)
+    token: str = Query(...),
+    window: Optional[int] = Query(None, ge=0),
+    epoch: Optional[int] = Query(None),
+    last_seq: Optional[int] = Query(None)
 ):
-    """WebSocket endpoint for real-time market data"""
+    """WebSocket endpoint for real-time market data
+
+    Every client watching the same (symbol, expiry, window) joins one shared
+    chain topic; ``window`` limits the chain to that many strikes either
+    side of ATM. Deltas may arrive out of order; ``POSITION`` messages say
+    how far the client has everything. A reconnecting client passes the
+    ``epoch`` and the ``seq`` of the last ``POSITION`` (or snapshot) it got
+    as ``last_seq``: if the deltas it missed are still buffered it
+    gets only those, followed by ``RESUMED``, otherwise a fresh
+    ``OPTION_CHAIN`` snapshot.
+
+    Clients offering the ``kite.raw.v1`` subprotocol get the Kite binary
+    frames themselves, cut down to their topic's and own instruments, and
+    decode them like KiteTicker does; control messages stay JSON. Raw
+    frames exist only where the ticker runs in this process
+    (``INGEST_MODE=inline``), and raw clients cannot resume.
+    """
     client_id = f"{symbol}_{expiry}_{datetime.now().timestamp()}"
+    key = (symbol, expiry, window)
+
+    # Turned away before any work is done for it; 1013 tells the client to retry later
+    refusal = admission.admit()
+    if refusal:
+        logger.warning(f"Refused client {client_id}: {refusal}")
+        await websocket.accept()
+        await websocket.close(code=1013, reason=refusal)
+        return
     
     try:
         # Connect client
-        await manager.connect(websocket, client_id, token)
+        await manager.connect(websocket, client_id, token, key)
         logger.info(f"Client {client_id} connected for {symbol} {expiry}")
 
-        # Get initial option chain data
-        try:
-            chain = await manager.kite_service.get_option_chain(symbol, expiry)
-            await websocket.send_json({
-                "type": "OPTION_CHAIN",
-                "data": chain
-            })
-        except Exception as e:
-            logger.error(f"Error fetching initial option chain: {e}")
-            await websocket.send_json({
-                "type": "ERROR",
-                "error": str(e)
-            })
-
         # Add market data callback
         manager.kite_service.add_market_data_callback(market_data_callback)
         
         try:
+            # Join the shared chain, built and subscribed by its first viewer
+            try:
+                topic = await manager.chains.join(client_id, key)
+            except Exception as e:
+                logger.error(f"Error fetching initial option chain: {e}")
+                await websocket.send_json({
+                    "type": "ERROR",
+                    "error": str(e)
+                })
+            else:
+                if last_seq is None or not manager.resume(client_id, epoch, last_seq):
+                    await manager.send_snapshot(websocket, topic)
+
             while True:
                 data = await websocket.receive_json()
                 logger.debug(f"Received data from client {client_id}: {data}")
                 
                 if data.get("type") == "subscribe":
+                    # Instruments beyond the chain topic, held by this client alone. Optional
+                    # "fields" and "filters" apply to those instruments, or without
+                    # instruments to everything the client receives.
                     try:
+                        subscription = SubscriptionFilter.from_message(data)
+                        manager.set_filter(client_id, data.get("instruments"), subscription)
                         if "instruments" in data:
                             tokens = data["instruments"]
-                            if tokens:
-                                manager.kite_service.subscribe(tokens)
+                            held = manager.kite_service.client_tokens(client_id)
+                            adding = len(set(tokens) - held)
+                            if tokens and not admission.tokens_allowed(len(held), adding):
+                                await websocket.send_json({
+                                    "type": "ERROR",
+                                    "error": f"Subscription limit of {admission.max_tokens_per_client} instruments reached"
+                                })
+                            elif tokens:
+                                manager.kite_service.subscribe(
+                                    tokens,
+                                    mode=data.get("mode", MODE_FULL),
+                                    client_id=client_id
+                                )
                                 await websocket.send_json({
                                     "type": "SUCCESS",
                                     "message": "Subscribed to instruments"
@@ -131,12 +498,22 @@ async def websocket_endpoint(
                             "type": "ERROR",
                             "error": str(e)
                         })
+
+                elif data.get("type") == "unsubscribe":
+                    tokens = data.get("instruments") or []
+                    if tokens:
+                        manager.kite_service.unsubscribe(tokens, client_id=client_id)
+                        manager.set_filter(client_id, tokens, None)
+                        await websocket.send_json({
+                            "type": "SUCCESS",
+                            "message": "Unsubscribed from instruments"
+                        })
                 
         except WebSocketDisconnect:
             logger.info(f"Client {client_id} disconnected")
         finally:
             await manager.disconnect(client_id)
-            manager.kite_service.remove_market_data_callback(market_data_callback)
+            manager.release(client_id)
             
     except Exception as e:
         logger.error(f"WebSocket error for client {client_id}: {str(e)}")
@@ -146,3 +523,4 @@ async def websocket_endpoint(
         # Clean up
         if client_id in manager.active_connections:
             await manager.disconnect(client_id)
+        admission.release()
@@ -0,0 +1,171 @@
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+import asyncio
+import logging
+import time
+from app.core.config import settings
+from app.core.subscriptions import MODE_LTP
+
+logger = logging.getLogger(__name__)
+
+# Load levels, each one including the degradations below it
+NORMAL = 0
+CONFLATE = 1  # flush client queues less often, sending only the latest value per token
+LTP_ONLY = 2  # project every update down to ltp mode
+REFUSE = 3  # turn away new connections
+LEVEL_NAMES = {NORMAL: "normal", CONFLATE: "conflate", LTP_ONLY: "ltp_only", REFUSE: "refuse"}
+
+# Share of all client queue capacity in use, and of the outbound byte budget, that raise each level
+QUEUE_FILL_LEVELS = (0.25, 0.5, 0.9)
+BYTES_LEVELS = (0.8, 1.0, 2.0)
+
+
+def _level(value: float, thresholds: Tuple[float, ...]) -> int:
+    level = NORMAL
+    for threshold in thresholds:
+        if value >= threshold:
+            level += 1
+    return level
+
+
+class AdmissionController:
+    """Connection, subscription and bandwidth limits for the websocket endpoints.
+
+    Load is sampled every ``interval`` seconds from event loop lag, client
+    queue fill and outbound bytes per second; the worst of the three sets
+    the level. Levels rise immediately and fall one step at a time once
+    load has stayed lower for ``recover_seconds``, so shedding does not
+    flap on and off.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 2000,
+        max_tokens_per_client: int = 500,
+        max_bytes_per_sec: int = 50_000_000,
+        lag_levels_ms: Tuple[float, float, float] = (50, 200, 1000),
+        recover_seconds: float = 5.0,
+        interval: float = 0.1,
+    ):
+        self.max_connections = max_connections
+        self.max_tokens_per_client = max_tokens_per_client
+        self.max_bytes_per_sec = max_bytes_per_sec
+        self.lag_levels_ms = lag_levels_ms
+        self.recover_seconds = recover_seconds
+        self.interval = interval
+        self.connections = 0
+        self.level = NORMAL
+        self.lag_ms = 0.0
+        self.bytes_per_sec = 0.0
+        self.refused = 0
+        self.senders: Set[Any] = set()  # ClientSenders of every endpoint, for queue fill
+        self.on_level: Optional[Callable[[int], None]] = None
+        self._bytes = 0
+        self._justified_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_settings(cls) -> "AdmissionController":
+        return cls(
+            max_connections=settings.WS_MAX_CONNECTIONS,
+            max_tokens_per_client=settings.WS_MAX_TOKENS_PER_CLIENT,
+            max_bytes_per_sec=settings.WS_MAX_OUTBOUND_BYTES_PER_SEC,
+            lag_levels_ms=(settings.WS_SHED_CONFLATE_LAG_MS, settings.WS_SHED_LTP_LAG_MS, settings.WS_SHED_REFUSE_LAG_MS),
+            recover_seconds=settings.WS_SHED_RECOVER_SECONDS,
+        )
+
+    def start(self):
+        """Start sampling load on the running loop; safe to call on every connect"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._monitor())
+
+    def admit(self) -> Optional[str]:
+        """Take a connection slot, or return why the connection is refused"""
+        reason = None
+        if self.connections >= self.max_connections:
+            reason = "Connection limit reached"
+        elif self.level >= REFUSE:
+            reason = "Server overloaded"
+        if reason:
+            self.refused += 1
+            return reason
+        self.connections += 1
+        return None
+
+    def release(self):
+        self.connections = max(0, self.connections - 1)
+
+    def track(self, sender):
+        """Count a client's send queue towards queue fill"""
+        self.senders.add(sender)
+
+    def untrack(self, sender):
+        self.senders.discard(sender)
+
+    def queue_depth(self) -> Tuple[int, int]:
+        """(messages queued, queue capacity) over all tracked clients"""
+        senders = list(self.senders)
+        return sum(len(sender) for sender in senders), sum(sender.maxsize for sender in senders)
+
+    def tokens_allowed(self, current: int, adding: int) -> bool:
+        return current + adding <= self.max_tokens_per_client
+
+    def record_sent(self, size: int):
+        self._bytes += size
+
+    def cap_mode(self, mode: Optional[int]) -> Optional[int]:
+        """The mode an update is sent in at the current level"""
+        if self.level >= LTP_ONLY:
+            return MODE_LTP
+        return mode
+
+    async def _monitor(self):
+        last_bytes_at = time.monotonic()
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            # How late the loop woke us is how long every other callback waits too
+            self.lag_ms = max(0.0, (now - expected) * 1000)
+            if now - last_bytes_at >= 1.0:
+                self.bytes_per_sec = self._bytes / (now - last_bytes_at)
+                self._bytes = 0
+                last_bytes_at = now
+            self._update(now)
+
+    def _update(self, now: float):
+        level = _level(self.lag_ms, self.lag_levels_ms)
+        queued, capacity = self.queue_depth()
+        if capacity:
+            level = max(level, _level(queued / capacity, QUEUE_FILL_LEVELS))
+        if self.max_bytes_per_sec:
+            level = max(level, _level(self.bytes_per_sec / self.max_bytes_per_sec, BYTES_LEVELS))
+
+        if level >= self.level:
+            if level > self.level:
+                self._set_level(level)
+            self._justified_at = now  # load still calls for the current level
+        elif now - self._justified_at >= self.recover_seconds:
+            self._set_level(self.level - 1)
+            self._justified_at = now
+
+    def _set_level(self, level: int):
+        logger.warning(f"Websocket load level {LEVEL_NAMES[self.level]} -> {LEVEL_NAMES[level]} "
+                       f"(loop lag {self.lag_ms:.0f}ms, {self.bytes_per_sec:.0f} bytes/s)")
+        self.level = level
+        if self.on_level:
+            self.on_level(level)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "level": LEVEL_NAMES[self.level],
+            "connections": self.connections,
+            "max_connections": self.max_connections,
+            "refused": self.refused,
+            "queued": self.queue_depth()[0],
+            "loop_lag_ms": round(self.lag_ms, 1),
+            "bytes_per_sec": round(self.bytes_per_sec),
+        }
+
+
+# Shared by every websocket endpoint in this process
+admission = AdmissionController.from_settings()
@@ -0,0 +1,61 @@
+import struct
+from typing import Dict, Iterable, Set
+
+# KiteTicker binary frames are big-endian:
+#   [2 bytes: packet count] then per packet [2 bytes: length][packet bytes]
+# and every quote packet starts with the 4 byte instrument token.
+_SHORT = struct.Struct(">H")
+_TOKEN = struct.Struct(">I")
+
+# Websocket clients offering this subprotocol get these frames as they came from Kite
+SUBPROTOCOL = "kite.raw.v1"
+
+
+def split_frame(payload: bytes) -> Dict[int, memoryview]:
+    """Slice a raw KiteTicker frame into per-token packet segments.
+
+    Each segment is a memoryview over the original payload that includes the
+    2 byte length prefix, so segments can be re-joined into a valid frame
+    without decoding or copying the packets themselves.
+    """
+    view = memoryview(payload)
+    if len(view) < 2:
+        return {}
+
+    (count,) = _SHORT.unpack_from(view, 0)
+    packets: Dict[int, memoryview] = {}
+    offset = 2
+    for _ in range(count):
+        if offset + 2 > len(view):
+            break
+        (length,) = _SHORT.unpack_from(view, offset)
+        end = offset + 2 + length
+        if end > len(view):
+            break
+        if length >= _TOKEN.size:
+            (token,) = _TOKEN.unpack_from(view, offset + 2)
+            packets[token] = view[offset:end]
+        offset = end
+    return packets
+
+
+def build_frame(segments: Iterable[memoryview]) -> bytes:
+    """Re-assemble packet segments into a KiteTicker compatible frame"""
+    segments = list(segments)
+    return _SHORT.pack(len(segments)) + b"".join(segments)
+
+
+def frame_for_client(payload: bytes, packets: Dict[int, memoryview], tokens: Set[int]) -> bytes:
+    """Return the frame a client should receive, or empty bytes if nothing matches.
+
+    When the client is subscribed to every token in the frame the original
+    payload is forwarded untouched.
+    """
+    if not packets or not tokens:
+        return b""
+    if tokens.issuperset(packets.keys()):
+        return payload
+    segments = [segment for token, segment in packets.items() if token in tokens]
+    if not segments:
+        return b""
+    return build_frame(segments)
@@ -0,0 +1,163 @@
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+import asyncio
+import logging
+from app.core.conflation import TickConflator
+
+logger = logging.getLogger(__name__)
+
+# Slow client policies
+CONFLATE = "conflate"  # latest message per key; when full, evict the longest pending one
+DROP_OLDEST = "drop_oldest"  # plain FIFO, every message kept in order; when full, evict the oldest
+DISCONNECT = "disconnect"  # latest message per key; when full, give up on the client
+POLICIES = (CONFLATE, DROP_OLDEST, DISCONNECT)
+
+
+class ClientSender:
+    """Bounded outbound queue and writer task for one websocket client.
+
+    Fan-out only enqueues, so a slow client fills its own queue instead of
+    delaying everybody else. Messages offered with a key conflate, only
+    the latest one per key is kept, unless the policy is ``drop_oldest``,
+    which queues every message in order. Once ``maxsize`` messages are
+    pending the policy evicts the oldest one, or disconnects. With a ``flush_interval`` the writer sends at most
+    ``max_per_flush`` messages per interval, otherwise it sends as soon as
+    messages arrive. ``batch`` can turn each drained batch into fewer
+    messages, e.g. several binary records into one frame.
+
+    Messages may carry the stream ``position`` (sequence) they are at.
+    Conflation and the flush budget deliver them out of order, so the
+    highest position a client has seen is no safe place to resume from.
+    With ``mark``, each flush ends with ``mark(position)``, announcing the
+    contiguous low-watermark instead: everything up to it was delivered or
+    superseded by a delivered update of the same key. An evicted message
+    pins the watermark below it for good, so a client resuming after a
+    lossy stretch gets its update replayed, or a snapshot.
+    """
+
+    def __init__(
+        self,
+        client_id: str,
+        send: Callable[[Any], Awaitable[None]],
+        policy: str = CONFLATE,
+        maxsize: int = 1000,
+        flush_interval: float = 0.0,
+        max_per_flush: Optional[int] = None,
+        on_close: Optional[Callable[[str], Any]] = None,
+        batch: Optional[Callable[[List[Any]], List[Any]]] = None,
+        mark: Optional[Callable[[int], Any]] = None,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown slow client policy: {policy}")
+        self.client_id = client_id
+        self.send = send
+        self.policy = policy
+        self.maxsize = maxsize
+        self.flush_interval = flush_interval
+        self.on_close = on_close  # called when the sender gives up on the client
+        self.batch = batch
+        self._conflator = TickConflator(max_per_flush)
+        self.mark = mark
+        self._positions: Dict[Hashable, int] = {}  # pending key: position of its latest message
+        self._offered = 0  # highest position offered
+        self._floor: Optional[int] = None  # watermark cap left by evicted messages
+        self.position = 0  # last watermark marked
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.closed = False
+        self.sent = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+    @property
+    def max_per_flush(self) -> Optional[int]:
+        return self._conflator.max_per_flush
+
+    @max_per_flush.setter
+    def max_per_flush(self, value: Optional[int]):
+        self._conflator.max_per_flush = value
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def __len__(self) -> int:
+        return len(self._conflator)
+
+    def offer(self, message: Any, key: Optional[Hashable] = None, position: Optional[int] = None) -> bool:
+        """Queue a message without waiting; returns False if it was not accepted"""
+        if self.closed:
+            return False
+        # Messages without a key never conflate with each other, and under drop_oldest none do
+        if key is None or self.policy == DROP_OLDEST:
+            key = object()
+        if len(self) >= self.maxsize and key not in self._conflator:
+            self.dropped += 1
+            if self.policy == DISCONNECT:
+                self.closed = True
+                logger.warning(f"Client {self.client_id} send queue full, disconnecting")
+                if self.on_close:
+                    self.on_close(self.client_id)
+                return False
+            evicted = self._conflator.evict_oldest()
+            lost = self._positions.pop(evicted, None)
+            if lost is not None:
+                self._floor = lost - 1 if self._floor is None else min(self._floor, lost - 1)
+        self._conflator.offer(key, message)
+        if position is not None:
+            # A replaced message is superseded by this one, so the key now stands at this position
+            self._positions[key] = position
+            self._offered = max(self._offered, position)
+        self.max_depth = max(self.max_depth, len(self))
+        self._wakeup.set()
+        return True
+
+    def _take(self):
+        messages = self._conflator.drain()
+        if self.mark is not None and messages:
+            if self._positions:
+                self._positions = {key: pos for key, pos in self._positions.items() if key in self._conflator}
+            watermark = min(self._positions.values()) - 1 if self._positions else self._offered
+            if self._floor is not None:
+                watermark = min(watermark, self._floor)
+            if watermark > self.position:
+                self.position = watermark
+                messages.append(self.mark(watermark))
+        return messages
+
+    async def _run(self):
+        try:
+            while not self.closed:
+                if self.flush_interval:
+                    await asyncio.sleep(self.flush_interval)
+                else:
+                    await self._wakeup.wait()
+                self._wakeup.clear()
+                messages = self._take()
+                if self.batch is not None and messages:
+                    messages = self.batch(messages)
+                for message in messages:
+                    await self.send(message)
+                    self.sent += 1
+                if len(self):
+                    self._wakeup.set()  # flush budget left some behind
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"Error sending to client {self.client_id}: {e}")
+            self.closed = True
+            if self.on_close:
+                self.on_close(self.client_id)
+
+    def close(self):
+        self.closed = True
+        if self._task and self._task is not asyncio.current_task():
+            self._task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "policy": self.policy,
+            "depth": len(self),
+            "max_depth": self.max_depth,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "conflated": self._conflator.conflated,
+        }
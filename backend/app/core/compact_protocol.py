@@ -0,0 +1,120 @@
+import struct
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+# Compact binary protocol, negotiated with ``Sec-WebSocket-Protocol: kc.bin.v1``.
+# Clients that do not ask for it keep getting JSON text frames.
+#
+# Binary frames are little-endian:
+#   header  [u8 version][u8 kind][u8 price decimals][pad][u32 record count]
+#   record  [u32 token][i32 price][u32 last qty][u64 volume][u32 oi][i64 epoch ms]
+# Prices are integers scaled by 10 ** price decimals. Fields a tick does not
+# carry (e.g. volume in ltp mode) are 0. Control messages (subscribe acks,
+# errors, the initial option chain) stay JSON text frames.
+SUBPROTOCOL = "kc.bin.v1"
+VERSION = 1
+KIND_TICKS = 1
+PRICE_DECIMALS = 2
+PRICE_SCALE = 10 ** PRICE_DECIMALS
+
+HEADER = struct.Struct("<BBBxI")
+RECORD = struct.Struct("<IiIQIq")
+
+_U32 = 0xFFFFFFFF
+
+
+def negotiate(websocket) -> Optional[str]:
+    """Subprotocol to accept the websocket with, None for the JSON default"""
+    offered = websocket.scope.get("subprotocols") or ()
+    return SUBPROTOCOL if SUBPROTOCOL in offered else None
+
+
+# (timestamp, epoch ms) of the last conversion, one tuple so threads never see half an update
+_last_epoch: Tuple[Any, int] = (None, 0)
+
+
+def _epoch_ms(timestamp: Any) -> int:
+    global _last_epoch
+    # Ticks in one burst mostly share an exchange timestamp, remember the last one
+    last_timestamp, epoch_ms = _last_epoch
+    if timestamp == last_timestamp:
+        return epoch_ms
+    value = timestamp
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if isinstance(value, datetime):
+        epoch_ms = int(value.timestamp() * 1000)
+    else:
+        epoch_ms = int((value or 0) * 1000)
+    _last_epoch = (timestamp, epoch_ms)
+    return epoch_ms
+
+
+def pack_tick(tick: Dict[str, Any]) -> bytes:
+    """One record from a processed or raw KiteTicker tick dict"""
+    get = tick.get
+    quantity = get("last_quantity") or get("last_traded_quantity") or 0
+    oi = get("oi") or 0
+    return RECORD.pack(
+        tick["instrument_token"],
+        round((get("last_price") or 0) * PRICE_SCALE),
+        quantity if quantity <= _U32 else _U32,
+        get("volume") or get("volume_traded") or 0,
+        oi if oi <= _U32 else _U32,
+        _epoch_ms(get("exchange_timestamp") or get("timestamp")),
+    )
+
+
+def pack_record(record) -> bytes:
+    """One record from a ``TickRecord``"""
+    return RECORD.pack(
+        record.instrument_token,
+        round(record.last_price * PRICE_SCALE),
+        min(record.last_quantity or 0, _U32),
+        record.volume or 0,
+        min(record.oi or 0, _U32),
+        _epoch_ms(record.exchange_timestamp or record.timestamp),
+    )
+
+
+def encode_frame(records: List[bytes]) -> bytes:
+    """Join packed records into one binary frame"""
+    return HEADER.pack(VERSION, KIND_TICKS, PRICE_DECIMALS, len(records)) + b"".join(records)
+
+
+def batch_frames(messages: List[Any]) -> List[Any]:
+    """Coalesce runs of packed records into frames, leaving text messages in place"""
+    batched: List[Any] = []
+    records: List[bytes] = []
+    for message in messages:
+        if isinstance(message, bytes):
+            records.append(message)
+            continue
+        if records:
+            batched.append(encode_frame(records))
+            records = []
+        batched.append(message)
+    if records:
+        batched.append(encode_frame(records))
+    return batched
+
+
+def decode_frame(frame: bytes) -> List[Dict[str, Any]]:
+    """Reference decoder, mirrors what a client does with a binary frame"""
+    version, kind, decimals, count = HEADER.unpack_from(frame, 0)
+    if version != VERSION or kind != KIND_TICKS:
+        raise ValueError(f"Unsupported frame version {version} kind {kind}")
+    scale = 10 ** decimals
+    ticks = []
+    for token, price, quantity, volume, oi, epoch_ms in RECORD.iter_unpack(
+        memoryview(frame)[HEADER.size:HEADER.size + count * RECORD.size]
+    ):
+        ticks.append({
+            "instrument_token": token,
+            "last_price": price / scale,
+            "last_quantity": quantity,
+            "volume": volume,
+            "oi": oi,
+            "timestamp": epoch_ms,
+        })
+    return ticks
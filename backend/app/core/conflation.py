@@ -0,0 +1,61 @@
+from typing import Any, Dict, List, Optional
+
+
+class TickConflator:
+    """Keep only the latest update per instrument token between flushes.
+
+    Tokens are drained in the order they first became pending, so when a
+    flush budget is set the tokens held back are the most recently updated
+    ones and they go out first on the next flush.
+    """
+
+    def __init__(self, max_per_flush: Optional[int] = None):
+        self._pending: Dict[int, Any] = {}
+        self.max_per_flush = max_per_flush
+        self.received = 0
+        self.conflated = 0
+        self.flushed = 0
+
+    def offer(self, instrument_token: int, update: Any) -> None:
+        """Record an update, replacing any unsent update for the same token"""
+        self.received += 1
+        if instrument_token in self._pending:
+            self.conflated += 1
+        self._pending[instrument_token] = update
+
+    def drain(self) -> List[Any]:
+        """Return pending updates and clear them, honouring the flush budget"""
+        if not self._pending:
+            return []
+
+        if self.max_per_flush is None or len(self._pending) <= self.max_per_flush:
+            updates = list(self._pending.values())
+            self._pending.clear()
+        else:
+            tokens = list(self._pending)[:self.max_per_flush]
+            updates = [self._pending.pop(token) for token in tokens]
+
+        self.flushed += len(updates)
+        return updates
+
+    def evict_oldest(self) -> Optional[Any]:
+        """Drop the update that has been pending longest; returns its key, None if nothing was pending"""
+        if not self._pending:
+            return None
+        key = next(iter(self._pending))
+        del self._pending[key]
+        return key
+
+    def __contains__(self, instrument_token) -> bool:
+        return instrument_token in self._pending
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "received": self.received,
+            "conflated": self.conflated,
+            "flushed": self.flushed,
+            "pending": len(self._pending),
+        }
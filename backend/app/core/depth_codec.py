@@ -0,0 +1,37 @@
+"""Market depth in the columnar storage layout and back.
+
+With ``DEPTH_STORAGE=columnar`` a depth snapshot is stored as six parallel
+arrays, price (``real[]``), quantity and orders (``int[]``) for each side,
+one element per level, instead of two JSONB lists of objects. Level ``i``
+of a side is ``(price[i], quantity[i], orders[i])``; Kite sends at most
+``DEPTH_LEVELS`` levels.
+"""
+from typing import Any, Dict, List, Sequence, Tuple
+from app.core.tick_record import DepthLevel
+
+DEPTH_LEVELS = 5
+PRICE_DECIMALS = 2  # real keeps ~7 significant digits; prices are rounded back to paise on decode
+
+# (prices, quantities, orders)
+DepthColumns = Tuple[Sequence[float], Sequence[int], Sequence[int]]
+_EMPTY: DepthColumns = ((), (), ())
+
+
+def to_columns(levels: Sequence[DepthLevel]) -> DepthColumns:
+    if not levels:
+        return _EMPTY
+    # Transposing the level tuples is a single C-level pass; asyncpg takes tuples as arrays
+    return tuple(zip(*levels[:DEPTH_LEVELS]))
+
+
+def from_columns(prices: Sequence[float], quantities: Sequence[int], orders: Sequence[int]) -> List[Dict[str, Any]]:
+    """One side in the ``MarketDepth`` schema shape"""
+    return [
+        {"price": round(price, PRICE_DECIMALS), "quantity": quantity, "orders": count}
+        for price, quantity, count in zip(prices or (), quantities or (), orders or ())
+    ]
+
+
+def levels_to_dicts(levels: Sequence[DepthLevel]) -> List[Dict[str, Any]]:
+    """One side as the JSONB storage layout, the ``MarketDepth`` schema shape"""
+    return [{"price": price, "quantity": quantity, "orders": count} for price, quantity, count in levels]
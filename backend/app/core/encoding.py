@@ -0,0 +1,78 @@
+from typing import Any, Callable, Dict, Hashable, List, Optional, Union
+from datetime import date, datetime
+import json
+
+try:
+    import orjson
+except ImportError:  # optional, the stdlib encoder is the fallback
+    orjson = None
+
+Encoded = Union[str, bytes]
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj: Any) -> str:
+    """Compact JSON text, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default).decode()
+    return json.dumps(obj, default=_default, separators=(",", ":"))
+
+
+class EncodingCache:
+    """Encoded form of one outbound message per protocol variant.
+
+    Build one cache per message (or batch) being fanned out and ask it for
+    the variant each recipient needs, e.g. ``("json", MODE_LTP)``. Each
+    variant is encoded once however many clients receive it, and the same
+    str/bytes object is handed to every send.
+    """
+
+    __slots__ = ("_encoded", "encodes", "hits")
+
+    def __init__(self):
+        self._encoded: Dict[Hashable, Encoded] = {}
+        self.encodes = 0
+        self.hits = 0
+
+    def get(self, variant: Hashable, build: Callable[[], Any],
+            encode: Callable[[Any], Encoded] = dumps) -> Encoded:
+        encoded = self._encoded.get(variant)
+        if encoded is None:
+            encoded = self._encoded[variant] = encode(build())
+            self.encodes += 1
+        else:
+            self.hits += 1
+        return encoded
+
+
+def batch_json(messages: List[Any]) -> List[Any]:
+    """Coalesce runs of encoded JSON texts into one JSON array text each.
+
+    The texts are joined as they are, nothing is re-encoded. A run of one
+    message is sent unchanged, and bytes messages are left in place.
+    """
+    batched: List[Any] = []
+    texts: List[str] = []
+    for message in messages:
+        if isinstance(message, str):
+            texts.append(message)
+            continue
+        if texts:
+            batched.append(texts[0] if len(texts) == 1 else "[" + ",".join(texts) + "]")
+            texts = []
+        batched.append(message)
+    if texts:
+        batched.append(texts[0] if len(texts) == 1 else "[" + ",".join(texts) + "]")
+    return batched
+
+
+def sse_event(event: str, data: str, event_id: Optional[str] = None) -> str:
+    """One Server-Sent Event; ``data`` must be single-line, e.g. compact JSON"""
+    if event_id is None:
+        return f"event: {event}\ndata: {data}\n\n"
+    return f"id: {event_id}\nevent: {event}\ndata: {data}\n\n"
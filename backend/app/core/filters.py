@@ -0,0 +1,125 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Fields a subscription can ask for, in our processed tick format
+FIELDS = frozenset({
+    "instrument_token", "last_price", "timestamp", "last_quantity", "average_price", "volume",
+    "buy_quantity", "sell_quantity", "ohlc", "depth", "change", "oi",
+})
+FIELD_ALIASES = {"ltp": "last_price"}
+
+# (payload, projected values, last sent (price, values, at), now) -> send?
+Predicate = Callable[[Dict[str, Any], Tuple[Any, ...], Tuple[float, Tuple[Any, ...], float], float], bool]
+
+
+def _threshold(name: str, value: Any) -> Optional[float]:
+    """A threshold from a subscribe message as a positive float, None if not given"""
+    if value is None:
+        return None
+    try:
+        # bool is an int, but "min_change": true is no threshold
+        if isinstance(value, bool):
+            raise TypeError
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a number, got {value!r}")
+    if not value > 0:
+        raise ValueError(f"{name} must be positive, got {value}")
+    return value
+
+
+class SubscriptionFilter:
+    """Field projection and change thresholds for one subscription.
+
+    Built once from the subscribe message; only the checks that were asked
+    for are compiled into the predicate list, and every one of them has to
+    pass for an update to be sent. Thresholds compare against the last
+    update actually sent for the token, so a slow drift still goes out once
+    it adds up. With a field list, updates where none of those fields
+    changed are dropped as well.
+    """
+
+    __slots__ = ("fields", "min_change", "min_change_pct", "min_interval", "_predicates", "_last", "suppressed")
+
+    def __init__(
+        self,
+        fields: Optional[List[str]] = None,
+        min_change: Optional[float] = None,
+        min_change_pct: Optional[float] = None,
+        min_interval_ms: Optional[float] = None,
+    ):
+        if fields is not None:
+            if not isinstance(fields, (list, tuple)) or not all(isinstance(field, str) for field in fields):
+                raise ValueError("fields must be a list of field names")
+            fields = [FIELD_ALIASES.get(field, field) for field in fields]
+            unknown = set(fields) - FIELDS
+            if unknown:
+                raise ValueError(f"Unknown fields: {sorted(unknown)}")
+            # The token always goes out so clients know what the update is for
+            fields = tuple(dict.fromkeys(["instrument_token"] + fields))
+        self.fields: Optional[Tuple[str, ...]] = fields
+        # Checked here, a bad value would otherwise fail inside the shared fan-out callback
+        self.min_change = _threshold("min_change", min_change)
+        self.min_change_pct = _threshold("min_change_pct", min_change_pct)
+        min_interval_ms = _threshold("min_interval_ms", min_interval_ms)
+        self.min_interval = min_interval_ms / 1000 if min_interval_ms else None
+        self._predicates: List[Predicate] = []
+        if self.min_interval:
+            self._predicates.append(self._interval_elapsed)
+        if self.min_change:
+            self._predicates.append(self._moved)
+        if self.min_change_pct:
+            self._predicates.append(self._moved_pct)
+        if fields is not None:
+            self._predicates.append(self._changed)
+        self._last: Dict[int, Tuple[float, Tuple[Any, ...], float]] = {}  # token: (price, values, sent at)
+        self.suppressed = 0
+
+    @classmethod
+    def from_message(cls, data: Dict[str, Any]) -> Optional["SubscriptionFilter"]:
+        """Filter described by a subscribe message, None if it asks for none"""
+        filters = data.get("filters") or {}
+        if not isinstance(filters, dict):
+            raise ValueError("filters must be an object")
+        subscription = cls(
+            fields=data.get("fields"),
+            min_change=filters.get("min_change"),
+            min_change_pct=filters.get("min_change_pct"),
+            min_interval_ms=filters.get("min_interval_ms"),
+        )
+        return subscription if subscription.fields is not None or subscription._predicates else None
+
+    def _values(self, payload: Dict[str, Any]) -> Tuple[Any, ...]:
+        if self.fields is None:
+            return ()
+        return tuple(payload.get(field) for field in self.fields if field != "timestamp")
+
+    def _interval_elapsed(self, payload, values, last, now) -> bool:
+        return now - last[2] >= self.min_interval
+
+    def _moved(self, payload, values, last, now) -> bool:
+        return abs((payload.get("last_price") or 0) - last[0]) >= self.min_change
+
+    def _moved_pct(self, payload, values, last, now) -> bool:
+        if not last[0]:
+            return True
+        return abs((payload.get("last_price") or 0) - last[0]) * 100 / last[0] >= self.min_change_pct
+
+    def _changed(self, payload, values, last, now) -> bool:
+        return values != last[1]
+
+    def accept(self, instrument_token: int, payload: Dict[str, Any], now: float) -> bool:
+        """Whether this update should be sent; remembers it as the last one sent if so"""
+        values = self._values(payload)
+        last = self._last.get(instrument_token)
+        if last is not None:
+            for predicate in self._predicates:
+                if not predicate(payload, values, last, now):
+                    self.suppressed += 1
+                    return False
+        self._last[instrument_token] = (payload.get("last_price") or 0, values, now)
+        return True
+
+    def project(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        if self.fields is None:
+            return payload
+        return {field: payload[field] for field in self.fields if field in payload}
@@ -0,0 +1,164 @@
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from datetime import datetime
+from zoneinfo import ZoneInfo
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+IST = ZoneInfo("Asia/Kolkata")  # Kite's exchange timestamps are naive exchange time
+
+
+def exchange_time(timestamp: datetime) -> datetime:
+    """An exchange timestamp as an aware Asia/Kolkata datetime, whatever the host's zone"""
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=IST)
+    return timestamp.astimezone(IST)
+
+
+class Gap:
+    """A stretch of time in which ticks for a token were missed"""
+
+    __slots__ = ("instrument_token", "start_time", "end_time", "missed_volume", "reason")
+
+    def __init__(self, instrument_token: int, start_time: datetime, end_time: datetime,
+                 missed_volume: Optional[int], reason: str):
+        self.instrument_token = instrument_token
+        self.start_time = start_time
+        self.end_time = end_time
+        self.missed_volume = missed_volume
+        self.reason = reason  # "disconnect" or "stall"
+
+    def __repr__(self) -> str:
+        return (f"Gap({self.instrument_token}, {self.start_time} -> {self.end_time}, "
+                f"missed_volume={self.missed_volume}, reason={self.reason})")
+
+
+class _TokenState:
+    __slots__ = ("exchange_ts", "volume", "seen_at", "disconnected", "stalled")
+
+    def __init__(self):
+        self.exchange_ts: Optional[datetime] = None
+        self.volume: Optional[int] = None
+        self.seen_at = 0.0
+        self.disconnected = False
+        self.stalled = False  # reported by check_stalls, until its next tick
+
+
+class GapDetector:
+    """Detects missed ticks from per-token exchange timestamps and volume.
+
+    Kite ticks carry no sequence number, but cumulative day volume works as
+    one: if a tick's volume exceeds the previous volume plus its own
+    last traded quantity, trades were missed in between. A gap is reported
+    when that happens across at least ``min_gap_seconds`` of exchange time
+    (a stall), or when a token resumes after its connection dropped, since
+    LTP mode ticks carry no volume to compare. Gap bounds are aware
+    Asia/Kolkata datetimes. A token that goes silent
+    is only noticed by ``check_stalls``, which the owner runs on a timer.
+    """
+
+    def __init__(self, on_gap: Callable[[Gap], None], min_gap_seconds: float = 5.0):
+        self.on_gap = on_gap
+        self.min_gap_seconds = min_gap_seconds
+        self._tokens: Dict[int, _TokenState] = {}
+        self._lock = threading.Lock()  # ticks arrive on every shard thread
+        self.gaps = 0
+
+    def observe(self, ticks: Iterable[Dict[str, Any]]):
+        """Check a batch of KiteTicker ticks against the previous tick per token"""
+        found: List[Gap] = []
+        now = time.monotonic()
+        with self._lock:
+            for tick in ticks:
+                exchange_ts = tick.get("exchange_timestamp") or tick.get("last_trade_time")
+                if not isinstance(exchange_ts, datetime):
+                    continue
+                exchange_ts = exchange_time(exchange_ts)
+                token = tick["instrument_token"]
+                state = self._tokens.get(token)
+                if state is None:
+                    state = self._tokens[token] = _TokenState()
+                gap = self._check(token, state, exchange_ts, tick.get("volume_traded"),
+                                  tick.get("last_traded_quantity") or 0)
+                if gap:
+                    found.append(gap)
+                if state.exchange_ts is None or exchange_ts >= state.exchange_ts:
+                    state.exchange_ts = exchange_ts
+                    state.volume = tick.get("volume_traded", state.volume)
+                state.seen_at = now
+                state.disconnected = False
+                state.stalled = False
+
+        self._report(found)
+
+    def _report(self, found: List[Gap]):
+        for gap in found:
+            self.gaps += 1
+            logger.warning(f"Data gap detected: {gap}")
+            try:
+                self.on_gap(gap)
+            except Exception as e:
+                logger.error(f"Error handling data gap: {e}")
+
+    def _check(self, token: int, state: _TokenState, exchange_ts: datetime,
+               volume: Optional[int], last_quantity: int) -> Optional[Gap]:
+        if state.exchange_ts is None:
+            return None
+        elapsed = (exchange_ts - state.exchange_ts).total_seconds()
+        if elapsed < self.min_gap_seconds:
+            return None
+
+        missed_volume = None
+        if volume is not None and state.volume is not None and volume >= state.volume:
+            missed_volume = volume - state.volume - last_quantity
+
+        if state.disconnected:
+            return Gap(token, state.exchange_ts, exchange_ts, missed_volume, "disconnect")
+        if missed_volume and missed_volume > 0:
+            return Gap(token, state.exchange_ts, exchange_ts, missed_volume, "stall")
+        return None
+
+    def disconnected(self, tokens: Iterable[int]):
+        """Flag tokens whose connection dropped; their next tick closes a gap"""
+        with self._lock:
+            for token in tokens:
+                state = self._tokens.get(token)
+                if state is not None:
+                    state.disconnected = True
+
+    def forget(self, tokens: Iterable[int]):
+        """Stop tracking unsubscribed tokens"""
+        with self._lock:
+            for token in tokens:
+                self._tokens.pop(token, None)
+
+    def stalled(self, seconds: float) -> List[int]:
+        """Tokens with no tick for at least ``seconds`` of wall time"""
+        cutoff = time.monotonic() - seconds
+        with self._lock:
+            return [token for token, state in self._tokens.items() if state.seen_at < cutoff]
+
+    def check_stalls(self, seconds: float) -> List[Gap]:
+        """Report a gap for every token silent for ``seconds``, once per silence
+
+        The gap runs from the token's last exchange timestamp to now. The
+        token's baseline moves to now as well, so when it ticks again the
+        volume check covers only the stretch after this gap.
+        """
+        cutoff = time.monotonic() - seconds
+        # Exchange time, not the host's clock, which may well run in UTC
+        end = datetime.now(IST)
+        found: List[Gap] = []
+        with self._lock:
+            for token, state in self._tokens.items():
+                if state.stalled or state.seen_at >= cutoff or state.exchange_ts is None:
+                    continue
+                if end <= state.exchange_ts:
+                    continue
+                found.append(Gap(token, state.exchange_ts, end, None, "stall"))
+                state.exchange_ts = end
+                state.stalled = True
+        self._report(found)
+        return found
@@ -0,0 +1,88 @@
+from collections import deque
+from itertools import islice
+from typing import Any, Deque, Dict, Hashable, List, Optional, Tuple
+import time
+
+
+class SequenceBuffer:
+    """The last ``capacity`` deltas of one topic, numbered by a sequence"""
+
+    def __init__(self, capacity: int, seq: int = 0):
+        self.seq = seq
+        self._deltas: Deque[Tuple[int, Any]] = deque(maxlen=capacity)
+
+    def append(self, delta: Any) -> int:
+        self.seq += 1
+        self._deltas.append((self.seq, delta))
+        return self.seq
+
+    def reset(self):
+        """Forget buffered deltas; the sequence skips one so no earlier position can resume"""
+        self.seq += 1
+        self._deltas.clear()
+
+    def since(self, last_seq: int) -> Optional[List[Tuple[int, Any]]]:
+        """Deltas after ``last_seq``, or None if some of them are no longer buffered"""
+        if last_seq > self.seq:
+            return None
+        oldest = self._deltas[0][0] if self._deltas else self.seq + 1
+        if last_seq + 1 < oldest:
+            return None
+        return list(islice(self._deltas, last_seq + 1 - oldest, None))
+
+
+class TopicBuffers:
+    """Sequenced delta buffers per topic, so reconnecting clients can resume.
+
+    ``epoch`` changes every time the process starts; a client resuming
+    against another epoch (a restart, or a different worker) missed
+    deltas nobody kept and needs a fresh snapshot. A dropped topic's
+    buffer is deleted; if the topic comes back its sequence carries on
+    above every position the old buffer handed out, so none can resume.
+    """
+
+    def __init__(self, capacity: int = 5000):
+        self.capacity = capacity
+        self.epoch = time.time_ns() // 1000000
+        self._buffers: Dict[Hashable, SequenceBuffer] = {}
+        self._floor = 0  # sequence new buffers start from
+        self.resumed = 0
+        self.snapshots = 0
+
+    def get(self, topic: Hashable) -> SequenceBuffer:
+        buffer = self._buffers.get(topic)
+        if buffer is None:
+            buffer = self._buffers[topic] = SequenceBuffer(self.capacity, self._floor)
+        return buffer
+
+    def append(self, topic: Hashable, delta: Any) -> int:
+        return self.get(topic).append(delta)
+
+    def drop(self, topic: Hashable):
+        """Delete a topic's buffer once nobody watches the topic"""
+        buffer = self._buffers.pop(topic, None)
+        if buffer is not None:
+            self._floor = max(self._floor, buffer.seq + 1)
+
+    def seq(self, topic: Hashable) -> int:
+        return self.get(topic).seq
+
+    def resume(self, topic: Hashable, epoch: Optional[int], last_seq: Optional[int]) -> Optional[List[Tuple[int, Any]]]:
+        """Missed deltas for a reconnecting client, or None when it needs a snapshot"""
+        deltas = None
+        buffer = self._buffers.get(topic)
+        if epoch == self.epoch and last_seq is not None and buffer is not None:
+            deltas = buffer.since(last_seq)
+        if deltas is None:
+            self.snapshots += 1
+        else:
+            self.resumed += 1
+        return deltas
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "epoch": self.epoch,
+            "topics": len(self._buffers),
+            "resumed": self.resumed,
+            "snapshots": self.snapshots,
+        }
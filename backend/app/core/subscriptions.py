@@ -0,0 +1,269 @@
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Subscription modes, ordered by how much data Kite sends per tick
+MODE_LTP = 1
+MODE_QUOTE = 2
+MODE_FULL = 3
+
+# KiteTicker mode names
+MODE_NAMES = {MODE_LTP: "ltp", MODE_QUOTE: "quote", MODE_FULL: "full"}
+
+# Fields each mode carries, in our processed tick format and as raw KiteTicker ticks name them
+MODE_FIELDS = {
+    MODE_LTP: frozenset({"instrument_token", "last_price", "timestamp", "mode", "tradable"}),
+    MODE_QUOTE: frozenset({
+        "instrument_token", "last_price", "timestamp", "last_quantity", "average_price",
+        "volume", "buy_quantity", "sell_quantity", "ohlc", "change",
+        "mode", "tradable", "last_traded_quantity", "average_traded_price", "volume_traded",
+        "total_buy_quantity", "total_sell_quantity",
+    }),
+}
+
+
+def parse_mode(mode: Any) -> int:
+    """Accept 1/2/3 or ltp/quote/full"""
+    if isinstance(mode, str):
+        for value, name in MODE_NAMES.items():
+            if name == mode.lower():
+                return value
+        mode = int(mode)
+    if mode not in MODE_NAMES:
+        raise ValueError(f"Invalid subscription mode: {mode}")
+    return mode
+
+
+def project(data: Dict[str, Any], mode: int) -> Dict[str, Any]:
+    """Strip fields that the requested mode does not carry"""
+    fields = MODE_FIELDS.get(mode)
+    if fields is None:
+        return data
+    return {key: value for key, value in data.items() if key in fields}
+
+
+class SubscriptionRegistry:
+    """Reference-counted registry of client subscriptions.
+
+    Keeps token -> client ids and client id -> tokens indexes so adding or
+    removing a subscription costs O(changed tokens). Only tokens whose
+    reference count crosses 0 <-> 1 are sent upstream, and bursts of changes
+    are debounced into one batch. A token that is dropped and re-added inside
+    the debounce window never reaches upstream.
+
+    Every client subscribes a token in a mode; upstream runs at the highest
+    mode any client asked for and is downgraded when the last client needing
+    that mode leaves. A batch upstream refuses (a full ticker pool, a ticker
+    that is down) stays pending and is retried after ``retry_interval``.
+    """
+
+    def __init__(
+        self,
+        on_subscribe: Callable[[List[int], int], None],
+        on_unsubscribe: Callable[[List[int]], None],
+        on_mode: Optional[Callable[[List[int], int], None]] = None,
+        debounce: float = 0.05,
+        retry_interval: float = 1.0,
+    ):
+        self.on_subscribe = on_subscribe
+        self.on_unsubscribe = on_unsubscribe
+        self.on_mode = on_mode
+        self.debounce = debounce
+        self.retry_interval = retry_interval
+        self.token_clients: Dict[int, Set[str]] = {}
+        self.client_tokens: Dict[str, Set[int]] = {}
+        self.client_modes: Dict[str, Dict[int, int]] = {}  # client: {token: mode}
+        self.upstream_modes: Dict[int, int] = {}  # token: mode sent upstream
+        self._mode_counts: Dict[int, List[int]] = {}  # token: clients per mode
+        self._pending_subscribe: Set[int] = set()
+        self._pending_unsubscribe: Set[int] = set()
+        self._pending_modes: Set[int] = set()
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+    def add_client(self, client_id: str):
+        self.client_tokens.setdefault(client_id, set())
+        self.client_modes.setdefault(client_id, {})
+
+    def remove_client(self, client_id: str):
+        """Drop every subscription held by a client"""
+        tokens = self.client_tokens.get(client_id)
+        if tokens:
+            self.remove(client_id, list(tokens))
+        self.client_tokens.pop(client_id, None)
+        self.client_modes.pop(client_id, None)
+
+    def _wanted_mode(self, token: int) -> int:
+        counts = self._mode_counts[token]
+        for mode in (MODE_FULL, MODE_QUOTE, MODE_LTP):
+            if counts[mode]:
+                return mode
+        return 0
+
+    def add(self, client_id: str, tokens: Iterable[int], mode: int = MODE_FULL) -> List[int]:
+        """Subscribe a client to tokens in a mode, returning the tokens that changed for it"""
+        self.add_client(client_id)
+        client_tokens = self.client_tokens[client_id]
+        client_modes = self.client_modes[client_id]
+        changed = []
+        for token in tokens:
+            current = client_modes.get(token)
+            if current == mode:
+                continue
+            changed.append(token)
+            counts = self._mode_counts.setdefault(token, [0, 0, 0, 0])
+            if current is not None:
+                counts[current] -= 1
+            counts[mode] += 1
+            client_modes[token] = mode
+            if current is not None:
+                self._mode_changed(token)
+                continue
+
+            client_tokens.add(token)
+            clients = self.token_clients.setdefault(token, set())
+            clients.add(client_id)
+            if len(clients) == 1:
+                if token in self._pending_unsubscribe:
+                    self._pending_unsubscribe.discard(token)
+                    self._mode_changed(token)
+                else:
+                    self._pending_subscribe.add(token)
+            else:
+                self._mode_changed(token)
+        self._schedule_flush()
+        return changed
+
+    def remove(self, client_id: str, tokens: Iterable[int]) -> List[int]:
+        """Unsubscribe a client from tokens, returning the tokens it actually held"""
+        client_tokens = self.client_tokens.get(client_id)
+        if not client_tokens:
+            return []
+        client_modes = self.client_modes[client_id]
+        removed = []
+        for token in tokens:
+            if token not in client_tokens:
+                continue
+            client_tokens.discard(token)
+            self._mode_counts[token][client_modes.pop(token)] -= 1
+            removed.append(token)
+            clients = self.token_clients.get(token)
+            if clients is None:
+                continue
+            clients.discard(client_id)
+            if not clients:
+                del self.token_clients[token]
+                del self._mode_counts[token]
+                self._pending_modes.discard(token)
+                if token in self._pending_subscribe:
+                    self._pending_subscribe.discard(token)
+                else:
+                    self._pending_unsubscribe.add(token)
+            else:
+                self._mode_changed(token)
+        self._schedule_flush()
+        return removed
+
+    def _mode_changed(self, token: int):
+        """Queue an upstream mode change if the highest wanted mode moved"""
+        if token in self._pending_subscribe:
+            return
+        if self._wanted_mode(token) != self.upstream_modes.get(token):
+            self._pending_modes.add(token)
+        else:
+            self._pending_modes.discard(token)
+
+    def clients_for(self, token: int) -> Set[str]:
+        return self.token_clients.get(token, set())
+
+    def tokens_for(self, client_id: str) -> Set[int]:
+        return self.client_tokens.get(client_id, set())
+
+    def mode_for(self, client_id: str, token: int) -> Optional[int]:
+        return self.client_modes.get(client_id, {}).get(token)
+
+    @property
+    def upstream_tokens(self) -> List[int]:
+        """Tokens with at least one subscriber"""
+        return list(self.token_clients)
+
+    def _schedule_flush(self):
+        if not (self._pending_subscribe or self._pending_unsubscribe or self._pending_modes):
+            return
+        if self._flush_handle is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is None or self.debounce <= 0:
+            self.flush()
+        else:
+            self._flush_handle = loop.call_later(self.debounce, self.flush)
+
+    @staticmethod
+    def _group_by_mode(modes: Dict[int, int]) -> Dict[int, List[int]]:
+        groups: Dict[int, List[int]] = {}
+        for token, mode in modes.items():
+            groups.setdefault(mode, []).append(token)
+        return groups
+
+    def flush(self):
+        """Send pending upstream changes now"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        unsubscribe = list(self._pending_unsubscribe)
+        subscribe = {token: self._wanted_mode(token) for token in self._pending_subscribe}
+        modes = {token: self._wanted_mode(token) for token in self._pending_modes}
+        self._pending_subscribe.clear()
+        self._pending_unsubscribe.clear()
+        self._pending_modes.clear()
+
+        # upstream_modes only records batches upstream accepted; failed ones go back to pending
+        failed = False
+        if unsubscribe:
+            try:
+                self.on_unsubscribe(unsubscribe)
+                logger.debug(f"Upstream unsubscribe: {unsubscribe}")
+                for token in unsubscribe:
+                    self.upstream_modes.pop(token, None)
+            except Exception as e:
+                logger.error(f"Error unsubscribing upstream, will retry: {e}")
+                self._pending_unsubscribe.update(unsubscribe)
+                failed = True
+        for mode, tokens in self._group_by_mode(subscribe).items():
+            try:
+                self.on_subscribe(tokens, mode)
+                logger.debug(f"Upstream subscribe ({MODE_NAMES[mode]}): {tokens}")
+                self.upstream_modes.update(dict.fromkeys(tokens, mode))
+            except Exception as e:
+                logger.error(f"Error subscribing upstream, will retry: {e}")
+                self._pending_subscribe.update(tokens)
+                failed = True
+        for mode, tokens in self._group_by_mode(modes).items():
+            try:
+                if self.on_mode:
+                    self.on_mode(tokens, mode)
+                else:
+                    self.on_subscribe(tokens, mode)
+                logger.debug(f"Upstream mode change ({MODE_NAMES[mode]}): {tokens}")
+                self.upstream_modes.update(dict.fromkeys(tokens, mode))
+            except Exception as e:
+                logger.error(f"Error changing upstream mode, will retry: {e}")
+                self._pending_modes.update(tokens)
+                failed = True
+        if failed:
+            self._schedule_retry()
+
+    def _schedule_retry(self):
+        """Flush the changes upstream refused again after ``retry_interval``, if there is a loop to wait on"""
+        if self._flush_handle is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # retried with the next change
+        self._flush_handle = loop.call_later(self.retry_interval, self.flush)
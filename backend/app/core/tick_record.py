@@ -0,0 +1,199 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+# (price, quantity, orders)
+DepthLevel = Tuple[float, int, int]
+
+
+def _depth_levels(levels: Optional[List[Dict[str, Any]]]) -> Tuple[DepthLevel, ...]:
+    if not levels:
+        return ()
+    return tuple(
+        (float(level.get("price", 0.0)), int(level.get("quantity", 0)), int(level.get("orders", 0)))
+        for level in levels
+    )
+
+
+class TickRecord:
+    """Trusted in-process tick representation.
+
+    Ticks coming off KiteTicker are already parsed by kiteconnect, so inside
+    the pipeline we keep them as plain floats and ints in a slotted object
+    instead of validating every tick through pydantic. Use ``to_schema`` to
+    get a ``KiteTick`` at the API boundary.
+    """
+
+    __slots__ = (
+        "instrument_token", "mode", "tradeable", "last_price", "last_quantity",
+        "average_price", "volume", "buy_quantity", "sell_quantity",
+        "open", "high", "low", "close", "change", "oi",
+        "exchange_timestamp", "timestamp", "depth_buy", "depth_sell",
+    )
+
+    def __init__(
+        self,
+        instrument_token: int,
+        last_price: float,
+        timestamp: datetime,
+        mode: int = 1,
+        tradeable: bool = True,
+        last_quantity: Optional[int] = None,
+        average_price: Optional[float] = None,
+        volume: Optional[int] = None,
+        buy_quantity: Optional[int] = None,
+        sell_quantity: Optional[int] = None,
+        open: Optional[float] = None,
+        high: Optional[float] = None,
+        low: Optional[float] = None,
+        close: Optional[float] = None,
+        change: Optional[float] = None,
+        oi: Optional[int] = None,
+        exchange_timestamp: Optional[datetime] = None,
+        depth_buy: Tuple[DepthLevel, ...] = (),
+        depth_sell: Tuple[DepthLevel, ...] = (),
+    ):
+        self.instrument_token = instrument_token
+        self.mode = mode
+        self.tradeable = tradeable
+        self.last_price = last_price
+        self.last_quantity = last_quantity
+        self.average_price = average_price
+        self.volume = volume
+        self.buy_quantity = buy_quantity
+        self.sell_quantity = sell_quantity
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.change = change
+        self.oi = oi
+        self.exchange_timestamp = exchange_timestamp
+        self.timestamp = timestamp
+        self.depth_buy = depth_buy
+        self.depth_sell = depth_sell
+
+    @classmethod
+    def from_kite(cls, tick: Dict[str, Any], timestamp: datetime) -> "TickRecord":
+        """Build a record from a tick dict parsed by KiteTicker"""
+        ohlc = tick.get("ohlc") or {}
+        depth = tick.get("depth") or {}
+        mode = tick.get("mode", 1)
+        return cls(
+            instrument_token=tick["instrument_token"],
+            last_price=float(tick.get("last_price", 0.0)),
+            timestamp=timestamp,
+            mode=mode if isinstance(mode, int) else {"ltp": 1, "quote": 2, "full": 3}.get(mode, 1),
+            tradeable=tick.get("tradable", tick.get("tradeable", True)),
+            last_quantity=tick.get("last_traded_quantity", tick.get("last_quantity")),
+            average_price=tick.get("average_traded_price", tick.get("average_price")),
+            volume=tick.get("volume_traded", tick.get("volume")),
+            buy_quantity=tick.get("total_buy_quantity", tick.get("buy_quantity")),
+            sell_quantity=tick.get("total_sell_quantity", tick.get("sell_quantity")),
+            open=ohlc.get("open"),
+            high=ohlc.get("high"),
+            low=ohlc.get("low"),
+            close=ohlc.get("close"),
+            change=tick.get("change"),
+            oi=tick.get("oi"),
+            exchange_timestamp=tick.get("exchange_timestamp"),
+            depth_buy=_depth_levels(depth.get("buy")),
+            depth_sell=_depth_levels(depth.get("sell")),
+        )
+
+    @classmethod
+    def from_redis(cls, mapping: Dict[str, str]) -> "TickRecord":
+        """Rebuild a record from the flat hash written by ``to_redis_mapping``"""
+        def _float(key: str) -> Optional[float]:
+            value = mapping.get(key)
+            return float(value) if value not in (None, "") else None
+
+        def _int(key: str) -> Optional[int]:
+            value = mapping.get(key)
+            return int(float(value)) if value not in (None, "") else None
+
+        return cls(
+            instrument_token=int(mapping["instrument_token"]),
+            last_price=float(mapping["last_price"]),
+            timestamp=datetime.fromisoformat(mapping["timestamp"]),
+            mode=_int("mode") or 1,
+            tradeable=mapping.get("tradeable", "1") == "1",
+            last_quantity=_int("last_quantity"),
+            average_price=_float("average_price"),
+            volume=_int("volume"),
+            buy_quantity=_int("buy_quantity"),
+            sell_quantity=_int("sell_quantity"),
+            open=_float("open"),
+            high=_float("high"),
+            low=_float("low"),
+            close=_float("close"),
+            change=_float("change"),
+            oi=_int("oi"),
+        )
+
+    @property
+    def has_depth(self) -> bool:
+        return bool(self.depth_buy or self.depth_sell)
+
+    def depth_dict(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Depth in the ``MarketDepth`` schema shape"""
+        return {
+            "buy": [{"price": p, "quantity": q, "orders": o} for p, q, o in self.depth_buy],
+            "sell": [{"price": p, "quantity": q, "orders": o} for p, q, o in self.depth_sell],
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Plain dict in the same shape as ``KiteTick.dict()``"""
+        return {
+            "tradeable": self.tradeable,
+            "mode": self.mode,
+            "instrument_token": self.instrument_token,
+            "last_price": self.last_price,
+            "last_quantity": self.last_quantity,
+            "average_price": self.average_price,
+            "volume": self.volume,
+            "buy_quantity": self.buy_quantity,
+            "sell_quantity": self.sell_quantity,
+            "ohlc": {
+                "open": self.open,
+                "high": self.high,
+                "low": self.low,
+                "close": self.close,
+            } if self.open is not None else None,
+            "depth": self.depth_dict() if self.has_depth else None,
+            "timestamp": self.timestamp,
+        }
+
+    def to_db_row(self) -> Dict[str, Any]:
+        """Row for the ``tick_data`` table"""
+        return {
+            "instrument_token": self.instrument_token,
+            "timestamp": self.timestamp,
+            "last_price": self.last_price,
+            "last_quantity": self.last_quantity,
+            "average_price": self.average_price,
+            "volume": self.volume,
+            "buy_quantity": self.buy_quantity,
+            "sell_quantity": self.sell_quantity,
+            "open": self.open,
+            "high": self.high,
+            "low": self.low,
+            "close": self.close,
+            "change": self.change,
+        }
+
+    def to_redis_mapping(self) -> Dict[str, Any]:
+        """Flat mapping suitable for ``HSET`` (Redis rejects None and nested values)"""
+        mapping = self.to_db_row()
+        mapping["timestamp"] = self.timestamp.isoformat()
+        mapping["mode"] = self.mode
+        mapping["tradeable"] = 1 if self.tradeable else 0
+        mapping["oi"] = self.oi
+        return {key: value for key, value in mapping.items() if value is not None}
+
+    def to_schema(self):
+        """Validated ``KiteTick`` for API responses"""
+        from app.schemas.market_data import KiteTick
+        return KiteTick(**self.to_dict())
+
+    def __repr__(self) -> str:
+        return f"TickRecord(instrument_token={self.instrument_token}, last_price={self.last_price}, timestamp={self.timestamp})"
@@ -0,0 +1,349 @@
+from kiteconnect import KiteTicker
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from datetime import datetime
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Expected ticks/second used for a token until we have observed it
+DEFAULT_TICK_RATE = 1.0
+# Smoothing factor for the observed per-token tick rate
+RATE_ALPHA = 0.2
+
+
+class TickerShard:
+    """One KiteTicker connection and the tokens assigned to it"""
+
+    def __init__(self, shard_id: int):
+        self.shard_id = shard_id
+        self.ticker: Optional[KiteTicker] = None
+        self.tokens: Dict[int, str] = {}  # token: mode
+        self.connected = False
+        self.reconnects = 0
+        self.ticks = 0
+        self.last_tick_at: Optional[float] = None
+        self.last_lag_ms: Optional[float] = None
+        self.max_lag_ms = 0.0
+        self._ticks_at_snapshot = 0
+        self._snapshot_at = time.monotonic()
+
+    def record_ticks(self, ticks: List[Dict[str, Any]]):
+        """Update throughput and exchange-to-receive lag counters"""
+        self.ticks += len(ticks)
+        self.last_tick_at = time.monotonic()
+        now = datetime.now()
+        for tick in ticks:
+            exchange_ts = tick.get("exchange_timestamp")
+            if isinstance(exchange_ts, datetime):
+                lag_ms = (now - exchange_ts).total_seconds() * 1000
+                self.last_lag_ms = lag_ms
+                self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Snapshot metrics; ticks_per_sec covers the time since the previous snapshot"""
+        now = time.monotonic()
+        elapsed = now - self._snapshot_at
+        ticks_per_sec = (self.ticks - self._ticks_at_snapshot) / elapsed if elapsed > 0 else 0.0
+        self._ticks_at_snapshot = self.ticks
+        self._snapshot_at = now
+        return {
+            "shard_id": self.shard_id,
+            "connected": self.connected,
+            "tokens": len(self.tokens),
+            "ticks": self.ticks,
+            "ticks_per_sec": round(ticks_per_sec, 2),
+            "last_lag_ms": self.last_lag_ms,
+            "max_lag_ms": self.max_lag_ms,
+            "idle_sec": round(now - self.last_tick_at, 3) if self.last_tick_at else None,
+            "reconnects": self.reconnects,
+        }
+
+
+class TickerPool:
+    """Shards instrument subscriptions across several KiteTicker connections.
+
+    Kite caps the number of instruments per websocket connection, so tokens
+    are spread over up to ``max_connections`` tickers. Each token goes to the
+    shard with the lowest expected tick rate that still has capacity, and
+    shards are re-balanced when subscriptions change. Shards connect lazily
+    and reconnect independently of each other.
+
+    ``ticker_factory`` and ``root`` make it possible to point the pool at a
+    local fake ticker server. ``on_frame`` receives every raw binary frame
+    before decoding, which is how sessions are recorded for replay.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        access_token: str,
+        on_ticks: Callable[[List[Dict[str, Any]]], None],
+        max_connections: int = 3,
+        max_tokens_per_connection: int = 3000,
+        ticker_factory: Callable[..., KiteTicker] = KiteTicker,
+        root: Optional[str] = None,
+        rebalance_threshold: float = 0.25,
+        on_frame: Optional[Callable[[bytes], None]] = None,
+        on_disconnect: Optional[Callable[[List[int]], None]] = None,
+    ):
+        self.api_key = api_key
+        self.access_token = access_token
+        self.on_ticks = on_ticks
+        self.on_frame = on_frame  # raw binary frames, e.g. for recording
+        self.on_disconnect = on_disconnect  # tokens of a shard that lost its connection
+        self.max_tokens_per_connection = max_tokens_per_connection
+        self.ticker_factory = ticker_factory
+        self.root = root
+        self.rebalance_threshold = rebalance_threshold
+        self.shards: List[TickerShard] = [TickerShard(i) for i in range(max_connections)]
+        self.token_shard: Dict[int, int] = {}  # token: shard id
+        self.expected_rates: Dict[int, float] = {}  # token: ticks/sec
+        self._last_seen: Dict[int, float] = {}  # token: monotonic time of last tick
+        self._lock = threading.RLock()
+
+    # Shard lifecycle
+    def _start_shard(self, shard: TickerShard):
+        """Create and connect the KiteTicker for a shard"""
+        kwargs = {"root": self.root} if self.root else {}
+        ticker = self.ticker_factory(self.api_key, self.access_token, **kwargs)
+
+        def on_connect(ws, response):
+            shard.connected = True
+            logger.info(f"Ticker shard {shard.shard_id} connected")
+            with self._lock:
+                tokens = dict(shard.tokens)
+            self._send_subscribe(shard, tokens)
+
+        def on_close(ws, code, reason):
+            shard.connected = False
+            logger.warning(f"Ticker shard {shard.shard_id} closed: {code} - {reason}")
+            if self.on_disconnect:
+                with self._lock:
+                    tokens = list(shard.tokens)
+                self.on_disconnect(tokens)
+
+        def on_error(ws, code, reason):
+            logger.error(f"Ticker shard {shard.shard_id} error: {code} - {reason}")
+
+        def on_reconnect(ws, attempts_count):
+            shard.reconnects += 1
+            logger.info(f"Ticker shard {shard.shard_id} reconnecting: attempt {attempts_count}")
+
+        def on_noreconnect(ws):
+            logger.error(f"Ticker shard {shard.shard_id} gave up reconnecting, restarting it")
+            shard.connected = False
+            self._start_shard(shard)
+
+        def on_ticks(ws, ticks):
+            shard.record_ticks(ticks)
+            self._observe_rates(ticks)
+            self.on_ticks(ticks)
+
+        ticker.on_connect = on_connect
+        ticker.on_close = on_close
+        ticker.on_error = on_error
+        ticker.on_reconnect = on_reconnect
+        ticker.on_noreconnect = on_noreconnect
+        ticker.on_ticks = on_ticks
+        if self.on_frame:
+            def on_message(ws, payload, is_binary):
+                if is_binary and len(payload) > 1:  # skip 1-byte heartbeats
+                    self.on_frame(payload)
+
+            ticker.on_message = on_message
+
+        shard.ticker = ticker
+        ticker.connect(threaded=True)
+        logger.info(f"Ticker shard {shard.shard_id} started")
+
+    def _send_subscribe(self, shard: TickerShard, tokens: Dict[int, str]):
+        """Subscribe tokens on a shard, grouped by mode"""
+        if not tokens or not shard.ticker or not shard.connected:
+            return
+        by_mode: Dict[str, List[int]] = {}
+        for token, mode in tokens.items():
+            by_mode.setdefault(mode, []).append(token)
+        shard.ticker.subscribe(list(tokens))
+        for mode, mode_tokens in by_mode.items():
+            shard.ticker.set_mode(mode, mode_tokens)
+
+    def _send_unsubscribe(self, shard: TickerShard, tokens: List[int]):
+        if tokens and shard.ticker and shard.connected:
+            shard.ticker.unsubscribe(tokens)
+
+    def close(self):
+        """Close every shard connection"""
+        with self._lock:
+            for shard in self.shards:
+                if shard.ticker:
+                    try:
+                        shard.ticker.close()
+                    except Exception as e:
+                        logger.error(f"Error closing ticker shard {shard.shard_id}: {e}")
+                    shard.ticker = None
+                    shard.connected = False
+
+    # Balancing
+    def _rate(self, token: int) -> float:
+        return self.expected_rates.get(token, DEFAULT_TICK_RATE)
+
+    def _load(self, shard: TickerShard) -> float:
+        return sum(self._rate(token) for token in shard.tokens)
+
+    def _observe_rates(self, ticks: List[Dict[str, Any]]):
+        """Fold observed ticks into the per-token expected rate"""
+        now = time.monotonic()
+        seen = self._last_seen
+        for tick in ticks:
+            token = tick.get("instrument_token")
+            if token is None:
+                continue
+            previous = seen.get(token)
+            seen[token] = now
+            if previous is not None and now > previous:
+                instant = 1.0 / (now - previous)
+                self.expected_rates[token] = (1 - RATE_ALPHA) * self._rate(token) + RATE_ALPHA * instant
+
+    def _pick_shard(self, loads: Dict[int, float]) -> TickerShard:
+        candidates = [s for s in self.shards if len(s.tokens) < self.max_tokens_per_connection]
+        if not candidates:
+            raise RuntimeError(
+                f"Ticker pool is full: {len(self.shards)} connections x "
+                f"{self.max_tokens_per_connection} tokens"
+            )
+        return min(candidates, key=lambda s: (loads[s.shard_id], len(s.tokens)))
+
+    def _rebalance(self):
+        """Move the busiest tokens from the heaviest shard to the lightest one"""
+        loads = {s.shard_id: self._load(s) for s in self.shards}
+        total = sum(loads.values())
+        if total == 0:
+            return
+
+        moves: Dict[int, Dict[int, int]] = {}  # token: {from, to}
+        for _ in range(len(self.token_shard)):
+            heavy = max(self.shards, key=lambda s: loads[s.shard_id])
+            light = min(
+                (s for s in self.shards if len(s.tokens) < self.max_tokens_per_connection),
+                key=lambda s: loads[s.shard_id],
+                default=None,
+            )
+            if light is None or heavy is light:
+                break
+            gap = loads[heavy.shard_id] - loads[light.shard_id]
+            if gap <= self.rebalance_threshold * total / len(self.shards):
+                break
+            # Largest token that narrows the gap
+            token = max(
+                (t for t in heavy.tokens if self._rate(t) < gap),
+                key=self._rate,
+                default=None,
+            )
+            if token is None:
+                break
+            light.tokens[token] = heavy.tokens.pop(token)
+            self.token_shard[token] = light.shard_id
+            loads[heavy.shard_id] -= self._rate(token)
+            loads[light.shard_id] += self._rate(token)
+            origin = moves.get(token, {}).get("from", heavy.shard_id)
+            moves[token] = {"from": origin, "to": light.shard_id}
+
+        self._apply_moves(moves)
+
+    def _apply_moves(self, moves: Dict[int, Dict[int, int]]):
+        """Subscribe moved tokens on their new shard before dropping them from the old one"""
+        added: Dict[int, Dict[int, str]] = {}
+        removed: Dict[int, List[int]] = {}
+        for token, move in moves.items():
+            if move["from"] == move["to"]:
+                continue
+            target = self.shards[move["to"]]
+            added.setdefault(move["to"], {})[token] = target.tokens[token]
+            removed.setdefault(move["from"], []).append(token)
+        for shard_id, tokens in added.items():
+            self._ensure_started(self.shards[shard_id])
+            self._send_subscribe(self.shards[shard_id], tokens)
+        for shard_id, tokens in removed.items():
+            self._send_unsubscribe(self.shards[shard_id], tokens)
+        if moves:
+            logger.info(f"Rebalanced {len(moves)} tokens across ticker shards")
+
+    def _ensure_started(self, shard: TickerShard):
+        if shard.ticker is None and shard.tokens:
+            self._start_shard(shard)
+
+    # Public API
+    def subscribe(self, tokens: Iterable[int], mode: str = KiteTicker.MODE_FULL,
+                  expected_rates: Optional[Dict[int, float]] = None):
+        """Assign tokens to shards and subscribe them upstream"""
+        with self._lock:
+            tokens = list(dict.fromkeys(tokens))
+            new_tokens = [token for token in tokens if token not in self.token_shard]
+            capacity = sum(self.max_tokens_per_connection - len(s.tokens) for s in self.shards)
+            if len(new_tokens) > capacity:
+                raise RuntimeError(
+                    f"Ticker pool is full: {len(new_tokens)} new tokens but only {capacity} free slots "
+                    f"across {len(self.shards)} connections"
+                )
+            if expected_rates:
+                self.expected_rates.update(expected_rates)
+
+            loads = {s.shard_id: self._load(s) for s in self.shards}
+            new_by_shard: Dict[int, Dict[int, str]] = {}
+            for token in tokens:
+                shard_id = self.token_shard.get(token)
+                if shard_id is not None:
+                    shard = self.shards[shard_id]
+                    if shard.tokens[token] != mode:
+                        shard.tokens[token] = mode
+                        new_by_shard.setdefault(shard_id, {})[token] = mode
+                    continue
+                shard = self._pick_shard(loads)
+                shard.tokens[token] = mode
+                self.token_shard[token] = shard.shard_id
+                loads[shard.shard_id] += self._rate(token)
+                new_by_shard.setdefault(shard.shard_id, {})[token] = mode
+
+            for shard_id, shard_tokens in new_by_shard.items():
+                shard = self.shards[shard_id]
+                if shard.ticker is None:
+                    # on_connect subscribes everything the shard owns
+                    self._start_shard(shard)
+                else:
+                    self._send_subscribe(shard, shard_tokens)
+
+            self._rebalance()
+
+    def unsubscribe(self, tokens: Iterable[int]):
+        """Drop tokens from their shards and re-balance what is left"""
+        with self._lock:
+            removed: Dict[int, List[int]] = {}
+            for token in tokens:
+                shard_id = self.token_shard.pop(token, None)
+                if shard_id is None:
+                    continue
+                self.shards[shard_id].tokens.pop(token, None)
+                self._last_seen.pop(token, None)
+                removed.setdefault(shard_id, []).append(token)
+
+            for shard_id, shard_tokens in removed.items():
+                self._send_unsubscribe(self.shards[shard_id], shard_tokens)
+
+            self._rebalance()
+
+    @property
+    def subscribed_tokens(self) -> Dict[int, str]:
+        with self._lock:
+            return {token: self.shards[shard_id].tokens[token] for token, shard_id in self.token_shard.items()}
+
+    def metrics(self) -> List[Dict[str, Any]]:
+        """Per-shard throughput, lag and load"""
+        with self._lock:
+            result = []
+            for shard in self.shards:
+                shard_metrics = shard.metrics()
+                shard_metrics["expected_ticks_per_sec"] = round(self._load(shard), 2)
+                result.append(shard_metrics)
+            return result
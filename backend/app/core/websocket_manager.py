@@ -1,6 +1,11 @@
 from kiteconnect import KiteTicker
 from app.core.config import get_settings
-from typing import Dict, Set
+from app.core.binary_relay import split_frame, frame_for_client
+from app.core.subscriptions import SubscriptionRegistry, MODE_FULL, MODE_NAMES, parse_mode, project
+from app.core.encoding import EncodingCache, batch_json, dumps
+from app.core.client_queue import ClientSender
+from app.core.compact_protocol import batch_frames, negotiate, pack_tick
+from typing import Dict, Set, Optional
 from fastapi import WebSocket
 import logging
 import json
@@ -13,7 +18,17 @@ class WebSocketManager:
     def __init__(self):
         self._instance = None
         self.active_connections: Dict[str, WebSocket] = {}
-        self.subscriptions: Dict[str, Set[int]] = {}
+        self.registry = SubscriptionRegistry(
+            on_subscribe=self._upstream_subscribe,
+            on_unsubscribe=self._upstream_unsubscribe,
+            on_mode=self._upstream_mode,
+            debounce=get_settings().WS_SUBSCRIPTION_DEBOUNCE_MS / 1000,
+        )
+        self.subscriptions: Dict[str, Set[int]] = self.registry.client_tokens
+        self.binary_clients: Set[str] = set()  # clients receiving raw Kite packets
+        self.compact_clients: Set[str] = set()  # clients that negotiated kc.bin.v1
+        self.senders: Dict[str, ClientSender] = {}  # per-client bounded queue and writer task
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
         self.kws = None
         self.initialize_ticker()
 
@@ -34,79 +49,188 @@ class WebSocketManager:
     def _setup_callbacks(self):
         """Setup KiteTicker callbacks"""
         self.kws.on_ticks = self._on_ticks
+        self.kws.on_message = self._on_message
         self.kws.on_connect = self._on_connect
         self.kws.on_close = self._on_close
         self.kws.on_error = self._on_error
         self.kws.on_reconnect = self._on_reconnect
         self.kws.on_noreconnect = self._on_noreconnect
 
-    async def connect(self, websocket: WebSocket, client_id: str):
-        """Connect a new client"""
-        await websocket.accept()
+    async def connect(self, websocket: WebSocket, client_id: str, binary: bool = False):
+        """Connect a new client
+
+        Binary clients receive the original KiteTicker packets for their
+        subscribed tokens and must decode the Kite binary format themselves.
+        Other clients get JSON ticks, or compact binary records if they
+        offered the ``kc.bin.v1`` subprotocol.
+        """
+        subprotocol = None if binary else negotiate(websocket)
+        await websocket.accept(subprotocol=subprotocol)
+        self._loop = asyncio.get_running_loop()
         self.active_connections[client_id] = websocket
-        self.subscriptions[client_id] = set()
-        logger.info(f"Client {client_id} connected")
+        settings = get_settings()
+        sender = ClientSender(
+            client_id,
+            lambda message: self._send(websocket, message),
+            policy=settings.WS_SLOW_CLIENT_POLICY,
+            maxsize=settings.WS_CLIENT_QUEUE_SIZE,
+            flush_interval=settings.WS_CORE_BATCH_MS / 1000,
+            on_close=self._drop_client,
+            batch=self._batcher(binary, subprotocol, settings.WS_CORE_BATCH_MS),
+        )
+        sender.start()
+        self.senders[client_id] = sender
+        self.registry.add_client(client_id)
+        if binary:
+            self.binary_clients.add(client_id)
+        elif subprotocol:
+            self.compact_clients.add(client_id)
+        logger.info(f"Client {client_id} connected (binary={binary}, subprotocol={subprotocol})")
 
     def disconnect(self, client_id: str):
         """Disconnect a client"""
         if client_id in self.active_connections:
             del self.active_connections[client_id]
-        if client_id in self.subscriptions:
-            self.unsubscribe(client_id, list(self.subscriptions[client_id]))
-            del self.subscriptions[client_id]
+        sender = self.senders.pop(client_id, None)
+        if sender:
+            sender.close()
+        self.binary_clients.discard(client_id)
+        self.compact_clients.discard(client_id)
+        self.registry.remove_client(client_id)
         logger.info(f"Client {client_id} disconnected")
 
-    def subscribe(self, client_id: str, instrument_tokens: list):
-        """Subscribe to instruments"""
+    @staticmethod
+    def _batcher(binary: bool, subprotocol: Optional[str], batch_ms: int):
+        """How a client's queued messages are combined into frames"""
+        if subprotocol:
+            return batch_frames
+        if batch_ms and not binary:
+            return batch_json
+        return None  # raw Kite frames go out as they arrived
+
+    def _drop_client(self, client_id: str):
+        """Disconnect a client whose sender gave up and close its socket"""
+        websocket = self.active_connections.get(client_id)
+        self.disconnect(client_id)
+        if websocket is not None:
+            asyncio.create_task(websocket.close(code=1013))
+
+    def subscribe(self, client_id: str, instrument_tokens: list, mode=MODE_FULL):
+        """Subscribe to instruments in ltp (1), quote (2) or full (3) mode"""
         if client_id in self.subscriptions:
-            self.subscriptions[client_id].update(instrument_tokens)
-            all_subscriptions = set().union(*self.subscriptions.values())
-            if all_subscriptions:
-                self.kws.subscribe(list(all_subscriptions))
-                logger.info(f"Client {client_id} subscribed to {instrument_tokens}")
+            self.registry.add(client_id, instrument_tokens, parse_mode(mode))
+            logger.info(f"Client {client_id} subscribed to {instrument_tokens}")
 
     def unsubscribe(self, client_id: str, instrument_tokens: list):
         """Unsubscribe from instruments"""
         if client_id in self.subscriptions:
-            self.subscriptions[client_id].difference_update(instrument_tokens)
-            all_subscriptions = set().union(*self.subscriptions.values())
-            if all_subscriptions:
-                self.kws.subscribe(list(all_subscriptions))
+            self.registry.remove(client_id, instrument_tokens)
             logger.info(f"Client {client_id} unsubscribed from {instrument_tokens}")
 
+    def _upstream_subscribe(self, instrument_tokens: list, mode: int):
+        """Subscribe tokens whose first client just arrived"""
+        if self.kws:
+            self.kws.subscribe(instrument_tokens)
+            self.kws.set_mode(MODE_NAMES[mode], instrument_tokens)
+
+    def _upstream_mode(self, instrument_tokens: list, mode: int):
+        """Move tokens to the highest mode any client still wants"""
+        if self.kws:
+            self.kws.set_mode(MODE_NAMES[mode], instrument_tokens)
+
+    def _upstream_unsubscribe(self, instrument_tokens: list):
+        """Unsubscribe tokens whose last client just left"""
+        if self.kws:
+            self.kws.unsubscribe(instrument_tokens)
+
     async def broadcast(self, message: dict):
-        """Broadcast message to all connected clients"""
-        disconnected_clients = []
-        for client_id, websocket in self.active_connections.items():
-            try:
-                await websocket.send_json(message)
-            except Exception as e:
-                logger.error(f"Error broadcasting to client {client_id}: {str(e)}")
-                disconnected_clients.append(client_id)
-
-        # Clean up disconnected clients
-        for client_id in disconnected_clients:
-            self.disconnect(client_id)
+        """Broadcast message to all connected JSON clients"""
+        text = None
+        for client_id, sender in list(self.senders.items()):
+            if client_id in self.binary_clients:
+                continue
+            if text is None:
+                text = dumps(message)
+            sender.offer(text)
+
+    async def send_binary(self, client_id: str, frame: bytes):
+        """Queue a raw Kite frame for a binary client"""
+        sender = self.senders.get(client_id)
+        if sender:
+            sender.offer(frame)
+
+    @staticmethod
+    async def _send(websocket: WebSocket, message):
+        if isinstance(message, str):
+            await websocket.send_text(message)
+        else:
+            await websocket.send_bytes(message)
+
+    def _schedule(self, coro):
+        """Run a coroutine on the server event loop from the KiteTicker thread"""
+        if self._loop and not self._loop.is_closed():
+            asyncio.run_coroutine_threadsafe(coro, self._loop)
+        else:
+            coro.close()
 
     # KiteTicker callbacks
-    def _on_ticks(self, ws, ticks):
-        """Handle incoming ticks"""
+    def _on_message(self, ws, payload, is_binary):
+        """Relay raw binary frames to binary clients without decoding them"""
+        # Text messages and 1 byte heartbeats carry no packets
+        if not is_binary or len(payload) < 2 or not self.binary_clients:
+            return
+        packets = split_frame(payload)
+        if not packets:
+            return
+        for client_id in list(self.binary_clients):
+            frame = frame_for_client(payload, packets, self.subscriptions.get(client_id, set()))
+            if frame:
+                self._schedule(self.send_binary(client_id, frame))
+
+    async def route_ticks(self, ticks: list):
+        """Queue each tick only for the JSON and compact clients subscribed to its token"""
+        timestamp = datetime.now().isoformat()
         for tick in ticks:
             instrument_token = tick.get('instrument_token')
-            if instrument_token:
-                message = {
-                    'type': 'tick',
-                    'data': tick,
-                    'timestamp': datetime.now().isoformat()
-                }
-                asyncio.create_task(self.broadcast(message))
+            if not instrument_token:
+                continue
+            cache = EncodingCache()
+            for client_id in self.registry.clients_for(instrument_token):
+                if client_id in self.binary_clients:
+                    continue
+                sender = self.senders.get(client_id)
+                if not sender:
+                    continue
+                # Only the fields of the client's mode, encoded once per protocol and mode
+                mode = self.registry.mode_for(client_id, instrument_token)
+                if client_id in self.compact_clients:
+                    message = cache.get(("bin", mode), lambda: project(tick, mode), encode=pack_tick)
+                else:
+                    message = cache.get(
+                        ("json", mode),
+                        lambda: {'type': 'tick', 'data': project(tick, mode), 'timestamp': timestamp},
+                    )
+                sender.offer(message, key=instrument_token)
+
+    def queue_stats(self) -> Dict[str, dict]:
+        """Send queue depth and drops per client"""
+        return {client_id: sender.stats() for client_id, sender in self.senders.items()}
+
+    def _on_ticks(self, ws, ticks):
+        """Handle incoming ticks"""
+        if len(self.binary_clients) == len(self.active_connections):
+            return
+        # Routing reads the subscription index, so it runs on the server loop
+        self._schedule(self.route_ticks(ticks))
 
     def _on_connect(self, ws, response):
         """Handle connection established"""
         logger.info("Connected to Kite WebSocket")
-        all_subscriptions = set().union(*self.subscriptions.values())
+        all_subscriptions = self.registry.upstream_tokens
         if all_subscriptions:
-            self.kws.subscribe(list(all_subscriptions))
+            self.kws.subscribe(all_subscriptions)
+            for mode, tokens in self.registry._group_by_mode(self.registry.upstream_modes).items():
+                self.kws.set_mode(MODE_NAMES[mode], tokens)
 
     def _on_close(self, ws, code, reason):
         """Handle connection closed"""
@@ -0,0 +1,273 @@
+"""Standalone ingestion process.
+
+Owns the KiteTicker pool and publishes every tick either into the shared
+memory segment read by the API workers on this host (``INGEST_MODE=shm``,
+see ``app.ingestion.shm``) or to per-underlying Redis streams consumed by
+workers on any host (``INGEST_MODE=stream``, see ``app.ingestion.streams``).
+In shm mode the segment also carries the option chains of every
+underlying, so workers build chains without downloading instruments.
+Workers send their upstream subscription changes over a Redis pub/sub
+channel, so the number of upstream connections stays the same no matter
+how many workers or hosts run.
+
+Run with ``python -m app.ingestion.process``.
+"""
+from redis.asyncio import Redis
+from kiteconnect import KiteConnect
+from app.core.config import settings
+from app.core.ticker_pool import TickerPool
+from app.core.subscriptions import SubscriptionRegistry, MODE_NAMES, parse_mode
+from app.ingestion.recording import TickCapture
+from app.ingestion.shm import TickWriter, chain_state
+from app.ingestion.streams import StreamPublisher, redis_binary
+from app.services.backfill_service import BackfillService
+from typing import Any, Dict, List, Optional, Set
+import asyncio
+import concurrent.futures
+import json
+import logging
+import signal
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class IngestionProcess:
+    """Ticker pool -> shared memory or Redis streams, driven by control messages from workers.
+
+    Control messages are JSON objects on ``INGEST_CONTROL_CHANNEL``:
+    ``{"action": "token"}``,
+    ``{"action": "subscribe", "client_id": worker, "tokens": [...], "mode": 3}``,
+    ``{"action": "unsubscribe", "client_id": worker, "tokens": [...]}`` and
+    ``{"action": "remove_client", "client_id": worker}``. The access token
+    never goes over the channel: ``token`` says it changed, and it is read
+    from ``INGEST_TOKEN_KEY``. On start-up the process publishes
+    ``{"action": "sync"}`` so running workers re-send their state.
+    Subscriptions are reference-counted per worker, and every worker keeps
+    a heartbeat key alive; a worker whose key expired, e.g. because it was
+    killed, loses its subscriptions as if it had sent ``remove_client``.
+
+    ``shm_name`` and ``stream_prefix`` default to the live outputs the
+    workers read; a replay passes its own so it never touches them.
+    """
+
+    def __init__(
+        self,
+        shm_name: Optional[str] = None,
+        stream_prefix: Optional[str] = None,
+        replace_segment: bool = True,
+    ):
+        self.writer: Optional[TickWriter] = None
+        self.publisher: Optional[StreamPublisher] = None
+        if settings.INGEST_MODE == "stream":
+            self.publisher = StreamPublisher(
+                redis_binary(settings.REDIS_URL),
+                stream_prefix or settings.INGEST_STREAM_PREFIX,
+                settings.INGEST_STREAM_MAXLEN,
+            )
+        else:
+            self.writer = TickWriter(
+                shm_name or settings.INGEST_SHM_NAME,
+                settings.INGEST_RING_CAPACITY,
+                settings.INGEST_LVT_CAPACITY,
+                settings.INGEST_CHAIN_BYTES,
+                replace=replace_segment,
+            )
+        self._publishing: Set[concurrent.futures.Future] = set()  # publishes scheduled from ticker threads
+        self._write_lock = threading.Lock()  # shards deliver ticks on their own threads
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.pool: Optional[TickerPool] = None
+        self.capture: Optional[TickCapture] = None
+        self.kite: Optional[KiteConnect] = None
+        self.backfill: Optional[BackfillService] = None
+        self.access_token: Optional[str] = None
+        self._workers_seen: Dict[str, float] = {}  # worker: last control message, monotonic
+        self.registry = SubscriptionRegistry(
+            on_subscribe=self._upstream_subscribe,
+            on_unsubscribe=self._upstream_unsubscribe,
+            debounce=settings.WS_SUBSCRIPTION_DEBOUNCE_MS / 1000,
+        )
+
+    def _on_ticks(self, ticks: List[Dict[str, Any]]):
+        if self.backfill:
+            self.backfill.observe(ticks)
+        if self.publisher:
+            future = asyncio.run_coroutine_threadsafe(self._publish(ticks), self._loop)
+            self._publishing.add(future)
+            future.add_done_callback(self._publishing.discard)
+            return
+        try:
+            with self._write_lock:
+                self.writer.write(ticks)
+        except Exception as e:
+            logger.error(f"Error writing ticks to shared memory: {e}")
+
+    async def _publish(self, ticks: List[Dict[str, Any]]):
+        try:
+            await self.publisher.publish(ticks)
+        except Exception as e:
+            logger.error(f"Error publishing ticks to Redis streams: {e}")
+
+    async def drain(self):
+        """Wait for the publishes still in flight, before the publisher's connection is closed"""
+        while self._publishing:
+            await asyncio.gather(*(asyncio.wrap_future(f) for f in list(self._publishing)), return_exceptions=True)
+
+    async def _load_instruments(self):
+        """Map instrument tokens to their underlying for stream sharding, or publish the chain state"""
+        try:
+            instruments = await self._loop.run_in_executor(None, self.kite.instruments)
+            if self.publisher:
+                self.publisher.underlyings = {
+                    inst["instrument_token"]: inst["name"] or inst["tradingsymbol"]
+                    for inst in instruments
+                }
+                logger.info(f"Loaded underlyings for {len(instruments)} instruments")
+            if self.writer:
+                state = chain_state(instruments)
+                with self._write_lock:
+                    self.writer.write_chains(state)
+                logger.info(f"Published option chains of {len(state['options'])} underlyings")
+        except Exception as e:
+            logger.error(f"Error loading instruments: {e}")
+
+    def set_access_token(self, access_token: str):
+        """(Re)start the ticker pool when the access token changes"""
+        if self.pool and access_token == self.access_token:
+            return
+        self.access_token = access_token
+        if not self.kite:
+            self.kite = KiteConnect(api_key=settings.KITE_API_KEY)
+        self.kite.set_access_token(access_token)
+        if settings.GAP_DETECTION_ENABLED and not self.backfill:
+            self.backfill = BackfillService.from_settings(self.kite)
+            self.backfill.start(self._loop)
+            self._loop.create_task(self.backfill.retry_unrecovered())
+        self._loop.create_task(self._load_instruments())
+        if self.pool:
+            self.pool.close()
+        if settings.TICK_CAPTURE_DIR and not self.capture:
+            self.capture = TickCapture(
+                settings.TICK_CAPTURE_DIR,
+                settings.TICK_CAPTURE_SEGMENT_MB * 1024 * 1024,
+                settings.TICK_CAPTURE_INDEX_INTERVAL_MS,
+            )
+            logger.info(f"Capturing ticker frames to {settings.TICK_CAPTURE_DIR}")
+        self.pool = TickerPool(
+            api_key=settings.KITE_API_KEY,
+            access_token=access_token,
+            on_ticks=self._on_ticks,
+            max_connections=settings.KITE_TICKER_CONNECTIONS,
+            max_tokens_per_connection=settings.KITE_TICKER_MAX_TOKENS,
+            root=settings.KITE_TICKER_ROOT,
+            on_frame=self.capture.write if self.capture else None,
+            on_disconnect=self.backfill.disconnected if self.backfill else None,
+        )
+        for mode, tokens in self.registry._group_by_mode(self.registry.upstream_modes).items():
+            self.pool.subscribe(tokens, MODE_NAMES[mode])
+        logger.info("Access token set and ticker pool initialized")
+
+    def _upstream_subscribe(self, tokens: List[int], mode: int):
+        if self.pool:
+            self.pool.subscribe(tokens, MODE_NAMES[mode])
+
+    def _upstream_unsubscribe(self, tokens: List[int]):
+        if self.pool:
+            self.pool.unsubscribe(tokens)
+        if self.backfill:
+            self.backfill.detector.forget(tokens)
+
+    def handle(self, message: Dict[str, Any]):
+        """Apply one control message"""
+        action = message.get("action")
+        client_id = message.get("client_id", "default")
+        if client_id != "default":
+            self._workers_seen[client_id] = time.monotonic()
+        if action == "subscribe":
+            self.registry.add(client_id, message.get("tokens", []), parse_mode(message.get("mode", 3)))
+        elif action == "unsubscribe":
+            self.registry.remove(client_id, message.get("tokens", []))
+        elif action == "remove_client":
+            self.registry.remove_client(client_id)
+            self._workers_seen.pop(client_id, None)
+
+    async def _read_token(self, redis: Redis):
+        access_token = await redis.get(settings.INGEST_TOKEN_KEY)
+        if access_token:
+            self.set_access_token(access_token)
+
+    async def _reap_workers(self, redis: Redis):
+        """Drop the subscriptions of workers whose heartbeat expired"""
+        grace = time.monotonic() - settings.INGEST_WORKER_TTL_SECONDS
+        for worker in list(self.registry.client_tokens):
+            # A worker's first messages may arrive before its first heartbeat
+            if self._workers_seen.get(worker, 0) > grace:
+                continue
+            if not await redis.exists(f"{settings.INGEST_WORKER_KEY_PREFIX}:{worker}"):
+                logger.warning(f"Worker {worker} stopped sending heartbeats, dropping its subscriptions")
+                self.registry.remove_client(worker)
+                self._workers_seen.pop(worker, None)
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        redis = Redis.from_url(settings.REDIS_URL, encoding="utf-8", decode_responses=True)
+        pubsub = redis.pubsub()
+        await pubsub.subscribe(settings.INGEST_CONTROL_CHANNEL)
+        await self._read_token(redis)
+        await redis.publish(settings.INGEST_CONTROL_CHANNEL, json.dumps({"action": "sync"}))
+        logger.info(f"Ingestion process listening on {settings.INGEST_CONTROL_CHANNEL}")
+        reap_interval = settings.INGEST_WORKER_TTL_SECONDS / 3
+        next_reap = self._loop.time() + reap_interval
+
+        stop = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            self._loop.add_signal_handler(sig, stop.set)
+
+        try:
+            while not stop.is_set():
+                if self._loop.time() >= next_reap:
+                    next_reap = self._loop.time() + reap_interval
+                    try:
+                        await self._reap_workers(redis)
+                    except Exception as e:
+                        logger.error(f"Error checking worker heartbeats: {e}")
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message is None:
+                    continue
+                try:
+                    data = json.loads(message["data"])
+                    if data.get("action") == "token":
+                        await self._read_token(redis)
+                    else:
+                        self.handle(data)
+                except Exception as e:
+                    logger.error(f"Error handling control message: {e}")
+        finally:
+            await pubsub.unsubscribe(settings.INGEST_CONTROL_CHANNEL)
+            await redis.close()
+            if self.publisher:
+                await self.drain()
+                await self.publisher.redis.close()
+            self.close()
+
+    def close(self):
+        if self.pool:
+            self.pool.close()
+            self.pool = None
+        if self.capture:
+            self.capture.close()
+        if self.backfill:
+            self.backfill.stop()
+        if self.writer:
+            with self._write_lock:
+                self.writer.close()
+        logger.info("Ingestion process stopped")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    )
+    asyncio.run(IngestionProcess().run())
@@ -0,0 +1,167 @@
+"""Tick capture file format.
+
+A capture is the raw KiteTicker binary frames of a session, exactly as
+received, so replaying it exercises the same decoding path as live data::
+
+    header:  b"KCREC" + version byte + 2 reserved bytes
+    record:  received_ts_ns (int64 LE) | length (uint32 LE) | frame bytes
+
+Records are appended in arrival order. Text frames (order updates, errors)
+are not captured. Segment files are preallocated, so an all-zero record
+header marks the end of the data in a segment that is still being written
+or was not closed cleanly.
+
+Each segment has a sidecar ``.idx`` file of (received_ts_ns, offset) pairs,
+one per index interval, used to seek to a time without scanning the segment.
+"""
+from datetime import datetime
+from typing import Iterable, Iterator, List, Optional, Tuple
+import bisect
+import glob
+import mmap
+import os
+import struct
+import threading
+import time
+
+MAGIC = b"KCREC"
+VERSION = 1
+FILE_HEADER = MAGIC + bytes([VERSION, 0, 0])
+RECORD = struct.Struct("<qI")
+INDEX_ENTRY = struct.Struct("<qQ")
+
+
+class RecordingError(Exception):
+    pass
+
+
+class TickCapture:
+    """Appends raw ticker frames to daily, preallocated, memory-mapped segments.
+
+    Frames are copied into the mapping, so capturing a frame costs a memcpy
+    rather than a write syscall. A new segment starts when the current one
+    is full or the day changes; a finished segment is truncated to the bytes
+    actually used. Safe to call from every ticker shard thread.
+    """
+
+    def __init__(self, directory: str, segment_bytes: int = 256 * 1024 * 1024, index_interval_ms: int = 1000):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.index_interval_ns = index_interval_ms * 1_000_000
+        self._lock = threading.Lock()
+        self._file = None
+        self._mmap: Optional[mmap.mmap] = None
+        self._index = None
+        self._offset = 0
+        self._day: Optional[str] = None
+        self._next_index_ns = 0
+        self.path: Optional[str] = None
+        self.frames = 0
+        self.segments = 0
+
+    def _open_segment(self, day: str, min_bytes: int):
+        self._close_segment()
+        folder = os.path.join(self.directory, day)
+        os.makedirs(folder, exist_ok=True)
+        number = len(glob.glob(os.path.join(folder, "*.kcrec")))
+        self.path = os.path.join(folder, f"ticks-{day}-{number:03d}.kcrec")
+        size = max(self.segment_bytes, len(FILE_HEADER) + min_bytes)
+
+        self._file = open(self.path, "w+b")
+        self._file.truncate(size)
+        self._mmap = mmap.mmap(self._file.fileno(), size)
+        self._mmap[:len(FILE_HEADER)] = FILE_HEADER
+        self._offset = len(FILE_HEADER)
+        self._index = open(self.path + ".idx", "wb")
+        self._next_index_ns = 0
+        self._day = day
+        self.segments += 1
+
+    def _close_segment(self):
+        if self._mmap is None:
+            return
+        self._mmap.flush()
+        self._mmap.close()
+        self._file.truncate(self._offset)
+        self._file.close()
+        self._index.close()
+        self._mmap = None
+
+    def write(self, payload: bytes, received_ts_ns: Optional[int] = None):
+        if received_ts_ns is None:
+            received_ts_ns = time.time_ns()
+        needed = RECORD.size + len(payload)
+        with self._lock:
+            day = datetime.fromtimestamp(received_ts_ns / 1e9).strftime("%Y%m%d")
+            if self._mmap is None or day != self._day or self._offset + needed > len(self._mmap):
+                self._open_segment(day, needed)
+
+            if received_ts_ns >= self._next_index_ns:
+                self._index.write(INDEX_ENTRY.pack(received_ts_ns, self._offset))
+                self._next_index_ns = received_ts_ns + self.index_interval_ns
+
+            offset = self._offset
+            RECORD.pack_into(self._mmap, offset, received_ts_ns, len(payload))
+            self._mmap[offset + RECORD.size:offset + needed] = payload
+            self._offset = offset + needed
+            self.frames += 1
+
+    def close(self):
+        with self._lock:
+            self._close_segment()
+
+
+def check_header(header: bytes, path: str):
+    if len(header) < len(FILE_HEADER) or header[:len(MAGIC)] != MAGIC:
+        raise RecordingError(f"{path} is not a tick recording")
+    if header[len(MAGIC)] != VERSION:
+        raise RecordingError(f"{path} has unsupported recording version {header[len(MAGIC)]}")
+
+
+def read_index(path: str) -> List[Tuple[int, int]]:
+    """(received_ts_ns, offset) pairs for a segment, empty if it has no index"""
+    try:
+        with open(path + ".idx", "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return []
+    usable = len(data) - len(data) % INDEX_ENTRY.size
+    return list(INDEX_ENTRY.iter_unpack(data[:usable]))
+
+
+def read_frames(path: str, start_ns: Optional[int] = None) -> Iterator[Tuple[int, bytes]]:
+    """Yield (received_ts_ns, frame) pairs in recorded order, optionally from a time"""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < len(FILE_HEADER):
+            raise RecordingError(f"{path} is not a tick recording")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            check_header(data[:len(FILE_HEADER)], path)
+            offset = len(FILE_HEADER)
+            if start_ns is not None:
+                index = read_index(path)
+                position = bisect.bisect_right(index, (start_ns, float("inf"))) - 1
+                if position >= 0:
+                    offset = index[position][1]
+
+            end = len(data)
+            while offset + RECORD.size <= end:
+                received_ts_ns, length = RECORD.unpack_from(data, offset)
+                if received_ts_ns == 0 and length == 0:
+                    return  # preallocated space not written yet
+                frame_end = offset + RECORD.size + length
+                if frame_end > end:
+                    return  # record cut short by a crash
+                if start_ns is None or received_ts_ns >= start_ns:
+                    yield received_ts_ns, data[offset + RECORD.size:frame_end]
+                offset = frame_end
+
+
+def read_session(paths: Iterable[str], start_ns: Optional[int] = None) -> Iterator[Tuple[int, bytes]]:
+    """Frames of several segments in order"""
+    for path in sorted(paths):
+        yield from read_frames(path, start_ns)
+
+
+def session_segments(directory: str, day: str) -> List[str]:
+    """Segment files captured on a day (YYYYMMDD)"""
+    return sorted(glob.glob(os.path.join(directory, day, "*.kcrec")))
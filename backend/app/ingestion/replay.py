@@ -0,0 +1,166 @@
+"""Replay recorded ticker sessions.
+
+Drives the same ``on_ticks(ticks)`` entry point as ``TickerPool``, so a
+recording can be pushed through the ingestion process, fan-out and
+persistence without a Kite session::
+
+    python -m app.ingestion.replay capture/20240105/*.kcrec --speed 10 --max-gap 1
+    python -m app.ingestion.replay capture/20240105/*.kcrec --start 2024-01-05T14:29:00 --speed 0 --into none
+
+``--into ingest`` publishes to a segment and streams of its own,
+``<INGEST_SHM_NAME>_replay`` and ``<INGEST_STREAM_PREFIX>_replay:*`` by
+default, never the live ones; point a worker's ``INGEST_SHM_NAME`` or
+``INGEST_STREAM_PREFIX`` at them to consume the replay. A segment that
+already exists is refused rather than replaced.
+"""
+from kiteconnect import KiteTicker
+from app.core.config import settings
+from app.ingestion.recording import read_session
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import argparse
+import asyncio
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def kite_decoder() -> Callable[[bytes], List[Dict[str, Any]]]:
+    """KiteTicker's own binary parser; the ticker is never connected"""
+    ticker = KiteTicker("replay", "replay")
+    return ticker._parse_binary
+
+
+class TickReplayer:
+    """Feeds recorded frames to an ``on_ticks`` callback with the recorded timing.
+
+    ``speed`` scales the recorded inter-arrival times (1 = real time, 10 =
+    ten times faster, 0 = as fast as possible). ``max_gap`` caps any single
+    pause, in recorded seconds, so idle stretches are compressed while bursts
+    keep their shape. The schedule is computed from the recording alone,
+    so two runs at the same settings deliver the same frames in the same
+    order at the same offsets.
+    """
+
+    def __init__(
+        self,
+        frames: Iterable[Tuple[int, bytes]],
+        on_ticks: Callable[[List[Dict[str, Any]]], None],
+        speed: float = 1.0,
+        max_gap: Optional[float] = None,
+        decode: Optional[Callable[[bytes], List[Dict[str, Any]]]] = None,
+    ):
+        if speed < 0:
+            raise ValueError("speed must be >= 0")
+        self.frames = frames
+        self.on_ticks = on_ticks
+        self.speed = speed
+        self.max_gap = max_gap
+        self.decode = decode or kite_decoder()
+        self._stop = threading.Event()
+        self.frames_sent = 0
+        self.ticks_sent = 0
+        self.max_behind_ms = 0.0  # worst lateness against the schedule
+
+    @classmethod
+    def from_files(
+        cls,
+        paths: Iterable[str],
+        on_ticks: Callable[[List[Dict[str, Any]]], None],
+        start: Optional[datetime] = None,
+        **kwargs,
+    ) -> "TickReplayer":
+        """Replay capture segments, seeking to ``start`` through the segment indexes"""
+        start_ns = int(start.timestamp() * 1e9) if start else None
+        return cls(read_session(paths, start_ns), on_ticks, **kwargs)
+
+    def run(self) -> Dict[str, Any]:
+        """Replay every frame on the calling thread and return stats"""
+        started = time.perf_counter()
+        offset = 0.0  # scheduled seconds since start
+        previous_ts: Optional[int] = None
+
+        for received_ts_ns, frame in self.frames:
+            if self._stop.is_set():
+                break
+
+            if self.speed and previous_ts is not None:
+                gap = max(0.0, (received_ts_ns - previous_ts) / 1e9)
+                if self.max_gap is not None:
+                    gap = min(gap, self.max_gap)
+                offset += gap / self.speed
+                delay = started + offset - time.perf_counter()
+                if delay > 0:
+                    self._stop.wait(delay)
+                else:
+                    self.max_behind_ms = max(self.max_behind_ms, -delay * 1000)
+            previous_ts = received_ts_ns
+
+            ticks = self.decode(frame)
+            if ticks:
+                self.on_ticks(ticks)
+                self.ticks_sent += len(ticks)
+            self.frames_sent += 1
+
+        return self.stats(time.perf_counter() - started)
+
+    def start(self) -> threading.Thread:
+        """Replay on a daemon thread, like ``KiteTicker.connect(threaded=True)``"""
+        thread = threading.Thread(target=self.run, name="tick-replay", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self, elapsed: float) -> Dict[str, Any]:
+        return {
+            "frames": self.frames_sent,
+            "ticks": self.ticks_sent,
+            "elapsed_sec": round(elapsed, 3),
+            "ticks_per_sec": round(self.ticks_sent / elapsed, 1) if elapsed > 0 else 0.0,
+            "max_behind_ms": round(self.max_behind_ms, 3),
+        }
+
+
+async def _replay(args) -> Dict[str, Any]:
+    process = None
+    on_ticks: Callable[[List[Dict[str, Any]]], None] = lambda ticks: None
+    if args.into == "ingest":
+        # Publish through the ingestion outputs (shared memory or Redis streams)
+        from app.ingestion.process import IngestionProcess
+        if args.shm_name == settings.INGEST_SHM_NAME or args.stream_prefix == settings.INGEST_STREAM_PREFIX:
+            raise SystemExit("Refusing to replay into the live ingestion segment or streams")
+        process = IngestionProcess(shm_name=args.shm_name, stream_prefix=args.stream_prefix, replace_segment=False)
+        process._loop = asyncio.get_running_loop()
+        on_ticks = process._on_ticks
+
+    replayer = TickReplayer.from_files(
+        args.files, on_ticks, start=args.start, speed=args.speed, max_gap=args.max_gap,
+    )
+    try:
+        return await asyncio.get_running_loop().run_in_executor(None, replayer.run)
+    finally:
+        if process:
+            if process.publisher:
+                await process.drain()
+                await process.publisher.redis.close()
+            process.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    )
+    parser = argparse.ArgumentParser(description="Replay a recorded tick session")
+    parser.add_argument("files", nargs="+", help="capture segments of one session")
+    parser.add_argument("--start", type=datetime.fromisoformat, default=None, help="skip frames received before this time")
+    parser.add_argument("--speed", type=float, default=1.0, help="1 = real time, 0 = as fast as possible")
+    parser.add_argument("--max-gap", type=float, default=None, help="cap pauses at this many recorded seconds")
+    parser.add_argument("--into", choices=["ingest", "none"], default="ingest")
+    parser.add_argument("--shm-name", default=f"{settings.INGEST_SHM_NAME}_replay", help="segment to write with --into ingest")
+    parser.add_argument("--stream-prefix", default=f"{settings.INGEST_STREAM_PREFIX}_replay", help="streams to publish with --into ingest")
+    logger.info(f"Replay finished: {asyncio.run(_replay(parser.parse_args()))}")
@@ -0,0 +1,344 @@
+from multiprocessing import shared_memory
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import json
+import mmap
+import os
+import struct
+import time
+
+# Fixed-layout tick record shared by the ring buffer and the last-value table:
+# seq, token, mode, last_price, change, open, high, low, close,
+# last_quantity, volume, buy_quantity, sell_quantity, oi,
+# exchange_ts_ms, received_ts_ns
+TICK = struct.Struct("<QIIddddddqqqqqqq")
+
+# Segment header: magic, version, ring capacity, table capacity, ring write seq, chain state capacity
+HEADER = struct.Struct("<IIQQQQ")
+MAGIC = 0x4B435449  # "KCTI"
+VERSION = 2
+_WRITE_SEQ_OFFSET = 24
+
+# Last-value slot: seqlock version, token, record
+SLOT_PREFIX = struct.Struct("<II")
+SLOT_SIZE = SLOT_PREFIX.size + TICK.size
+
+# Chain state region: seqlock version, payload length, then the payload, compact JSON
+CHAIN_PREFIX = struct.Struct("<QQ")
+
+# Reads of a seqlocked record retried while a write is in progress; a writer
+# that died mid-write leaves the version odd for good
+SEQLOCK_RETRIES = 1000
+_SEQ = struct.Struct("<Q")  # the seq leading every ring record
+
+_MODES = {"ltp": 1, "quote": 2, "full": 3}
+
+
+def segment_size(ring_capacity: int, table_capacity: int, chain_capacity: int = 0) -> int:
+    return HEADER.size + ring_capacity * TICK.size + table_capacity * SLOT_SIZE + CHAIN_PREFIX.size + chain_capacity
+
+
+def chain_state(instruments: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Option chains of every underlying from a Kite instruments dump
+
+    ``{"options": {name: {expiry: [[strike, call token, put token], ...]}},
+    "futures": {name: "EXCHANGE:TRADINGSYMBOL" of the nearest future}}``,
+    strikes ascending and 0 for a missing side. Workers build their chains
+    from this instead of each downloading the instruments dump.
+    """
+    options: Dict[str, Dict[str, Dict[float, List]]] = {}
+    futures: Dict[str, Tuple[Any, str]] = {}
+    for inst in instruments:
+        kind = inst.get("instrument_type")
+        if kind == "FUT":
+            nearest = futures.get(inst["name"])
+            if nearest is None or inst["expiry"] < nearest[0]:
+                futures[inst["name"]] = (inst["expiry"], f"{inst['exchange']}:{inst['tradingsymbol']}")
+        elif kind in ("CE", "PE"):
+            strikes = options.setdefault(inst["name"], {}).setdefault(inst["expiry"].strftime("%Y-%m-%d"), {})
+            entry = strikes.setdefault(inst["strike"], [inst["strike"], 0, 0])
+            entry[1 if kind == "CE" else 2] = inst["instrument_token"]
+    return {
+        "options": {
+            name: {expiry: [strikes[strike] for strike in sorted(strikes)] for expiry, strikes in expiries.items()}
+            for name, expiries in options.items()
+        },
+        "futures": {name: key for name, (_, key) in futures.items()},
+    }
+
+
+def pack_tick(seq: int, tick: Dict[str, Any], received_ts_ns: int) -> Tuple:
+    """Flatten a KiteTicker tick into TICK fields"""
+    ohlc = tick.get("ohlc") or {}
+    exchange_ts = tick.get("exchange_timestamp")
+    mode = tick.get("mode", 1)
+    return (
+        seq,
+        tick["instrument_token"],
+        mode if isinstance(mode, int) else _MODES.get(mode, 1),
+        float(tick.get("last_price") or 0.0),
+        float(tick.get("change") or 0.0),
+        float(ohlc.get("open") or 0.0),
+        float(ohlc.get("high") or 0.0),
+        float(ohlc.get("low") or 0.0),
+        float(ohlc.get("close") or 0.0),
+        int(tick.get("last_traded_quantity") or 0),
+        int(tick.get("volume_traded") or 0),
+        int(tick.get("total_buy_quantity") or 0),
+        int(tick.get("total_sell_quantity") or 0),
+        int(tick.get("oi") or 0),
+        int(exchange_ts.timestamp() * 1000) if isinstance(exchange_ts, datetime) else 0,
+        received_ts_ns,
+    )
+
+
+def unpack_tick(fields: Tuple) -> Dict[str, Any]:
+    """Rebuild a tick dict with KiteTicker field names from TICK fields"""
+    (_, token, mode, last_price, change, open_, high, low, close,
+     last_quantity, volume, buy_quantity, sell_quantity, oi, exchange_ts_ms, received_ts_ns) = fields
+    tick = {
+        "instrument_token": token,
+        "mode": {1: "ltp", 2: "quote", 3: "full"}.get(mode, "ltp"),
+        "last_price": last_price,
+        "change": change,
+        "timestamp": datetime.fromtimestamp(received_ts_ns / 1e9),
+    }
+    if mode >= 2:
+        tick.update({
+            "ohlc": {"open": open_, "high": high, "low": low, "close": close},
+            "last_traded_quantity": last_quantity,
+            "volume_traded": volume,
+            "total_buy_quantity": buy_quantity,
+            "total_sell_quantity": sell_quantity,
+        })
+    if mode >= 3:
+        tick["oi"] = oi
+    if exchange_ts_ms:
+        tick["exchange_timestamp"] = datetime.fromtimestamp(exchange_ts_ms / 1000)
+    return tick
+
+
+class TickWriter:
+    """Single writer side of the shared tick segment (owned by the ingestion process).
+
+    The segment holds a ring of recent ticks, used by workers to fan out
+    every tick, and an open-addressing last-value table keyed by token, used
+    for snapshots and REST reads. Table slots are guarded by a seqlock so
+    readers never see a half written record. A chain state region of
+    ``chain_capacity`` bytes holds the option chains of every underlying
+    (see ``chain_state``), rewritten under its own seqlock whenever the
+    instruments are reloaded. An existing segment of the
+    same name is taken to be left over and replaced, unless ``replace`` is
+    False, when it is refused with ``FileExistsError`` instead.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        ring_capacity: int,
+        table_capacity: int,
+        chain_capacity: int = 0,
+        replace: bool = True,
+    ):
+        if table_capacity & (table_capacity - 1):
+            raise ValueError("table_capacity must be a power of two")
+        self.ring_capacity = ring_capacity
+        self.table_capacity = table_capacity
+        self.chain_capacity = chain_capacity
+        size = segment_size(ring_capacity, table_capacity, chain_capacity)
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            if not replace:
+                raise FileExistsError(f"Shared memory segment {name} already exists, another writer may own it")
+            # Left over from a previous run, start from a clean segment
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self.buf = self.shm.buf
+        self.buf[:size] = bytes(size)
+        HEADER.pack_into(self.buf, 0, MAGIC, VERSION, ring_capacity, table_capacity, 0, chain_capacity)
+        self._ring_offset = HEADER.size
+        self._table_offset = HEADER.size + ring_capacity * TICK.size
+        self._chain_offset = self._table_offset + table_capacity * SLOT_SIZE
+        self._slots: Dict[int, int] = {}  # token: slot index
+        self.table_overflow = 0  # ticks not stored because the table was full
+        self.seq = 0
+
+    def _slot_for(self, token: int) -> Optional[int]:
+        slot = self._slots.get(token)
+        if slot is not None:
+            return slot
+        if len(self._slots) >= self.table_capacity:
+            return None
+        mask = self.table_capacity - 1
+        index = hash(token) & mask
+        while True:
+            offset = self._table_offset + index * SLOT_SIZE
+            _, existing = SLOT_PREFIX.unpack_from(self.buf, offset)
+            if existing == 0:
+                self._slots[token] = index
+                return index
+            index = (index + 1) & mask
+
+    def write(self, ticks: List[Dict[str, Any]]):
+        """Append ticks to the ring and update the last-value table"""
+        received_ts_ns = time.time_ns()
+        for tick in ticks:
+            self.seq += 1
+            fields = pack_tick(self.seq, tick, received_ts_ns)
+
+            # Ring slot; the record carries its own seq so readers can detect overwrites. The
+            # seq is cleared first and stored last, so a half written record never matches one
+            ring_offset = self._ring_offset + (self.seq % self.ring_capacity) * TICK.size
+            _SEQ.pack_into(self.buf, ring_offset, 0)
+            TICK.pack_into(self.buf, ring_offset, 0, *fields[1:])
+            _SEQ.pack_into(self.buf, ring_offset, self.seq)
+
+            # Last-value slot under a seqlock
+            token = fields[1]
+            slot = self._slot_for(token)
+            if slot is None:
+                self.table_overflow += 1
+                continue
+            slot_offset = self._table_offset + slot * SLOT_SIZE
+            version, _ = SLOT_PREFIX.unpack_from(self.buf, slot_offset)
+            SLOT_PREFIX.pack_into(self.buf, slot_offset, version + 1, token)
+            TICK.pack_into(self.buf, slot_offset + SLOT_PREFIX.size, *fields)
+            SLOT_PREFIX.pack_into(self.buf, slot_offset, version + 2, token)
+
+        # Publish after the records are in place
+        struct.pack_into("<Q", self.buf, _WRITE_SEQ_OFFSET, self.seq)
+
+    def write_chains(self, state: Dict[str, Any]):
+        """Replace the chain state; raises ValueError if it does not fit"""
+        payload = json.dumps(state, separators=(",", ":")).encode()
+        if len(payload) > self.chain_capacity:
+            raise ValueError(f"Chain state of {len(payload)} bytes exceeds the {self.chain_capacity} byte region")
+        version, _ = CHAIN_PREFIX.unpack_from(self.buf, self._chain_offset)
+        CHAIN_PREFIX.pack_into(self.buf, self._chain_offset, version + 1, 0)
+        start = self._chain_offset + CHAIN_PREFIX.size
+        self.buf[start:start + len(payload)] = payload
+        CHAIN_PREFIX.pack_into(self.buf, self._chain_offset, version + 2, len(payload))
+
+    def close(self, unlink: bool = True):
+        self.buf = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+class TickReader:
+    """Reader side of the shared tick segment, one per API worker.
+
+    On Linux the segment is mapped read-only from /dev/shm; elsewhere it is
+    attached through SharedMemory and only ever read.
+    """
+
+    def __init__(self, name: str):
+        self._shm = None
+        self._mmap = None
+        path = f"/dev/shm/{name}"
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.buf = memoryview(self._mmap)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+            self.buf = self._shm.buf
+
+        magic, version, self.ring_capacity, self.table_capacity, write_seq, self.chain_capacity = HEADER.unpack_from(self.buf, 0)
+        if magic != MAGIC or version != VERSION:
+            raise RuntimeError(f"Shared memory segment {name} is not a tick segment")
+        self._ring_offset = HEADER.size
+        self._table_offset = HEADER.size + self.ring_capacity * TICK.size
+        self._chain_offset = self._table_offset + self.table_capacity * SLOT_SIZE
+        self._chains: Optional[Dict[str, Any]] = None
+        self._chains_version = 0
+        self.next_seq = write_seq + 1  # start from live data
+        self.dropped = 0
+
+    @property
+    def write_seq(self) -> int:
+        return struct.unpack_from("<Q", self.buf, _WRITE_SEQ_OFFSET)[0]
+
+    @property
+    def lag(self) -> int:
+        """Ticks published but not yet read"""
+        return max(0, self.write_seq - self.next_seq + 1)
+
+    def read(self, max_ticks: int = 10000) -> List[Dict[str, Any]]:
+        """Return ticks published since the previous read"""
+        write_seq = self.write_seq
+        if write_seq < self.next_seq:
+            return []
+
+        # Lapped by the writer, skip what was overwritten
+        oldest = write_seq - self.ring_capacity + 1
+        if self.next_seq < oldest:
+            self.dropped += oldest - self.next_seq
+            self.next_seq = oldest
+
+        ticks = []
+        end = min(write_seq, self.next_seq + max_ticks - 1)
+        for seq in range(self.next_seq, end + 1):
+            offset = self._ring_offset + (seq % self.ring_capacity) * TICK.size
+            fields = TICK.unpack_from(self.buf, offset)
+            if fields[0] != seq or _SEQ.unpack_from(self.buf, offset)[0] != seq:
+                # Overwritten before or while we were reading
+                self.dropped += 1
+                continue
+            ticks.append(unpack_tick(fields))
+        self.next_seq = end + 1
+        return ticks
+
+    def latest(self, token: int) -> Optional[Dict[str, Any]]:
+        """Latest tick for a token from the last-value table"""
+        mask = self.table_capacity - 1
+        index = hash(token) & mask
+        for _ in range(self.table_capacity):
+            offset = self._table_offset + index * SLOT_SIZE
+            for _ in range(SEQLOCK_RETRIES):
+                version, slot_token = SLOT_PREFIX.unpack_from(self.buf, offset)
+                if slot_token == 0:
+                    return None
+                if version & 1:
+                    continue  # write in progress
+                fields = TICK.unpack_from(self.buf, offset + SLOT_PREFIX.size)
+                if SLOT_PREFIX.unpack_from(self.buf, offset)[0] == version:
+                    break
+            else:
+                return None  # the slot never settled
+            if slot_token == token:
+                return unpack_tick(fields)
+            index = (index + 1) & mask
+        return None
+
+    def chains(self) -> Optional[Dict[str, Any]]:
+        """The chain state, None until the ingestion process has written one; decoded once per version
+
+        While a new version does not settle the last one read is returned.
+        """
+        for _ in range(SEQLOCK_RETRIES):
+            version, length = CHAIN_PREFIX.unpack_from(self.buf, self._chain_offset)
+            if version == self._chains_version:
+                return self._chains
+            if version & 1:
+                continue  # write in progress
+            start = self._chain_offset + CHAIN_PREFIX.size
+            payload = bytes(self.buf[start:start + length])
+            if CHAIN_PREFIX.unpack_from(self.buf, self._chain_offset)[0] == version:
+                break
+        else:
+            return self._chains
+        self._chains = json.loads(payload) if length else None
+        self._chains_version = version
+        return self._chains
+
+    def close(self):
+        self.buf.release()
+        if self._mmap is not None:
+            self._mmap.close()
+        if self._shm is not None:
+            self._shm.close()
@@ -0,0 +1,142 @@
+from redis.asyncio import Redis
+from app.ingestion.shm import TICK, pack_tick, unpack_tick
+from typing import Any, Dict, List
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Stream entry fields: number of ticks and the concatenated TICK records
+_COUNT = b"n"
+_BATCH = b"b"
+
+
+def encode_batch(ticks: List[Dict[str, Any]], received_ts_ns: int) -> bytes:
+    """Pack ticks back to back as fixed-size TICK records"""
+    return b"".join(TICK.pack(*pack_tick(0, tick, received_ts_ns)) for tick in ticks)
+
+
+def decode_batch(data: bytes) -> List[Dict[str, Any]]:
+    return [unpack_tick(fields) for fields in TICK.iter_unpack(data)]
+
+
+def _id_ms(entry_id: bytes) -> int:
+    return int(entry_id.split(b"-", 1)[0])
+
+
+class StreamPublisher:
+    """Publishes tick batches to one Redis stream per underlying.
+
+    Each ``on_ticks`` batch becomes one stream entry per underlying, so the
+    per-entry overhead is paid once per batch rather than once per tick.
+    Streams are trimmed with an approximate ``MAXLEN`` and their names are
+    kept in a set so consumers can discover new underlyings.
+    """
+
+    def __init__(self, redis: Redis, prefix: str, maxlen: int):
+        self.redis = redis
+        self.prefix = prefix
+        self.maxlen = maxlen
+        self.underlyings: Dict[int, str] = {}  # token: underlying name
+        self._known_streams = set()
+        self.published = 0
+
+    @property
+    def index_key(self) -> str:
+        return f"{self.prefix}:streams"
+
+    def stream_for(self, token: int) -> str:
+        return f"{self.prefix}:{self.underlyings.get(token, 'OTHER')}"
+
+    async def publish(self, ticks: List[Dict[str, Any]]):
+        by_stream: Dict[str, List[Dict[str, Any]]] = {}
+        for tick in ticks:
+            by_stream.setdefault(self.stream_for(tick["instrument_token"]), []).append(tick)
+
+        received_ts_ns = time.time_ns()
+        pipe = self.redis.pipeline(transaction=False)
+        for stream, batch in by_stream.items():
+            if stream not in self._known_streams:
+                pipe.sadd(self.index_key, stream)
+                self._known_streams.add(stream)
+            pipe.xadd(
+                stream,
+                {_COUNT: len(batch), _BATCH: encode_batch(batch, received_ts_ns)},
+                maxlen=self.maxlen,
+                approximate=True,
+            )
+        await pipe.execute()
+        self.published += len(ticks)
+
+
+class StreamConsumer:
+    """Reads every underlying stream with XREAD and tracks how far behind it is.
+
+    Each worker keeps its own read position, starting at the live end of
+    the streams that exist when it starts and at the first entry of those
+    created later. ``lag_ms`` is the age of the newest entry read, and
+    ``behind`` is set while reads keep hitting the ``count`` limit.
+    """
+
+    def __init__(self, redis: Redis, prefix: str, count: int = 100):
+        self.redis = redis
+        self.prefix = prefix
+        self.count = count
+        self.positions: Dict[bytes, bytes] = {}  # stream: last id read
+        self.lag_ms: Dict[str, int] = {}
+        self.behind = False
+        self.received = 0
+        self._refreshed_at = 0.0
+
+    async def _refresh_streams(self):
+        """Pick up streams created since the last refresh
+
+        The first refresh starts every stream at its live end. A stream
+        found later was not in the index at the previous refresh, so all of
+        its entries are new and it is read from the beginning.
+        """
+        first = not self._refreshed_at
+        streams = await self.redis.smembers(f"{self.prefix}:streams")
+        for stream in streams:
+            if stream in self.positions:
+                continue
+            last = await self.redis.xrevrange(stream, count=1) if first else None
+            self.positions[stream] = last[0][0] if last else b"0-0"
+        self._refreshed_at = time.monotonic()
+
+    async def read(self, block_ms: int) -> List[Dict[str, Any]]:
+        if time.monotonic() - self._refreshed_at > 5 or not self.positions:
+            await self._refresh_streams()
+        if not self.positions:
+            # Nothing published yet
+            await asyncio.sleep(block_ms / 1000)
+            return []
+
+        response = await self.redis.xread(self.positions, count=self.count, block=block_ms)
+        ticks: List[Dict[str, Any]] = []
+        now_ms = int(time.time() * 1000)
+        self.behind = False
+        for stream, entries in response or []:
+            if len(entries) >= self.count:
+                self.behind = True
+            for entry_id, fields in entries:
+                ticks.extend(decode_batch(fields[_BATCH]))
+                self.positions[stream] = entry_id
+            if entries:
+                self.lag_ms[stream.decode()] = now_ms - _id_ms(entries[-1][0])
+        self.received += len(ticks)
+        return ticks
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "streams": len(self.positions),
+            "received": self.received,
+            "behind": self.behind,
+            "lag_ms": dict(self.lag_ms),
+        }
+
+
+def redis_binary(url: str) -> Redis:
+    """Client for stream traffic; tick batches are raw bytes"""
+    return Redis.from_url(url, decode_responses=False)
@@ -3,6 +3,8 @@ from fastapi.middleware.cors import CORSMiddleware
 from app.api.v1.api import api_router
 from app.core.config import settings
 from app.core.redis import init_redis, close_redis
+from app.services.market_data_service import MarketDataService
+from app.services.partition_manager import PartitionManager
 import logging
 
 # Set up logging
@@ -36,6 +38,8 @@ def create_app() -> FastAPI:
     # Add routes
     app.include_router(api_router, prefix="/api/v1")
 
+    partitions = PartitionManager.from_settings()
+
     @app.middleware("http")
     async def log_requests(request: Request, call_next):
         logger.debug(f"Request: {request.method} {request.url}")
@@ -51,6 +55,10 @@ def create_app() -> FastAPI:
             # Initialize Redis
             await init_redis()
             logger.info("Redis initialized successfully")
+
+            # Create upcoming daily partitions and expire old ones, now and then periodically
+            if settings.PARTITION_MAINTENANCE_ENABLED:
+                partitions.start()
         except Exception as e:
             logger.error(f"Error during startup: {str(e)}")
             raise
@@ -60,6 +68,12 @@ def create_app() -> FastAPI:
         """Clean up connections on shutdown"""
         logger.info("Shutting down application...")
         try:
+            partitions.stop()
+
+            # Write out ticks still queued for the database
+            await MarketDataService().stop()
+            logger.info("Market data writer stopped")
+
             # Close Redis connection
             await close_redis()
             logger.info("Redis connection closed")
@@ -77,5 +91,6 @@ if __name__ == "__main__":
         host="0.0.0.0",
         port=8000,
         reload=True,
-        log_level="debug"
+        log_level="debug",
+        ws_per_message_deflate=settings.WS_PER_MESSAGE_DEFLATE,
     )
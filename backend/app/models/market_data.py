@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Index, Enum, Boolean, JSON, Table
-from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy import Column, Integer, BigInteger, String, Float, DateTime, Interval, ForeignKey, Index, Enum, Boolean, JSON, Table
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, REAL
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
@@ -57,6 +57,7 @@ class TickData(Base):
 
     __table_args__ = (
         Index('tick_data_instrument_token_timestamp_idx', 'instrument_token', 'timestamp', unique=True),
+        {'postgresql_partition_by': 'RANGE (timestamp)'},  # daily partitions, see PartitionManager
     )
 
 class MarketDepth(Base):
@@ -72,6 +73,28 @@ class MarketDepth(Base):
 
     __table_args__ = (
         Index('market_depth_instrument_token_timestamp_idx', 'instrument_token', 'timestamp', unique=True),
+        {'postgresql_partition_by': 'RANGE (timestamp)'},
+    )
+
+# Market depth in the columnar layout (DEPTH_STORAGE=columnar), see app.core.depth_codec
+class MarketDepthLevels(Base):
+    __tablename__ = "market_depth_levels"
+
+    instrument_token = Column(Integer, ForeignKey("instruments.instrument_token"), primary_key=True, nullable=False)
+    timestamp = Column(DateTime(timezone=True), primary_key=True, nullable=False)
+    bid_price = Column(ARRAY(REAL))
+    bid_quantity = Column(ARRAY(Integer))
+    bid_orders = Column(ARRAY(Integer))
+    ask_price = Column(ARRAY(REAL))
+    ask_quantity = Column(ARRAY(Integer))
+    ask_orders = Column(ARRAY(Integer))
+    created_at = Column(DateTime(timezone=True), default=datetime.now)
+
+    instrument = relationship("Instrument")
+
+    __table_args__ = (
+        Index('market_depth_levels_instrument_token_timestamp_idx', 'instrument_token', 'timestamp', unique=True),
+        {'postgresql_partition_by': 'RANGE (timestamp)'},
     )
 
 class OHLCV(Base):
@@ -118,4 +141,37 @@ class OptionsChain(Base):
     __table_args__ = (
         Index('options_chain_underlying_expiry_strike_option_type_timestamp_idx', 
               'underlying', 'expiry', 'strike', 'option_type', 'timestamp', unique=True),
+        {'postgresql_partition_by': 'RANGE (timestamp)'},
+    )
+
+class GapType(str, enum.Enum):
+    TICK = "TICK"
+    MARKET_DEPTH = "MARKET_DEPTH"
+    VIX = "VIX"
+
+class RecoveryStatus(str, enum.Enum):
+    PENDING = "PENDING"
+    IN_PROGRESS = "IN_PROGRESS"
+    RECOVERED = "RECOVERED"
+    FAILED = "FAILED"
+
+class DataGap(Base):
+    __tablename__ = "data_gaps"
+
+    gap_id = Column(Integer, primary_key=True, autoincrement=True)
+    instrument_token = Column(BigInteger, nullable=False)
+    start_time = Column(DateTime(timezone=True), nullable=False)
+    end_time = Column(DateTime(timezone=True), nullable=False)
+    gap_duration = Column(Interval, nullable=False)
+    gap_type = Column(String(20), nullable=False)  # GapType
+    recovery_status = Column(String(20), nullable=False)  # RecoveryStatus
+    recovery_method = Column(String(50))  # 'HISTORICAL_API', 'INTERPOLATION', 'MANUAL'
+    recovery_attempts = Column(Integer, default=0)
+    last_attempt_time = Column(DateTime(timezone=True))
+    created_at = Column(DateTime(timezone=True), default=datetime.now)
+    updated_at = Column(DateTime(timezone=True), default=datetime.now, onupdate=datetime.now)
+
+    __table_args__ = (
+        Index('idx_data_gaps_instrument', 'instrument_token'),
+        Index('idx_data_gaps_time', 'start_time', 'end_time'),
     )
@@ -0,0 +1,95 @@
+"""Bulk loading of time-series rows with Postgres COPY.
+
+A multi-VALUES ``INSERT`` carries one bind parameter per column per row,
+which Postgres caps at 65535 per statement, and SQLAlchemy has to compile
+the whole statement for every batch. asyncpg's ``copy_records_to_table``
+streams the rows in the binary COPY format instead. COPY has no
+``ON CONFLICT``, so when a batch may repeat rows already stored (a
+reconnect replaying ticks, a replay run) it is copied into a per-session
+staging table and moved across with one set-based ``INSERT ... SELECT``.
+"""
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+from datetime import datetime
+from app.core.depth_codec import levels_to_dicts, to_columns
+from app.core.encoding import dumps
+
+TICK_COLUMNS = (
+    "instrument_token", "timestamp", "last_price", "last_quantity", "average_price", "volume",
+    "buy_quantity", "sell_quantity", "open", "high", "low", "close", "change", "created_at",
+)
+DEPTH_COLUMNS = ("instrument_token", "timestamp", "depth_buy", "depth_sell", "created_at")
+DEPTH_LEVELS_COLUMNS = (
+    "instrument_token", "timestamp", "bid_price", "bid_quantity", "bid_orders",
+    "ask_price", "ask_quantity", "ask_orders", "created_at",
+)
+
+
+def tick_records(rows: Iterable[Dict[str, Any]], created_at: datetime) -> List[Tuple[Any, ...]]:
+    """``tick_data`` rows as COPY records in ``TICK_COLUMNS`` order"""
+    return [
+        (
+            row["instrument_token"], row["timestamp"], row["last_price"], row.get("last_quantity"),
+            row.get("average_price"), row.get("volume"), row.get("buy_quantity"), row.get("sell_quantity"),
+            row.get("open"), row.get("high"), row.get("low"), row.get("close"), row.get("change"), created_at,
+        )
+        for row in rows
+    ]
+
+
+def depth_records(rows: Iterable[Dict[str, Any]], created_at: datetime) -> List[Tuple[Any, ...]]:
+    """``market_depth`` rows as COPY records in ``DEPTH_COLUMNS`` order; jsonb goes over as text
+
+    Depth rows carry each side as ``(price, quantity, orders)`` level tuples.
+    """
+    return [
+        (
+            row["instrument_token"], row["timestamp"],
+            dumps(levels_to_dicts(row["depth_buy"])), dumps(levels_to_dicts(row["depth_sell"])), created_at,
+        )
+        for row in rows
+    ]
+
+
+def depth_levels_records(rows: Iterable[Dict[str, Any]], created_at: datetime) -> List[Tuple[Any, ...]]:
+    """``market_depth_levels`` rows as COPY records in ``DEPTH_LEVELS_COLUMNS`` order"""
+    return [
+        (row["instrument_token"], row["timestamp"], *to_columns(row["depth_buy"]), *to_columns(row["depth_sell"]), created_at)
+        for row in rows
+    ]
+
+
+async def driver_connection(session) -> Any:
+    """The asyncpg connection behind an ``AsyncSession``, inside the session's transaction"""
+    connection = await session.connection()
+    raw = await connection.get_raw_connection()
+    return raw.driver_connection
+
+
+async def copy_rows(
+    conn,
+    table: str,
+    columns: Sequence[str],
+    records: List[Tuple[Any, ...]],
+    dedupe: bool = True,
+) -> None:
+    """COPY records into ``table``, skipping rows that collide with a unique key if ``dedupe``
+
+    Runs in the caller's transaction. The staging table is a temporary one,
+    private to the connection, and emptied after every move.
+    """
+    if not records:
+        return
+    if not dedupe:
+        await conn.copy_records_to_table(table, records=records, columns=list(columns))
+        return
+    staging = f"{table}_staging"
+    # Temporary tables are never WAL-logged; created once per connection
+    await conn.execute(
+        f"CREATE TEMP TABLE IF NOT EXISTS {staging} (LIKE {table} INCLUDING DEFAULTS)"
+    )
+    await conn.copy_records_to_table(staging, records=records, columns=list(columns))
+    column_list = ", ".join(columns)
+    await conn.execute(
+        f"INSERT INTO {table} ({column_list}) SELECT {column_list} FROM {staging} ON CONFLICT DO NOTHING"
+    )
+    await conn.execute(f"TRUNCATE {staging}")
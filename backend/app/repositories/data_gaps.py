@@ -0,0 +1,62 @@
+from typing import List, Optional
+from datetime import datetime
+from sqlalchemy import select, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.market_data import DataGap, GapType, RecoveryStatus
+import logging
+
+logger = logging.getLogger(__name__)
+
+class DataGapRepository:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def record_gap(
+        self,
+        instrument_token: int,
+        start_time: datetime,
+        end_time: datetime,
+        gap_type: GapType = GapType.TICK
+    ) -> DataGap:
+        """Insert a new pending gap."""
+        gap = DataGap(
+            instrument_token=instrument_token,
+            start_time=start_time,
+            end_time=end_time,
+            gap_duration=end_time - start_time,
+            gap_type=gap_type.value,
+            recovery_status=RecoveryStatus.PENDING.value,
+            recovery_attempts=0,
+        )
+        self.session.add(gap)
+        await self.session.commit()
+        return gap
+
+    async def get_gap(self, gap_id: int) -> Optional[DataGap]:
+        return await self.session.get(DataGap, gap_id)
+
+    async def get_unrecovered_gaps(self, max_attempts: int, limit: int = 100) -> List[DataGap]:
+        """Pending or failed gaps that still have attempts left, oldest first."""
+        query = (
+            select(DataGap)
+            .where(
+                and_(
+                    DataGap.recovery_status.in_([RecoveryStatus.PENDING.value, RecoveryStatus.FAILED.value]),
+                    DataGap.recovery_attempts < max_attempts
+                )
+            )
+            .order_by(DataGap.start_time)
+            .limit(limit)
+        )
+        result = await self.session.execute(query)
+        return result.scalars().all()
+
+    async def mark_attempt(self, gap: DataGap, status: RecoveryStatus, method: Optional[str] = None) -> None:
+        """Update recovery status; IN_PROGRESS counts as an attempt."""
+        gap.recovery_status = status.value
+        if method:
+            gap.recovery_method = method
+        if status == RecoveryStatus.IN_PROGRESS:
+            gap.recovery_attempts = (gap.recovery_attempts or 0) + 1
+            gap.last_attempt_time = datetime.now()
+        await self.session.commit()
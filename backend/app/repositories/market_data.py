@@ -1,78 +1,81 @@
 from typing import List, Optional, Dict, Any
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from sqlalchemy import select, and_, func
 from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.models.market_data import Instrument, TickData, MarketDepth, OHLCV
+from app.core.depth_codec import from_columns
+from app.models.market_data import Instrument, TickData, MarketDepth, MarketDepthLevels, OHLCV
 from app.repositories.base import BaseRepository
+from app.repositories.bulk_load import (
+    DEPTH_COLUMNS, DEPTH_LEVELS_COLUMNS, TICK_COLUMNS,
+    copy_rows, depth_levels_records, depth_records, driver_connection, tick_records
+)
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Window searched first for an instrument's newest row, covering the latest daily partitions
+LATEST_LOOKBACK = timedelta(days=2)
+
 class MarketDataRepository:
-    def __init__(self, session: AsyncSession):
+    def __init__(self, session: AsyncSession, depth_storage: str = "jsonb"):
         self.session = session
-        self.tick_batch: List[Dict[str, Any]] = []
-        self.depth_batch: List[Dict[str, Any]] = []
-        self.batch_size = 1000  # Maximum number of records to batch before writing
-        self.max_batch_age = timedelta(seconds=1)  # Maximum age of batch before writing
-        self.last_batch_time = datetime.utcnow()
-
-    async def add_tick(self, tick_data: Dict[str, Any]) -> None:
-        """Add tick data to batch."""
-        self.tick_batch.append(tick_data)
-        await self._check_batch()
-
-    async def add_market_depth(self, depth_data: Dict[str, Any]) -> None:
-        """Add market depth data to batch."""
-        self.depth_batch.append(depth_data)
-        await self._check_batch()
-
-    async def _check_batch(self) -> None:
-        """Check if batch should be written to database."""
-        current_time = datetime.utcnow()
-        batch_age = current_time - self.last_batch_time
-        
-        if (len(self.tick_batch) >= self.batch_size or 
-            len(self.depth_batch) >= self.batch_size or
-            batch_age >= self.max_batch_age):
-            await self._write_batch()
-
-    async def _write_batch(self) -> None:
-        """Write batched data to database."""
-        try:
-            if self.tick_batch:
-                # Insert tick data
-                stmt = insert(TickData).values(self.tick_batch)
-                stmt = stmt.on_conflict_do_nothing()  # Skip duplicates
-                await self.session.execute(stmt)
-                self.tick_batch = []
-
-            if self.depth_batch:
-                # Insert market depth data
-                stmt = insert(MarketDepth).values(self.depth_batch)
-                stmt = stmt.on_conflict_do_nothing()  # Skip duplicates
-                await self.session.execute(stmt)
-                self.depth_batch = []
+        self.depth_storage = depth_storage  # "jsonb" (market_depth) or "columnar" (market_depth_levels)
+
+    async def write_batch(
+        self,
+        ticks: List[Dict[str, Any]],
+        depth: List[Dict[str, Any]],
+        dedupe: bool = True
+    ) -> None:
+        """Write a batch of tick and market depth rows in one transaction with COPY.
 
+        Depth rows carry each side as ``(price, quantity, orders)`` level
+        tuples. With ``dedupe`` rows already stored are skipped, otherwise a
+        duplicate fails the whole batch. Batching and flush timing belong
+        to ``TickBatchWriter``, which calls this from its background task.
+        """
+        try:
+            conn = await driver_connection(self.session)
+            created_at = datetime.now()
+            await copy_rows(conn, TickData.__tablename__, TICK_COLUMNS, tick_records(ticks, created_at), dedupe)
+            if self.depth_storage == "columnar":
+                await copy_rows(
+                    conn, MarketDepthLevels.__tablename__, DEPTH_LEVELS_COLUMNS,
+                    depth_levels_records(depth, created_at), dedupe
+                )
+            else:
+                await copy_rows(conn, MarketDepth.__tablename__, DEPTH_COLUMNS, depth_records(depth, created_at), dedupe)
             await self.session.commit()
-            self.last_batch_time = datetime.utcnow()
-            
+
         except Exception as e:
             logger.error(f"Error writing batch: {e}")
             await self.session.rollback()
             raise
 
+    async def _latest(self, model, instrument_token: int):
+        """Newest row of a daily partitioned table for an instrument.
+
+        A bare ORDER BY timestamp DESC LIMIT 1 probes the index of every
+        partition, so it slows down as history grows. The recent window is
+        tried first so only the latest partitions are read; the unbounded
+        query only runs for instruments that have not ticked in that window.
+        """
+        since = datetime.now(timezone.utc) - LATEST_LOOKBACK
+        for lower in (since, None):
+            query = select(model).where(model.instrument_token == instrument_token)
+            if lower is not None:
+                query = query.where(model.timestamp >= lower)
+            query = query.order_by(model.timestamp.desc()).limit(1)
+            result = await self.session.execute(query)
+            row = result.scalars().first()
+            if row is not None:
+                return row
+        return None
+
     async def get_latest_tick(self, instrument_token: int) -> Optional[TickData]:
         """Get the latest tick for an instrument."""
-        query = (
-            select(TickData)
-            .where(TickData.instrument_token == instrument_token)
-            .order_by(TickData.timestamp.desc())
-            .limit(1)
-        )
-        result = await self.session.execute(query)
-        return result.scalars().first()
+        return await self._latest(TickData, instrument_token)
 
     async def get_ticks(
         self,
@@ -80,7 +83,11 @@ class MarketDataRepository:
         from_time: datetime,
         to_time: datetime
     ) -> List[TickData]:
-        """Get tick data for an instrument within a time range."""
+        """Get tick data for an instrument within a time range.
+
+        The range bounds the partition key, so only the partitions of the
+        days in range are scanned.
+        """
         query = (
             select(TickData)
             .where(
@@ -95,16 +102,20 @@ class MarketDataRepository:
         result = await self.session.execute(query)
         return result.scalars().all()
 
-    async def get_latest_depth(self, instrument_token: int) -> Optional[MarketDepth]:
-        """Get the latest market depth for an instrument."""
-        query = (
-            select(MarketDepth)
-            .where(MarketDepth.instrument_token == instrument_token)
-            .order_by(MarketDepth.timestamp.desc())
-            .limit(1)
-        )
-        result = await self.session.execute(query)
-        return result.scalars().first()
+    async def get_latest_depth(self, instrument_token: int) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+        """Get the latest market depth for an instrument in the ``MarketDepth`` schema shape."""
+        if self.depth_storage == "columnar":
+            row = await self._latest(MarketDepthLevels, instrument_token)
+            if row is None:
+                return None
+            return {
+                "buy": from_columns(row.bid_price, row.bid_quantity, row.bid_orders),
+                "sell": from_columns(row.ask_price, row.ask_quantity, row.ask_orders),
+            }
+        row = await self._latest(MarketDepth, instrument_token)
+        if row is None:
+            return None
+        return {"buy": row.depth_buy or [], "sell": row.depth_sell or []}
 
     async def calculate_ohlcv(
         self,
@@ -171,3 +182,21 @@ class MarketDataRepository:
             self.session.add(ohlcv)
 
         await self.session.commit()
+
+    async def upsert_ohlcv(self, rows: List[Dict[str, Any]]) -> None:
+        """Insert or replace OHLCV candles, e.g. backfilled from the historical API."""
+        if not rows:
+            return
+        stmt = insert(OHLCV).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['instrument_token', 'interval', 'timestamp'],
+            set_={
+                'open': stmt.excluded.open,
+                'high': stmt.excluded.high,
+                'low': stmt.excluded.low,
+                'close': stmt.excluded.close,
+                'volume': stmt.excluded.volume,
+            }
+        )
+        await self.session.execute(stmt)
+        await self.session.commit()
@@ -0,0 +1,169 @@
+from typing import Any, Callable, Dict, List, Optional, Protocol
+from datetime import datetime, timedelta
+import asyncio
+import logging
+from app.core.config import settings
+from app.core.gaps import IST, Gap, GapDetector
+from app.db.session import AsyncSessionLocal
+from app.models.market_data import RecoveryStatus
+from app.repositories.data_gaps import DataGapRepository
+from app.repositories.market_data import MarketDataRepository
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_INTERVAL = "minute"  # Kite historical interval
+OHLCV_INTERVAL = "1min"  # interval name used in the ohlcv table
+
+
+class HistoricalClient(Protocol):
+    """Anything shaped like ``KiteConnect.historical_data``; swap in a stand-in for offline runs"""
+
+    def historical_data(self, instrument_token: int, from_date: datetime, to_date: datetime,
+                        interval: str) -> List[Dict[str, Any]]:
+        ...
+
+
+class BackfillService:
+    """Records detected data gaps and backfills them with minute candles.
+
+    Gaps are written to ``data_gaps`` as PENDING, then fetched from the
+    historical API with at most ``concurrency`` requests in flight, merged
+    into ``ohlcv`` and marked RECOVERED (or FAILED, to be retried up to
+    ``max_attempts`` times by ``retry_unrecovered``). Every
+    ``stall_check_interval`` seconds tokens silent for ``stall_seconds``
+    are recorded as gaps too, since a stalled token sends no tick that
+    could reveal its gap; 0 turns the check off.
+    """
+
+    def __init__(
+        self,
+        historical: HistoricalClient,
+        session_factory: Callable = AsyncSessionLocal,
+        concurrency: int = 3,
+        max_attempts: int = 3,
+        min_gap_seconds: float = 5.0,
+        stall_seconds: float = 60.0,
+        stall_check_interval: float = 10.0,
+    ):
+        self.historical = historical
+        self.session_factory = session_factory
+        self.max_attempts = max_attempts
+        self.detector = GapDetector(self._on_gap, min_gap_seconds)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.stall_seconds = stall_seconds
+        self.stall_check_interval = stall_check_interval
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stall_watch = None  # concurrent Future of the stall check task
+        self.recovered = 0
+        self.failed = 0
+
+    @classmethod
+    def from_settings(cls, historical: HistoricalClient) -> "BackfillService":
+        return cls(
+            historical,
+            concurrency=settings.GAP_BACKFILL_CONCURRENCY,
+            max_attempts=settings.GAP_BACKFILL_MAX_ATTEMPTS,
+            min_gap_seconds=settings.GAP_MIN_SECONDS,
+            stall_seconds=settings.GAP_STALL_SECONDS,
+            stall_check_interval=settings.GAP_STALL_CHECK_SECONDS,
+        )
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """Bind to the server loop; detection runs on ticker threads, backfill and stall checks on the loop"""
+        self._loop = loop
+        if self.stall_seconds and self.stall_check_interval and self._stall_watch is None:
+            self._stall_watch = asyncio.run_coroutine_threadsafe(self._watch_stalls(), loop)
+
+    def stop(self):
+        if self._stall_watch is not None:
+            self._stall_watch.cancel()
+            self._stall_watch = None
+
+    async def _watch_stalls(self):
+        while True:
+            await asyncio.sleep(self.stall_check_interval)
+            try:
+                # Gaps go through _on_gap, so they are recorded and backfilled like any other
+                self.detector.check_stalls(self.stall_seconds)
+            except Exception as e:
+                logger.error(f"Error checking for stalled tokens: {e}")
+
+    def observe(self, ticks: List[Dict[str, Any]]):
+        self.detector.observe(ticks)
+
+    def disconnected(self, tokens: List[int]):
+        self.detector.disconnected(tokens)
+
+    def _on_gap(self, gap: Gap):
+        if self._loop and not self._loop.is_closed():
+            asyncio.run_coroutine_threadsafe(self.handle_gap(gap), self._loop)
+
+    async def handle_gap(self, gap: Gap):
+        """Record a gap and backfill it"""
+        try:
+            async with self.session_factory() as session:
+                record = await DataGapRepository(session).record_gap(
+                    gap.instrument_token, gap.start_time, gap.end_time
+                )
+                gap_id = record.gap_id
+            await self.backfill(gap_id)
+        except Exception as e:
+            logger.error(f"Error recording data gap for {gap.instrument_token}: {e}")
+
+    async def backfill(self, gap_id: int) -> bool:
+        """Fetch minute candles covering a gap and merge them into OHLCV"""
+        async with self._semaphore:
+            async with self.session_factory() as session:
+                gaps = DataGapRepository(session)
+                gap = await gaps.get_gap(gap_id)
+                if gap is None:
+                    return False
+                await gaps.mark_attempt(gap, RecoveryStatus.IN_PROGRESS, "HISTORICAL_API")
+                try:
+                    # Whole minutes: the candle the gap starts in through the one it ends in. Stored
+                    # bounds come back in UTC; the historical API reads its dates as IST wall time
+                    from_date = gap.start_time.astimezone(IST).replace(second=0, microsecond=0)
+                    to_date = gap.end_time.astimezone(IST).replace(second=0, microsecond=0) + timedelta(minutes=1)
+                    loop = asyncio.get_running_loop()
+                    candles = await loop.run_in_executor(
+                        None, self.historical.historical_data,
+                        gap.instrument_token, from_date, to_date, BACKFILL_INTERVAL,
+                    )
+                    rows = [
+                        {
+                            "instrument_token": gap.instrument_token,
+                            "timestamp": candle["date"],
+                            "interval": OHLCV_INTERVAL,
+                            "open": candle["open"],
+                            "high": candle["high"],
+                            "low": candle["low"],
+                            "close": candle["close"],
+                            "volume": candle["volume"],
+                        }
+                        for candle in candles
+                    ]
+                    await MarketDataRepository(session).upsert_ohlcv(rows)
+                    await gaps.mark_attempt(gap, RecoveryStatus.RECOVERED)
+                    self.recovered += 1
+                    logger.info(f"Backfilled gap {gap_id} for {gap.instrument_token} with {len(rows)} candles")
+                    return True
+                except Exception as e:
+                    await session.rollback()
+                    await gaps.mark_attempt(gap, RecoveryStatus.FAILED)
+                    self.failed += 1
+                    logger.error(f"Error backfilling gap {gap_id}: {e}")
+                    return False
+
+    async def retry_unrecovered(self) -> int:
+        """Retry pending and failed gaps, e.g. after a restart; returns how many recovered"""
+        async with self.session_factory() as session:
+            gap_ids = [gap.gap_id for gap in await DataGapRepository(session).get_unrecovered_gaps(self.max_attempts)]
+        results = await asyncio.gather(*(self.backfill(gap_id) for gap_id in gap_ids))
+        return sum(results)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "detected": self.detector.gaps,
+            "recovered": self.recovered,
+            "failed": self.failed,
+        }
@@ -0,0 +1,138 @@
+from typing import Any, Dict, List, Optional, Set, Tuple
+import asyncio
+import logging
+from app.core.subscriptions import MODE_FULL
+from app.services.kite_service import KiteService
+
+logger = logging.getLogger(__name__)
+
+# (underlying, expiry, strikes either side of ATM or None for the full chain)
+TopicKey = Tuple[str, str, Optional[int]]
+
+# (market data field, option chain field) kept current in the shared chain
+_CHAIN_FIELDS = (("last_price", "ltp"), ("change", "change"), ("volume", "volume"), ("oi", "oi"))
+
+
+class ChainTopic:
+    """One option chain channel shared by every viewer of the same key"""
+
+    def __init__(self, key: TopicKey, chain: Dict[str, Any]):
+        self.key = key
+        self.id = "topic:" + ":".join(str(part) for part in key)  # subscription registry client id
+        self.chain = chain
+        self.viewers: Set[str] = set()
+        self._options: Dict[int, Dict[str, Any]] = {}  # token: option entry inside chain
+        for strike in chain["strikes"]:
+            for side in ("call", "put"):
+                option = strike.get(side)
+                if option:
+                    self._options[option["instrument_token"]] = option
+        self.token_set = frozenset(self._options)
+
+    @property
+    def tokens(self) -> List[int]:
+        return list(self._options)
+
+    def apply(self, delta: Dict[str, Any]):
+        """Fold a market data delta into the chain, so new viewers get a current snapshot"""
+        option = self._options.get(delta.get("instrument_token"))
+        if option is None:
+            return
+        for field, chain_field in _CHAIN_FIELDS:
+            if field in delta:
+                option[chain_field] = delta[field]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """The live chain; serialise it before yielding to the loop"""
+        return self.chain
+
+
+class ChainTopics:
+    """Reference-counted option chain topics.
+
+    The first viewer of a key builds the chain and subscribes its tokens
+    upstream under the topic's id; later viewers share both, and viewers
+    arriving while the chain is being built wait for the same build. When
+    the last viewer leaves the topic is dropped and its tokens are
+    unsubscribed upstream, unless some client still holds them itself.
+    """
+
+    def __init__(self, kite_service: KiteService):
+        self.kite_service = kite_service
+        self.topics: Dict[TopicKey, ChainTopic] = {}
+        self._by_id: Dict[str, ChainTopic] = {}
+        self._building: Dict[TopicKey, asyncio.Future] = {}
+        self._joining: Dict[TopicKey, int] = {}  # viewers waiting for a build, not yet in viewers
+        self.builds = 0
+
+    async def join(self, client_id: str, key: TopicKey) -> ChainTopic:
+        topic = self.topics.get(key)
+        if topic is None:
+            building = self._building.get(key)
+            if building is None:
+                building = self._building[key] = asyncio.ensure_future(self._build(key))
+                building.add_done_callback(lambda _: self._building.pop(key, None))
+            self._joining[key] = self._joining.get(key, 0) + 1
+            try:
+                topic = await asyncio.shield(building)
+            except asyncio.CancelledError:
+                # The build goes on for other waiters; drop it if nobody is left
+                self._left_join(key)
+                building.add_done_callback(lambda _: self._drop_if_unwatched(key))
+                raise
+            except Exception:
+                self._left_join(key)
+                raise
+            self._left_join(key)
+        topic.viewers.add(client_id)
+        return topic
+
+    def _left_join(self, key: TopicKey):
+        remaining = self._joining.pop(key) - 1
+        if remaining:
+            self._joining[key] = remaining
+
+    async def _build(self, key: TopicKey) -> ChainTopic:
+        symbol, expiry, window = key
+        chain = await self.kite_service.get_option_chain(symbol, expiry, window)
+        topic = ChainTopic(key, chain)
+        self.topics[key] = topic
+        self._by_id[topic.id] = topic
+        self.kite_service.subscribe(topic.tokens, mode=MODE_FULL, client_id=topic.id)
+        self.builds += 1
+        logger.info(f"Built chain topic {topic.id} with {len(topic.tokens)} instruments")
+        return topic
+
+    def leave(self, client_id: str, key: TopicKey) -> bool:
+        """Remove a viewer; True if that was the last one and the topic is gone"""
+        topic = self.topics.get(key)
+        if topic is None:
+            return True
+        topic.viewers.discard(client_id)
+        return self._drop_if_unwatched(key)
+
+    def _drop_if_unwatched(self, key: TopicKey) -> bool:
+        topic = self.topics.get(key)
+        if topic is None:
+            return True
+        # Waiters of the build still count; they join once the loop resumes them
+        if topic.viewers or self._joining.get(key):
+            return False
+        del self.topics[key]
+        del self._by_id[topic.id]
+        self.kite_service.remove_client(topic.id)
+        logger.info(f"Dropped chain topic {topic.id}")
+        return True
+
+    def get(self, subscriber_id: str) -> Optional[ChainTopic]:
+        """The topic behind a subscription registry client id, if it is one"""
+        return self._by_id.get(subscriber_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "builds": self.builds,
+            "topics": {
+                topic.id: {"viewers": len(topic.viewers), "instruments": len(topic.tokens)}
+                for topic in self.topics.values()
+            },
+        }
@@ -1,7 +1,16 @@
-from kiteconnect import KiteConnect, KiteTicker
+from kiteconnect import KiteConnect
 from app.core.config import settings
+from app.core.ticker_pool import TickerPool
+from app.core.subscriptions import SubscriptionRegistry, MODE_FULL, MODE_NAMES, parse_mode
+from app.core.redis import get_redis
+from app.ingestion.recording import TickCapture
+from app.ingestion.shm import TickReader
+from app.ingestion.streams import StreamConsumer, redis_binary
+from app.services.backfill_service import BackfillService
 import logging
 import json
+import os
+import socket
 from typing import Callable, Dict, List, Optional
 import asyncio
 from datetime import datetime
@@ -9,12 +18,31 @@ from datetime import datetime
 logger = logging.getLogger(__name__)
 
 class KiteService:
+    # (our field, KiteTicker field) sent only when present in the tick
+    _OPTIONAL_FIELDS = (
+        ("last_quantity", "last_traded_quantity"),
+        ("average_price", "average_traded_price"),
+        ("buy_quantity", "total_buy_quantity"),
+        ("sell_quantity", "total_sell_quantity"),
+        ("ohlc", "ohlc"),
+        ("depth", "depth"),
+    )
+
     _instance = None
     _kite: Optional[KiteConnect] = None
-    _ticker: Optional[KiteTicker] = None
+    _pool: Optional[TickerPool] = None
+    _capture: Optional[TickCapture] = None
+    _backfill: Optional[BackfillService] = None
+    _loop: Optional[asyncio.AbstractEventLoop] = None
     _access_token: Optional[str] = None
     _callbacks: List[Callable] = []
-    _subscribed_tokens: Dict[int, bool] = {}
+    _frame_callbacks: List[Callable] = []  # raw Kite frames, called on the server loop
+    _registry: Optional[SubscriptionRegistry] = None
+    # INGEST_MODE=shm/stream: ticks come from the ingestion process instead of a local pool
+    _reader: Optional[TickReader] = None
+    _consumer: Optional[StreamConsumer] = None
+    _reader_task: Optional[asyncio.Task] = None
+    _worker_id = f"{socket.gethostname()}:{os.getpid()}"
 
     def __new__(cls):
         if cls._instance is None:
@@ -25,121 +53,331 @@ class KiteService:
         if not self._kite:
             self._kite = KiteConnect(api_key=settings.KITE_API_KEY)
             logger.info("KiteConnect instance initialized")
+        if not self._registry:
+            self._registry = SubscriptionRegistry(
+                on_subscribe=self._upstream_subscribe,
+                on_unsubscribe=self._upstream_unsubscribe,
+                debounce=settings.WS_SUBSCRIPTION_DEBOUNCE_MS / 1000,
+            )
 
     def set_access_token(self, access_token: str):
-        """Set the access token for both KiteConnect and KiteTicker"""
+        """Set the access token for KiteConnect and (re)start the ticker pool"""
+        # Ticker callbacks fire on the KiteTicker thread, remember the server loop
+        try:
+            self._loop = asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+
+        if self._external_ingest:
+            self._start_ingest_reader()
+            if access_token != self._access_token:
+                self._access_token = access_token
+                self._kite.set_access_token(access_token)
+                self._publish_token()
+            return
+
+        # Every websocket client sets the token, keep the pool if it is unchanged
+        if self._pool and access_token == self._access_token:
+            return
+
         self._access_token = access_token
         self._kite.set_access_token(access_token)
-        
-        # Initialize ticker with the new access token
-        if self._ticker:
-            self._ticker.close()
-        
-        self._ticker = KiteTicker(settings.KITE_API_KEY, access_token)
-        self._setup_ticker()
-        logger.info("Access token set and ticker initialized")
-
-    def _setup_ticker(self):
-        """Set up WebSocket ticker event handlers"""
-        if not self._ticker:
-            return
 
-        @self._ticker.on_connect
-        def on_connect():
-            logger.info("Ticker connected")
-            # Resubscribe to tokens after reconnection
-            if self._subscribed_tokens:
-                tokens = list(self._subscribed_tokens.keys())
-                self._ticker.subscribe(tokens)
-                self._ticker.set_mode(self._ticker.MODE_FULL, tokens)
-                logger.info(f"Resubscribed to tokens: {tokens}")
-
-        @self._ticker.on_close
-        def on_close():
-            logger.info("Ticker connection closed")
-
-        @self._ticker.on_error
-        def on_error(error):
-            logger.error(f"Ticker error: {error}")
-
-        @self._ticker.on_message
-        def on_message(ws, data):
-            try:
-                # Process the tick data
-                if isinstance(data, dict):
-                    self._process_tick(data)
-                elif isinstance(data, list):
-                    for tick in data:
-                        self._process_tick(tick)
-            except Exception as e:
-                logger.error(f"Error processing ticker message: {e}")
+        # Initialize ticker pool with the new access token
+        if self._pool:
+            self._pool.close()
+
+        if settings.GAP_DETECTION_ENABLED and not self._backfill and self._loop:
+            self._backfill = BackfillService.from_settings(self._kite)
+            self._backfill.start(self._loop)
+            self._loop.create_task(self._backfill.retry_unrecovered())
+
+        if settings.TICK_CAPTURE_DIR and not self._capture:
+            self._capture = TickCapture(
+                settings.TICK_CAPTURE_DIR,
+                settings.TICK_CAPTURE_SEGMENT_MB * 1024 * 1024,
+                settings.TICK_CAPTURE_INDEX_INTERVAL_MS,
+            )
+            logger.info(f"Capturing ticker frames to {settings.TICK_CAPTURE_DIR}")
 
-        @self._ticker.on_reconnect
-        def on_reconnect(reconnect_count, reconnect_interval):
-            logger.info(f"Ticker reconnecting: attempt {reconnect_count}, interval {reconnect_interval}s")
+        self._pool = TickerPool(
+            api_key=settings.KITE_API_KEY,
+            access_token=access_token,
+            on_ticks=self._on_ticks,
+            max_connections=settings.KITE_TICKER_CONNECTIONS,
+            max_tokens_per_connection=settings.KITE_TICKER_MAX_TOKENS,
+            root=settings.KITE_TICKER_ROOT,
+            on_frame=self._on_frame,
+            on_disconnect=self._backfill.disconnected if self._backfill else None,
+        )
+        # Resubscribe to tokens held before the token change
+        for mode, tokens in self._registry._group_by_mode(self._registry.upstream_modes).items():
+            self._pool.subscribe(tokens, MODE_NAMES[mode])
+        logger.info("Access token set and ticker pool initialized")
 
-        # Start the ticker in a separate thread
-        self._ticker.connect(threaded=True)
+    def _on_frame(self, payload: bytes):
+        """Handle a raw binary frame from any ticker shard, before it is decoded"""
+        if self._capture:
+            self._capture.write(payload)
+        if self._frame_callbacks and self._loop and not self._loop.is_closed():
+            for callback in list(self._frame_callbacks):
+                self._loop.call_soon_threadsafe(callback, payload)
+
+    def _on_ticks(self, ticks: List[Dict]):
+        """Handle a batch of ticks from any ticker shard"""
+        try:
+            if self._backfill:
+                self._backfill.observe(ticks)
+            for tick in ticks:
+                self._process_tick(tick)
+        except Exception as e:
+            logger.error(f"Error processing ticker message: {e}")
 
     def _process_tick(self, tick: Dict):
         """Process individual tick data"""
         try:
+            timestamp = tick.get("exchange_timestamp") or tick.get("timestamp")
+            if not isinstance(timestamp, datetime):
+                timestamp = datetime.fromtimestamp(timestamp or 0)
+
             # Convert Kite tick format to our format
-            processed_data = {
-                "type": "MARKET_DATA",
-                "data": {
-                    "instrument_token": tick.get("instrument_token"),
-                    "last_price": tick.get("last_price"),
-                    "volume": tick.get("volume"),
-                    "oi": tick.get("oi", 0),
-                    "change": tick.get("change", 0),
-                    "timestamp": datetime.fromtimestamp(tick.get("timestamp", 0)).isoformat()
-                }
+            data = {
+                "instrument_token": tick.get("instrument_token"),
+                "last_price": tick.get("last_price"),
+                "volume": tick.get("volume_traded", tick.get("volume")),
+                "oi": tick.get("oi", 0),
+                "change": tick.get("change", 0),
+                "timestamp": timestamp.isoformat()
             }
+            # Quote and full mode fields, when the upstream mode carries them
+            for field, kite_field in self._OPTIONAL_FIELDS:
+                if kite_field in tick:
+                    data[field] = tick[kite_field]
+            processed_data = {"type": "MARKET_DATA", "data": data}
 
-            # Notify all callbacks
-            for callback in self._callbacks:
-                asyncio.create_task(callback(processed_data))
+            # Notify all callbacks on the server loop
+            if self._loop and not self._loop.is_closed():
+                for callback in list(self._callbacks):
+                    asyncio.run_coroutine_threadsafe(callback(processed_data), self._loop)
 
         except Exception as e:
             logger.error(f"Error processing tick: {e}")
 
-    def subscribe(self, tokens: List[int]):
-        """Subscribe to market data for given instrument tokens"""
+    def subscribe(self, tokens: List[int], mode=MODE_FULL, client_id: str = "default"):
+        """Subscribe a client to market data for given instrument tokens
+
+        Upstream runs at the highest mode any client asked for, so a token is
+        only streamed in full mode while at least one client wants full mode.
+        """
         try:
-            if not self._ticker or not tokens:
+            if not tokens:
                 return
-
-            # Update subscribed tokens
-            for token in tokens:
-                self._subscribed_tokens[token] = True
-
-            # Subscribe and set mode to full
-            self._ticker.subscribe(tokens)
-            self._ticker.set_mode(self._ticker.MODE_FULL, tokens)
-            logger.info(f"Subscribed to tokens: {tokens}")
+            self._registry.add(client_id, tokens, parse_mode(mode))
+            logger.info(f"Client {client_id} subscribed to tokens: {tokens}")
 
         except Exception as e:
             logger.error(f"Error subscribing to tokens: {e}")
             raise
 
-    def unsubscribe(self, tokens: List[int]):
-        """Unsubscribe from market data for given instrument tokens"""
+    def unsubscribe(self, tokens: List[int], client_id: str = "default"):
+        """Unsubscribe a client from market data for given instrument tokens"""
         try:
-            if not self._ticker or not tokens:
+            if not tokens:
                 return
-
-            # Remove from subscribed tokens
-            for token in tokens:
-                self._subscribed_tokens.pop(token, None)
-
-            self._ticker.unsubscribe(tokens)
-            logger.info(f"Unsubscribed from tokens: {tokens}")
+            self._registry.remove(client_id, tokens)
+            logger.info(f"Client {client_id} unsubscribed from tokens: {tokens}")
 
         except Exception as e:
             logger.error(f"Error unsubscribing from tokens: {e}")
             raise
 
+    def remove_client(self, client_id: str):
+        """Drop all subscriptions held by a client"""
+        self._registry.remove_client(client_id)
+
+    def client_mode(self, client_id: str, token: int) -> Optional[int]:
+        """Mode a client subscribed a token in, None if it is not subscribed"""
+        return self._registry.mode_for(client_id, token)
+
+    def client_tokens(self, client_id: str):
+        """Tokens a client holds subscriptions for"""
+        return self._registry.tokens_for(client_id)
+
+    def subscribers(self, token: int):
+        """Client ids subscribed to a token"""
+        return self._registry.clients_for(token)
+
+    @property
+    def _external_ingest(self) -> bool:
+        return settings.INGEST_MODE in ("shm", "stream")
+
+    def _upstream_subscribe(self, tokens: List[int], mode: int):
+        if self._external_ingest:
+            self._publish_control({
+                "action": "subscribe", "client_id": self._worker_id, "tokens": tokens, "mode": mode,
+            })
+        # The pool updates the mode of tokens it already streams
+        elif self._pool:
+            self._pool.subscribe(tokens, MODE_NAMES[mode])
+
+    def _upstream_unsubscribe(self, tokens: List[int]):
+        if self._external_ingest:
+            self._publish_control({"action": "unsubscribe", "client_id": self._worker_id, "tokens": tokens})
+        elif self._pool:
+            self._pool.unsubscribe(tokens)
+        if self._backfill:
+            self._backfill.detector.forget(tokens)
+
+    def _publish_control(self, message: Dict):
+        """Send a control message to the ingestion process"""
+        if self._loop and not self._loop.is_closed():
+            asyncio.run_coroutine_threadsafe(self._publish_control_async(message), self._loop)
+
+    async def _publish_control_async(self, message: Dict):
+        try:
+            redis = await get_redis()
+            await redis.publish(settings.INGEST_CONTROL_CHANNEL, json.dumps(message))
+        except Exception as e:
+            logger.error(f"Error publishing ingestion control message: {e}")
+
+    def _publish_token(self):
+        """Store the access token where the ingestion process reads it, then tell it to"""
+        if self._loop and not self._loop.is_closed():
+            asyncio.run_coroutine_threadsafe(self._publish_token_async(self._access_token), self._loop)
+
+    async def _publish_token_async(self, access_token: str):
+        try:
+            redis = await get_redis()
+            # Kept off the pub/sub channel, which every subscriber can read
+            await redis.set(settings.INGEST_TOKEN_KEY, access_token)
+            await redis.publish(settings.INGEST_CONTROL_CHANNEL, json.dumps({"action": "token"}))
+        except Exception as e:
+            logger.error(f"Error publishing access token to ingestion: {e}")
+
+    @property
+    def _heartbeat_key(self) -> str:
+        return f"{settings.INGEST_WORKER_KEY_PREFIX}:{self._worker_id}"
+
+    async def _heartbeat(self, redis):
+        """Keep this worker's heartbeat key alive; after a lapse the ingestion process dropped us, resync"""
+        if not await redis.expire(self._heartbeat_key, settings.INGEST_WORKER_TTL_SECONDS):
+            await redis.set(self._heartbeat_key, 1, ex=settings.INGEST_WORKER_TTL_SECONDS)
+            self._resync_ingestion()
+
+    def _start_ingest_reader(self):
+        if self._reader_task is None or self._reader_task.done():
+            self._reader_task = self._loop.create_task(self._read_ingest())
+
+    async def _read_ingest(self):
+        """Read ticks from the ingestion process and watch the control channel for its restarts"""
+        redis = await get_redis()
+        pubsub = redis.pubsub()
+        await pubsub.subscribe(settings.INGEST_CONTROL_CHANNEL)
+        interval = settings.INGEST_POLL_INTERVAL_MS / 1000
+        heartbeat_interval = settings.INGEST_WORKER_TTL_SECONDS / 3
+        next_heartbeat = 0.0
+        try:
+            while True:
+                try:
+                    if self._loop.time() >= next_heartbeat:
+                        next_heartbeat = self._loop.time() + heartbeat_interval
+                        await self._heartbeat(redis)
+                    await self._read_ingest_once(pubsub, interval)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Error reading ticks from ingestion: {e}")
+                    await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            await pubsub.unsubscribe(settings.INGEST_CONTROL_CHANNEL)
+            try:
+                await redis.delete(self._heartbeat_key)
+            except Exception as e:
+                logger.error(f"Error removing worker heartbeat: {e}")
+            await self._publish_control_async({"action": "remove_client", "client_id": self._worker_id})
+            if self._reader:
+                self._reader.close()
+                self._reader = None
+            if self._consumer:
+                await self._consumer.redis.close()
+                self._consumer = None
+
+    async def _read_ingest_once(self, pubsub, interval: float):
+        message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=0)
+        if message and json.loads(message["data"]).get("action") == "sync":
+            # The ingestion process (re)started without our subscriptions
+            self._attach_reader()
+            self._resync_ingestion()
+
+        if settings.INGEST_MODE == "stream":
+            if self._consumer is None:
+                self._consumer = StreamConsumer(
+                    redis_binary(settings.REDIS_URL),
+                    settings.INGEST_STREAM_PREFIX,
+                    settings.INGEST_STREAM_READ_COUNT,
+                )
+            # XREAD blocks for up to the poll interval
+            ticks = await self._consumer.read(settings.INGEST_POLL_INTERVAL_MS)
+        else:
+            if self._reader is None:
+                self._attach_reader()
+            ticks = self._reader.read() if self._reader else []
+            await asyncio.sleep(interval)
+        for tick in ticks:
+            self._process_tick(tick)
+
+    def _attach_reader(self):
+        if settings.INGEST_MODE != "shm":
+            return
+        if self._reader:
+            self._reader.close()
+            self._reader = None
+        try:
+            self._reader = TickReader(settings.INGEST_SHM_NAME)
+            logger.info(f"Attached to shared tick segment {settings.INGEST_SHM_NAME}")
+        except FileNotFoundError:
+            pass  # ingestion process not running yet
+
+    def _resync_ingestion(self):
+        if self._access_token:
+            self._publish_token()
+        for mode, tokens in self._registry._group_by_mode(self._registry.upstream_modes).items():
+            self._upstream_subscribe(tokens, mode)
+
+    def latest_tick(self, token: int) -> Optional[Dict]:
+        """Latest tick for a token from the shared last-value table"""
+        return self._reader.latest(token) if self._reader else None
+
+    def ticker_metrics(self) -> List[Dict]:
+        """Per-shard ticker throughput and lag"""
+        if settings.INGEST_MODE == "stream":
+            return [self._consumer.stats()] if self._consumer else []
+        if settings.INGEST_MODE == "shm":
+            if not self._reader:
+                return []
+            return [{
+                "shm": settings.INGEST_SHM_NAME,
+                "lag": self._reader.lag,
+                "dropped": self._reader.dropped,
+            }]
+        return self._pool.metrics() if self._pool else []
+
+    @property
+    def relays_frames(self) -> bool:
+        """Raw Kite frames are only seen where the ticker pool runs, not behind an ingestion process"""
+        return not self._external_ingest
+
+    def add_frame_callback(self, callback: Callable):
+        """Add a callback for raw Kite binary frames"""
+        if callback not in self._frame_callbacks:
+            self._frame_callbacks.append(callback)
+
+    def remove_frame_callback(self, callback: Callable):
+        if callback in self._frame_callbacks:
+            self._frame_callbacks.remove(callback)
+
     def add_market_data_callback(self, callback: Callable):
         """Add a callback for market data updates"""
         if callback not in self._callbacks:
@@ -165,11 +403,31 @@ class KiteService:
             logger.error(f"Error fetching instruments: {e}")
             raise
 
-    async def get_option_chain(self, symbol: str, expiry: str):
-        """Get option chain data for a symbol and expiry"""
+    async def get_option_chain(self, symbol: str, expiry: str, window: Optional[int] = None):
+        """Get option chain data for a symbol and expiry
+
+        With a ``window`` only that many strikes either side of the
+        at-the-money strike are included, ATM being taken from the nearest
+        future's last price; the full chain is returned if it is unknown.
+        With ``INGEST_MODE=shm`` the chains come from the shared segment
+        once the ingestion process has published them.
+        """
         try:
-            # Get instrument tokens for the options
-            instruments = await self._get_option_instruments(symbol, expiry)
+            chains = self._reader.chains() if self._reader else None
+            if chains is not None:
+                instruments = self._shared_option_instruments(chains, symbol, expiry)
+                future = chains["futures"].get(symbol)
+            else:
+                # Get instrument tokens for the options
+                loop = asyncio.get_event_loop()
+                all_instruments = await loop.run_in_executor(None, self._kite.instruments)
+                instruments = self._option_instruments(all_instruments, symbol, expiry)
+                future = self._nearest_future(all_instruments, symbol)
+            if window is not None and instruments:
+                price = await self._underlying_price(future)
+                if price is not None:
+                    atm = min(range(len(instruments)), key=lambda i: abs(instruments[i]["strike"] - price))
+                    instruments = instruments[max(0, atm - window):atm + window + 1]
             
             # Format the response
             return {
@@ -187,13 +445,50 @@ class KiteService:
             logger.error(f"Error fetching option chain: {e}")
             raise
 
-    async def _get_option_instruments(self, symbol: str, expiry: str):
-        """Get option instruments for a symbol and expiry"""
+    @staticmethod
+    def _nearest_future(instruments: List[Dict], symbol: str) -> Optional[str]:
+        """``EXCHANGE:TRADINGSYMBOL`` of the nearest future on the underlying"""
+        futures = [inst for inst in instruments if inst["name"] == symbol and inst["instrument_type"] == "FUT"]
+        if not futures:
+            return None
+        future = min(futures, key=lambda inst: inst["expiry"])
+        return f"{future['exchange']}:{future['tradingsymbol']}"
+
+    async def _underlying_price(self, key: Optional[str]) -> Optional[float]:
+        """Last price of the nearest future on the underlying, None if unavailable"""
+        if key is None:
+            return None
         try:
-            # Get all instruments asynchronously
             loop = asyncio.get_event_loop()
-            instruments = await loop.run_in_executor(None, self._kite.instruments)
-            
+            quote = await loop.run_in_executor(None, self._kite.ltp, [key])
+            return quote[key]["last_price"]
+        except Exception as e:
+            logger.error(f"Error fetching underlying price for {key}: {e}")
+            return None
+
+    @staticmethod
+    def _shared_option_instruments(chains: Dict, symbol: str, expiry: str) -> List[Dict]:
+        """Option instruments for a symbol and expiry from the shared chain state"""
+        options = []
+        for strike, call_token, put_token in chains["options"].get(symbol, {}).get(expiry, []):
+            entry = {"strike": strike, "call": None, "put": None}
+            for side, instrument_token in (("call", call_token), ("put", put_token)):
+                if instrument_token:
+                    entry[side] = {
+                        "strike": strike,
+                        "instrument_token": instrument_token,
+                        "ltp": 0,  # Will be updated via WebSocket
+                        "change": 0,
+                        "volume": 0,
+                        "oi": 0,
+                        "expiry": expiry
+                    }
+            options.append(entry)
+        return options
+
+    def _option_instruments(self, instruments: List[Dict], symbol: str, expiry: str):
+        """Get option instruments for a symbol and expiry"""
+        try:
             # Filter options for the given symbol and expiry
             options = []
             for inst in instruments:
@@ -1,11 +1,14 @@
 from typing import Dict, List, Optional, Set, Callable
 from datetime import datetime, timedelta
 import asyncio
+import json
 import logging
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.schemas.market_data import KiteTick, MarketDepth, OHLC
+from app.schemas.market_data import KiteTick, MarketDepth
+from app.core.tick_record import TickRecord
 from app.repositories.market_data import MarketDataRepository
 from app.repositories.instruments import InstrumentRepository
+from app.services.tick_writer import TickBatchWriter
 from app.services.websocket_manager import WebSocketManager
 import redis
 from app.core.config import get_settings
@@ -32,6 +35,7 @@ class MarketDataService:
         self.depth_callbacks: List[Callable] = []
         self.ohlc_intervals = ["1min", "5min", "15min", "60min", "1day"]
         self.last_ohlc_update: Dict[str, datetime] = {}
+        self.writer: Optional[TickBatchWriter] = None
         
         # Initialize Redis connection
         self.redis = redis.from_url(self.settings.REDIS_URL, decode_responses=True)
@@ -40,8 +44,12 @@ class MarketDataService:
 
     async def start(self, session: AsyncSession):
         """Initialize the market data service."""
-        self.market_data_repo = MarketDataRepository(session)
+        self.market_data_repo = MarketDataRepository(session, self.settings.DEPTH_STORAGE)
         self.instrument_repo = InstrumentRepository(session)
+
+        # Ticks are written to the database by a background task, off the tick path
+        self.writer = TickBatchWriter.from_settings()
+        self.writer.start()
         
         # Register WebSocket callbacks
         self.ws_manager.add_callback(self._process_tick)
@@ -49,19 +57,23 @@ class MarketDataService:
         # Start OHLCV calculation task
         asyncio.create_task(self._calculate_ohlcv_periodic())
 
-    async def _process_tick(self, tick: KiteTick):
+    async def stop(self):
+        """Write out ticks still waiting for the database"""
+        if self.writer:
+            await self.writer.stop()
+
+    async def _process_tick(self, tick: TickRecord):
         """Process incoming tick data."""
         try:
             # Store tick in Redis for real-time access
             await self._update_redis_tick(tick)
             
             # Store tick in database
-            tick_dict = tick.dict()
-            await self.market_data_repo.add_tick(tick_dict)
+            await self.writer.add_tick(tick.to_db_row())
             
             # Process market depth if available
-            if tick.depth:
-                await self._process_market_depth(tick.instrument_token, tick.depth, tick.timestamp)
+            if tick.has_depth:
+                await self._process_market_depth(tick)
             
             # Notify callbacks
             for callback in self.tick_callbacks:
@@ -73,46 +85,47 @@ class MarketDataService:
         except Exception as e:
             logger.error(f"Error processing tick: {e}")
 
-    async def _process_market_depth(self, instrument_token: int, depth: MarketDepth, timestamp: datetime):
+    async def _process_market_depth(self, tick: TickRecord):
         """Process market depth data."""
         try:
+            depth = tick.depth_dict()
+
             # Store depth in Redis
-            depth_key = f"depth:{instrument_token}"
+            depth_key = f"depth:{tick.instrument_token}"
             await self._update_redis_depth(depth_key, depth)
             
-            # Store in database
-            depth_dict = {
-                "instrument_token": instrument_token,
-                "timestamp": timestamp,
-                "depth_buy": [level.dict() for level in depth.buy],
-                "depth_sell": [level.dict() for level in depth.sell]
+            # Store in database, as level tuples the writer lays out for the storage mode
+            depth_row = {
+                "instrument_token": tick.instrument_token,
+                "timestamp": tick.timestamp,
+                "depth_buy": tick.depth_buy,
+                "depth_sell": tick.depth_sell
             }
-            await self.market_data_repo.add_market_depth(depth_dict)
+            await self.writer.add_market_depth(depth_row)
             
             # Notify callbacks
             for callback in self.depth_callbacks:
                 try:
-                    await callback(instrument_token, depth)
+                    await callback(tick.instrument_token, depth)
                 except Exception as e:
                     logger.error(f"Error in depth callback: {e}")
                     
         except Exception as e:
             logger.error(f"Error processing market depth: {e}")
 
-    async def _update_redis_tick(self, tick: KiteTick):
+    async def _update_redis_tick(self, tick: TickRecord):
         """Update tick data in Redis."""
         try:
             tick_key = f"tick:{tick.instrument_token}"
-            tick_data = tick.dict()
-            self.redis.hset(tick_key, mapping=tick_data)
+            self.redis.hset(tick_key, mapping=tick.to_redis_mapping())
             self.redis.expire(tick_key, 300)  # Expire after 5 minutes
         except Exception as e:
             logger.error(f"Error updating Redis tick: {e}")
 
-    async def _update_redis_depth(self, key: str, depth: MarketDepth):
+    async def _update_redis_depth(self, key: str, depth: Dict[str, List[Dict]]):
         """Update market depth in Redis."""
         try:
-            depth_data = depth.dict()
+            depth_data = {side: json.dumps(levels) for side, levels in depth.items()}
             self.redis.hset(key, mapping=depth_data)
             self.redis.expire(key, 300)  # Expire after 5 minutes
         except Exception as e:
@@ -200,7 +213,7 @@ class MarketDataService:
             tick_data = self.redis.hgetall(tick_key)
             
             if tick_data:
-                return KiteTick(**tick_data)
+                return TickRecord.from_redis(tick_data).to_schema()
             
             # Fall back to database
             return await self.market_data_repo.get_latest_tick(instrument_token)
@@ -217,10 +230,11 @@ class MarketDataService:
             depth_data = self.redis.hgetall(depth_key)
             
             if depth_data:
-                return MarketDepth(**depth_data)
+                return MarketDepth(**{side: json.loads(levels) for side, levels in depth_data.items()})
             
             # Fall back to database
-            return await self.market_data_repo.get_latest_depth(instrument_token)
+            depth = await self.market_data_repo.get_latest_depth(instrument_token)
+            return MarketDepth(**depth) if depth else None
             
         except Exception as e:
             logger.error(f"Error getting latest depth: {e}")
@@ -0,0 +1,205 @@
+from typing import Any, Callable, Dict, List, Optional
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo
+import asyncio
+import logging
+import re
+from sqlalchemy import text
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+PARTITION_KEY = '"timestamp"'  # quoted, it is also a type name
+MAINTENANCE_LOCK = 7310412  # advisory lock key, one maintenance run at a time across processes
+
+
+class PartitionManager:
+    """Daily range partitions of the time-series tables.
+
+    Each table in ``retention`` (table: days kept) is partitioned by range
+    on ``timestamp``, one partition per trading day named
+    ``<table>_YYYYMMDD``. Partitions are created ``premake_days`` ahead so
+    the tick path never meets a missing one. Each is built as a standalone
+    table, indexed while nobody writes to it, given a CHECK constraint
+    matching its bounds and then attached, so attaching does not scan the
+    new partition. It still scans ``<table>_default``, where rows outside
+    every daily partition land, for rows of the new day; that stays cheap
+    while partitions are made ahead and the default keeps empty. Partitions
+    older than the retention are detached, then dropped unless
+    ``drop_expired`` is off, in which case they are left as plain tables for
+    archiving. Every API worker runs a manager; a run only goes ahead while
+    holding an advisory lock, so their DDL never races.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable = AsyncSessionLocal,
+        retention: Optional[Dict[str, int]] = None,
+        premake_days: int = 2,
+        drop_expired: bool = True,
+        timezone: str = "Asia/Kolkata",
+        interval: float = 3600,
+    ):
+        self.session_factory = session_factory
+        self.retention = retention or {}
+        self.premake_days = premake_days
+        self.drop_expired = drop_expired
+        self.tz = ZoneInfo(timezone)
+        self.interval = interval
+        self.created = 0
+        self.detached = 0
+        self.dropped = 0
+        self.last_run: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_settings(cls) -> "PartitionManager":
+        return cls(
+            retention=settings.PARTITION_RETENTION_DAYS,
+            premake_days=settings.PARTITION_PREMAKE_DAYS,
+            drop_expired=settings.PARTITION_DROP_EXPIRED,
+            timezone=settings.PARTITION_TIMEZONE,
+            interval=settings.PARTITION_MAINTENANCE_MINUTES * 60,
+        )
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.maintain()
+            except Exception as e:
+                logger.error(f"Error maintaining partitions: {e}")
+            await asyncio.sleep(self.interval)
+
+    def today(self) -> date:
+        return datetime.now(self.tz).date()
+
+    def bounds(self, day: date) -> List[str]:
+        """[start, end) of a day's partition, as timestamptz literals at the trading day's midnight"""
+        start = datetime.combine(day, time(), self.tz)
+        end = datetime.combine(day + timedelta(days=1), time(), self.tz)
+        return [start.isoformat(), end.isoformat()]
+
+    async def maintain(self, today: Optional[date] = None):
+        """Create partitions from today to ``premake_days`` ahead and expire the old ones
+
+        Skipped when another process holds the maintenance lock. The lock
+        lives in this session's transaction, released when it ends.
+        """
+        today = today or self.today()
+        async with self.session_factory() as lock_session:
+            result = await lock_session.execute(
+                text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": MAINTENANCE_LOCK}
+            )
+            if not result.scalar():
+                logger.debug("Partition maintenance running elsewhere, skipping")
+                return
+            try:
+                await self._maintain(today)
+            finally:
+                await lock_session.rollback()
+        self.last_run = datetime.now(self.tz)
+
+    async def _maintain(self, today: date):
+        for table, days in self.retention.items():
+            async with self.session_factory() as session:
+                if not await self._is_partitioned(session, table):
+                    logger.warning(f"Table {table} is missing or not partitioned, skipping partition maintenance")
+                    continue
+                await self._ensure_default(session, table)
+                existing = await self._partitions(session, table)
+            for offset in range(self.premake_days + 1):
+                day = today + timedelta(days=offset)
+                if day not in existing:
+                    await self.create(table, day)
+            cutoff = today - timedelta(days=days)
+            for day in sorted(day for day in existing if day < cutoff):
+                await self.expire(table, day)
+
+    async def _is_partitioned(self, session, table: str) -> bool:
+        result = await session.execute(
+            text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:table)"), {"table": table}
+        )
+        return result.scalar() == "p"
+
+    async def _ensure_default(self, session, table: str):
+        await session.execute(text(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT"))
+        await session.commit()
+
+    async def _partitions(self, session, table: str) -> Dict[date, str]:
+        """Attached daily partitions by day"""
+        result = await session.execute(
+            text(
+                "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = to_regclass(:table)"
+            ),
+            {"table": table},
+        )
+        pattern = re.compile(rf"^{re.escape(table)}_(\d{{8}})$")
+        partitions = {}
+        for name in result.scalars():
+            match = pattern.match(name)
+            if match:
+                partitions[datetime.strptime(match.group(1), "%Y%m%d").date()] = name
+        return partitions
+
+    async def create(self, table: str, day: date):
+        partition = f"{table}_{day:%Y%m%d}"
+        start, end = self.bounds(day)
+        async with self.session_factory() as session:
+            try:
+                # Indexes come along from the parent and are attached to its partitioned indexes
+                await session.execute(text(
+                    f"CREATE TABLE {partition} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING INDEXES)"
+                ))
+                # Proves the bounds up front, so ATTACH skips scanning the partition (not the default)
+                await session.execute(text(
+                    f"ALTER TABLE {partition} ADD CONSTRAINT {partition}_bounds "
+                    f"CHECK ({PARTITION_KEY} >= '{start}' AND {PARTITION_KEY} < '{end}')"
+                ))
+                await session.execute(text(
+                    f"ALTER TABLE {table} ATTACH PARTITION {partition} FOR VALUES FROM ('{start}') TO ('{end}')"
+                ))
+                await session.execute(text(f"ALTER TABLE {partition} DROP CONSTRAINT {partition}_bounds"))
+                await session.commit()
+            except Exception as e:
+                await session.rollback()
+                logger.error(f"Error creating partition {partition}: {e}")
+                return
+        self.created += 1
+        logger.info(f"Created partition {partition} for [{start}, {end})")
+
+    async def expire(self, table: str, day: date):
+        partition = f"{table}_{day:%Y%m%d}"
+        async with self.session_factory() as session:
+            try:
+                await session.execute(text(f"ALTER TABLE {table} DETACH PARTITION {partition}"))
+                if self.drop_expired:
+                    await session.execute(text(f"DROP TABLE {partition}"))
+                await session.commit()
+            except Exception as e:
+                await session.rollback()
+                logger.error(f"Error expiring partition {partition}: {e}")
+                return
+        self.detached += 1
+        if self.drop_expired:
+            self.dropped += 1
+        logger.info(f"{'Dropped' if self.drop_expired else 'Detached'} expired partition {partition}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tables": self.retention,
+            "created": self.created,
+            "detached": self.detached,
+            "dropped": self.dropped,
+            "last_run": self.last_run.isoformat() if self.last_run else None,
+        }
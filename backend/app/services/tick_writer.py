@@ -0,0 +1,187 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import time
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.repositories.market_data import MarketDataRepository
+
+logger = logging.getLogger(__name__)
+
+TICK = 0
+DEPTH = 1
+
+
+class TickBatchWriter:
+    """Writes tick and depth rows to Postgres from a background task.
+
+    Rows are queued by the tick path and collected into a batch that is
+    flushed once it holds ``batch_size`` rows or its oldest row is
+    ``max_batch_age`` seconds old, on a timer, so a quiet instrument's last
+    ticks still go out. Batches are double-buffered: while one is being
+    written the next keeps filling, with a single write in flight. The tick
+    path only ever waits when the whole queue is full, i.e. when Postgres
+    has fallen ``queue_size`` rows behind. A failed write is retried with
+    the same rows up to ``retries`` times, backing off exponentially from
+    ``retry_backoff`` seconds; rows are given up only after the last one.
+    The dedupe staging table makes a retry of a partly applied batch safe.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable = AsyncSessionLocal,
+        batch_size: int = 1000,
+        max_batch_age: float = 1.0,
+        queue_size: int = 100000,
+        dedupe: bool = True,
+        depth_storage: str = "jsonb",
+        retries: int = 5,
+        retry_backoff: float = 0.2,
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.max_batch_age = max_batch_age
+        self.dedupe = dedupe
+        self.depth_storage = depth_storage
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._task: Optional[asyncio.Task] = None
+        self._flushing: Optional[asyncio.Task] = None
+        self._ticks: List[Dict[str, Any]] = []  # the batch being filled
+        self._depth: List[Dict[str, Any]] = []
+        self.rows_written = 0
+        self.failed_rows = 0
+        self.retried_flushes = 0
+        self.flushes = 0
+        self.backpressure_waits = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.rows_per_sec = 0.0
+        self._window_started = time.monotonic()
+        self._window_rows = 0
+
+    @classmethod
+    def from_settings(cls) -> "TickBatchWriter":
+        return cls(
+            batch_size=settings.DB_WRITER_BATCH_SIZE,
+            max_batch_age=settings.DB_WRITER_MAX_BATCH_MS / 1000,
+            queue_size=settings.DB_WRITER_QUEUE_SIZE,
+            dedupe=settings.DB_WRITER_DEDUPE,
+            depth_storage=settings.DEPTH_STORAGE,
+            retries=settings.DB_WRITER_RETRIES,
+            retry_backoff=settings.DB_WRITER_RETRY_BACKOFF_MS / 1000,
+        )
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def add_tick(self, row: Dict[str, Any]):
+        await self._put((TICK, row))
+
+    async def add_market_depth(self, row: Dict[str, Any]):
+        await self._put((DEPTH, row))
+
+    async def _put(self, item: Tuple[int, Dict[str, Any]]):
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.backpressure_waits += 1
+            await self.queue.put(item)
+
+    def _collect(self, kind: int, row: Dict[str, Any]):
+        (self._ticks if kind == TICK else self._depth).append(row)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        deadline: Optional[float] = None  # when the oldest row in the batch is due
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - loop.time())
+            try:
+                self._collect(*await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                pass
+            else:
+                if deadline is None:
+                    deadline = loop.time() + self.max_batch_age
+                # Take whatever else is already queued without yielding per row
+                while len(self._ticks) + len(self._depth) < self.batch_size and not self.queue.empty():
+                    self._collect(*self.queue.get_nowait())
+
+            if deadline is not None and (
+                len(self._ticks) + len(self._depth) >= self.batch_size or loop.time() >= deadline
+            ):
+                if self._flushing is not None:
+                    # Shielded so stopping the writer never cancels a write halfway
+                    await asyncio.shield(self._flushing)
+                self._flushing = asyncio.create_task(self._flush(self._ticks, self._depth))
+                self._ticks, self._depth, deadline = [], [], None
+
+    async def _flush(self, ticks: List[Dict[str, Any]], depth: List[Dict[str, Any]]):
+        started = time.monotonic()
+        rows = len(ticks) + len(depth)
+        attempt = 0
+        while True:
+            try:
+                async with self.session_factory() as session:
+                    await MarketDataRepository(session, self.depth_storage).write_batch(ticks, depth, self.dedupe)
+                break
+            except Exception as e:
+                if attempt >= self.retries:
+                    self.failed_rows += rows
+                    logger.error(
+                        f"Giving up on batch of {len(ticks)} ticks and {len(depth)} depth rows "
+                        f"after {attempt + 1} attempts: {e}"
+                    )
+                    return
+                delay = self.retry_backoff * 2 ** attempt
+                attempt += 1
+                self.retried_flushes += 1
+                logger.warning(
+                    f"Error writing batch of {len(ticks)} ticks and {len(depth)} depth rows, "
+                    f"retrying in {delay:.1f}s: {e}"
+                )
+                # The next batch keeps filling meanwhile; the queue backs up into the tick path
+                await asyncio.sleep(delay)
+        now = time.monotonic()
+        self.flushes += 1
+        self.rows_written += rows
+        self.last_flush_ms = (now - started) * 1000
+        self.max_flush_ms = max(self.max_flush_ms, self.last_flush_ms)
+        self._window_rows += rows
+        if now - self._window_started >= 1.0:
+            self.rows_per_sec = self._window_rows / (now - self._window_started)
+            self._window_started = now
+            self._window_rows = 0
+
+    async def stop(self):
+        """Stop the writer and write everything still queued or collected"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._flushing is not None:
+            await self._flushing
+        while not self.queue.empty():
+            self._collect(*self.queue.get_nowait())
+        if self._ticks or self._depth:
+            await self._flush(self._ticks, self._depth)
+            self._ticks, self._depth = [], []
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self.queue.qsize(),
+            "queue_size": self.queue.maxsize,
+            "rows_written": self.rows_written,
+            "rows_per_sec": round(self.rows_per_sec),
+            "failed_rows": self.failed_rows,
+            "retried_flushes": self.retried_flushes,
+            "flushes": self.flushes,
+            "last_flush_ms": round(self.last_flush_ms, 1),
+            "max_flush_ms": round(self.max_flush_ms, 1),
+            "backpressure_waits": self.backpressure_waits,
+        }
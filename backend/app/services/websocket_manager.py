@@ -3,7 +3,7 @@ from typing import Dict, List, Optional, Callable
 import json
 import asyncio
 import logging
-from ..schemas.market_data import KiteTick
+from ..core.tick_record import TickRecord
 from ..core.config import get_settings
 from datetime import datetime
 
@@ -56,11 +56,9 @@ class WebSocketManager:
             def on_message(ws, data: bytes):
                 try:
                     ticks = self.kws.parse_binary(data)
+                    received_at = datetime.utcnow()
                     for tick_data in ticks:
-                        tick = KiteTick(
-                            **tick_data,
-                            timestamp=datetime.utcnow()
-                        )
+                        tick = TickRecord.from_kite(tick_data, received_at)
                         for callback in self.callbacks:
                             asyncio.create_task(callback(tick))
                 except Exception as e:
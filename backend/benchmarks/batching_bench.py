@@ -0,0 +1,139 @@
+"""Frames, bytes and CPU per second of websocket output, with and without batching.
+
+Replays a session through the outbound encoding path of one client that
+subscribes to every token in it. For each batching window, JSON and
+kc.bin.v1 output is measured with and without permessage-deflate.
+Deflate is emulated the way the server does it: one compressor per
+connection with context takeover and the trailing sync marker removed.
+Wire bytes include websocket frame headers. CPU covers encoding, batching
+and compression, not the socket writes saved by sending fewer frames.
+
+With capture segments from ``TickCapture`` the recorded session is
+replayed, decoded with KiteTicker's parser. Otherwise a synthetic session
+is used: a 100-strike chain, each token ticking every 300 ms on average.
+
+Run from the backend directory:
+    python -m benchmarks.batching_bench [segment.kcrec ...]
+"""
+import random
+import sys
+import time
+import zlib
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+from app.core.compact_protocol import batch_frames, encode_frame, pack_tick
+from app.core.encoding import batch_json, dumps
+
+WINDOWS_MS = (0, 20, 50)
+SYNTHETIC_TOKENS = 100
+SYNTHETIC_SECONDS = 60
+SYNTHETIC_MEAN_INTERVAL = 0.3
+
+random.seed(11)
+
+
+def synthetic_session() -> List[Tuple[int, Dict[str, Any]]]:
+    start_ns = int(datetime(2024, 1, 5, 10, 15).timestamp() * 1e9)
+    session = []
+    for token in range(SYNTHETIC_TOKENS):
+        price = random.uniform(5, 500)
+        at = random.expovariate(1 / SYNTHETIC_MEAN_INTERVAL)
+        while at < SYNTHETIC_SECONDS:
+            price = max(0.05, round(price + random.choice((-0.05, 0.0, 0.05, 0.1)), 2))
+            ts_ns = start_ns + int(at * 1e9)
+            session.append((ts_ns, {
+                "instrument_token": 10000000 + token,
+                "last_price": price,
+                "last_quantity": random.choice((25, 50, 75, 100)),
+                "volume": random.randrange(10000, 5000000),
+                "oi": random.randrange(10000, 2000000),
+                "change": 1.5,
+                "exchange_timestamp": datetime.fromtimestamp(ts_ns // 1000000000),
+            }))
+            at += random.expovariate(1 / SYNTHETIC_MEAN_INTERVAL)
+    session.sort(key=lambda item: item[0])
+    return session
+
+
+def recorded_session(paths: List[str]) -> List[Tuple[int, Dict[str, Any]]]:
+    from app.ingestion.recording import read_session
+    from app.ingestion.replay import kite_decoder
+    decode = kite_decoder()
+    return [(ts_ns, tick) for ts_ns, frame in read_session(paths) for tick in decode(frame)]
+
+
+def processed(tick: Dict[str, Any]) -> Dict[str, Any]:
+    """The MARKET_DATA payload KiteService sends for a tick"""
+    timestamp = tick.get("exchange_timestamp") or datetime.now()
+    return {
+        "instrument_token": tick["instrument_token"],
+        "last_price": tick.get("last_price"),
+        "volume": tick.get("volume_traded", tick.get("volume")),
+        "oi": tick.get("oi", 0),
+        "change": tick.get("change", 0),
+        "timestamp": timestamp.isoformat(),
+        "last_quantity": tick.get("last_traded_quantity", tick.get("last_quantity")),
+    }
+
+
+def frame_header(length: int) -> int:
+    return 2 if length < 126 else 4 if length < 65536 else 10
+
+
+def run(session, window_ms: int, binary: bool, deflate: bool) -> Tuple[int, int, float]:
+    """Frames and wire bytes sent, and CPU seconds spent"""
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15) if deflate else None
+    window_ns = window_ms * 1000000
+    frames = 0
+    wire = 0
+    start = time.process_time()
+    pending: List[Any] = []
+    window_end = None
+
+    def flush():
+        nonlocal frames, wire
+        if window_ms:
+            out = batch_frames(pending) if binary else batch_json(pending)
+        else:
+            out = [encode_frame([m]) if binary else m for m in pending]
+        for message in out:
+            data = message if isinstance(message, bytes) else message.encode()
+            if compressor is not None:
+                data = (compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH))[:-4]
+            frames += 1
+            wire += frame_header(len(data)) + len(data)
+        pending.clear()
+
+    for ts_ns, tick in session:
+        if window_end is not None and ts_ns >= window_end:
+            flush()
+            window_end = None
+        data = processed(tick)
+        pending.append(pack_tick(data) if binary else dumps({"type": "MARKET_DATA", "data": data}))
+        if window_end is None:
+            window_end = ts_ns + window_ns
+        if not window_ms:
+            flush()
+            window_end = None
+    flush()
+    return frames, wire, time.process_time() - start
+
+
+def main():
+    paths = sys.argv[1:]
+    session = recorded_session(paths) if paths else synthetic_session()
+    seconds = max((session[-1][0] - session[0][0]) / 1e9, 1e-9)
+    print(f"{'recorded' if paths else 'synthetic'} session: {len(session)} ticks over {seconds:.1f} s "
+          f"({len(session) / seconds:.0f} ticks/s)")
+    print(f"{'window':>7} {'protocol':>10} {'deflate':>8} {'frames/s':>9} {'KB/s':>8} {'cpu %':>6}")
+    for window_ms in WINDOWS_MS:
+        for binary in (False, True):
+            for deflate in (False, True):
+                frames, wire, cpu = run(session, window_ms, binary, deflate)
+                print(f"{window_ms:>5}ms {'kc.bin.v1' if binary else 'json':>10} {'on' if deflate else 'off':>8} "
+                      f"{frames / seconds:9.0f} {wire / seconds / 1024:8.1f} {cpu / seconds * 100:6.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Cost of capturing raw ticker frames at 10k ticks/s.
+
+Writes synthetic full-mode frames (184-byte packets, several per frame, as
+KiteTicker delivers them) through ``TickCapture`` and reports the per-frame
+cost and the share of one core capture would use at the target rate.
+Also times seeking into and reading back the capture.
+
+Run from the backend directory:
+    python -m benchmarks.capture_bench
+"""
+import os
+import struct
+import tempfile
+import time
+
+from app.ingestion.recording import TickCapture, read_frames, session_segments
+
+TICKS_PER_SEC = 10000
+TICKS_PER_FRAME = 8
+PACKET_SIZE = 184  # full mode packet with market depth
+SECONDS = 30  # simulated session length
+
+
+def make_frame(ticks: int) -> bytes:
+    packets = b"".join(
+        struct.pack(">H", PACKET_SIZE) + os.urandom(PACKET_SIZE) for _ in range(ticks)
+    )
+    return struct.pack(">H", ticks) + packets
+
+
+def main():
+    frames_per_sec = TICKS_PER_SEC // TICKS_PER_FRAME
+    frame = make_frame(TICKS_PER_FRAME)
+    total = frames_per_sec * SECONDS
+    step_ns = 1_000_000_000 // frames_per_sec
+
+    with tempfile.TemporaryDirectory() as directory:
+        capture = TickCapture(directory, segment_bytes=64 * 1024 * 1024)
+        base_ns = time.time_ns()
+        start = time.perf_counter()
+        for i in range(total):
+            capture.write(frame, base_ns + i * step_ns)
+        elapsed = time.perf_counter() - start
+        capture.close()
+
+        per_frame_us = elapsed / total * 1e6
+        core_share = per_frame_us * frames_per_sec / 1e6 * 100
+        print(f"{total} frames of {len(frame)} bytes ({SECONDS}s at {TICKS_PER_SEC} ticks/s)")
+        print(f"capture:  {per_frame_us:.2f} us/frame, {core_share:.2f}% of one core at target rate")
+        print(f"segments: {capture.segments}")
+
+        day = time.strftime("%Y%m%d", time.localtime(base_ns / 1e9))
+        segments = session_segments(directory, day)
+        start = time.perf_counter()
+        frames = sum(1 for _ in read_frames(segments[0]))
+        elapsed = time.perf_counter() - start
+        print(f"read back: {frames} frames in {elapsed * 1000:.1f} ms")
+
+        seek_ns = base_ns + (SECONDS - 1) * 1_000_000_000
+        start = time.perf_counter()
+        first = next(read_frames(segments[-1], seek_ns))
+        elapsed = time.perf_counter() - start
+        print(f"seek to last second: {elapsed * 1000:.2f} ms (landed {(first[0] - seek_ns) / 1e6:.2f} ms after target)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Routing and encoding cost of websocket fan-out, 1,000 clients over 2,000 tokens.
+
+Compares the old scan (every tick checks every client's subscription set)
+with the token -> clients index kept by ``SubscriptionRegistry``. Each
+client watches a 50-strike window of one option chain, so most clients
+share tokens with some others but not all. Only routing is timed;
+sending is replaced with a counter.
+
+Also compares encoding a message once per subscriber (``send_json``)
+with encoding it once per mode through ``EncodingCache``.
+
+Run from the backend directory:
+    python -m benchmarks.fanout_bench
+"""
+import json
+import random
+import time
+
+from app.core.encoding import EncodingCache
+from app.core.subscriptions import MODE_LTP, SubscriptionRegistry, project
+
+CLIENTS = 1000
+TOKENS = 2000
+TOKENS_PER_CLIENT = 50
+TICKS = 20000
+ENCODE_TICKS = 2000
+
+MESSAGE = {
+    "instrument_token": 12345678,
+    "last_price": 152.35,
+    "volume": 1250000,
+    "oi": 870000,
+    "change": 3.2,
+    "timestamp": "2024-01-05T10:15:00.123456",
+    "last_quantity": 50,
+    "average_price": 150.8,
+    "buy_quantity": 35000,
+    "sell_quantity": 42000,
+    "ohlc": {"open": 148.0, "high": 155.5, "low": 146.1, "close": 149.0},
+}
+
+random.seed(7)
+
+
+def build_registry() -> SubscriptionRegistry:
+    registry = SubscriptionRegistry(lambda tokens, mode: None, lambda tokens: None, debounce=0)
+    for client in range(CLIENTS):
+        start = random.randrange(TOKENS - TOKENS_PER_CLIENT)
+        registry.add(f"client-{client}", range(start, start + TOKENS_PER_CLIENT))
+    return registry
+
+
+def scan(subscriptions, ticks) -> int:
+    delivered = 0
+    for token in ticks:
+        for client_id, tokens in subscriptions.items():
+            if token in tokens:
+                delivered += 1
+    return delivered
+
+
+def indexed(registry: SubscriptionRegistry, ticks) -> int:
+    delivered = 0
+    for token in ticks:
+        for client_id in registry.clients_for(token):
+            delivered += 1
+    return delivered
+
+
+def encode_per_client(registry: SubscriptionRegistry, ticks) -> int:
+    encodes = 0
+    for token in ticks:
+        for client_id in registry.clients_for(token):
+            json.dumps({"type": "MARKET_DATA", "data": project(MESSAGE, registry.mode_for(client_id, token))})
+            encodes += 1
+    return encodes
+
+
+def encode_once(registry: SubscriptionRegistry, ticks) -> int:
+    encodes = 0
+    for token in ticks:
+        cache = EncodingCache()
+        for client_id in registry.clients_for(token):
+            mode = registry.mode_for(client_id, token)
+            cache.get(("json", mode), lambda: {"type": "MARKET_DATA", "data": project(MESSAGE, mode)})
+        encodes += cache.encodes
+    return encodes
+
+
+def main():
+    registry = build_registry()
+    ticks = [random.randrange(TOKENS) for _ in range(TICKS)]
+
+    start = time.perf_counter()
+    expected = scan(registry.client_tokens, ticks)
+    scan_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    delivered = indexed(registry, ticks)
+    index_elapsed = time.perf_counter() - start
+    assert delivered == expected
+
+    print(f"{CLIENTS} clients, {TOKENS} tokens, {TICKS} ticks, {delivered} deliveries "
+          f"({delivered / TICKS:.1f} subscribers per tick)")
+    print(f"scan:    {scan_elapsed * 1e6 / TICKS:8.2f} us/tick")
+    print(f"indexed: {index_elapsed * 1e6 / TICKS:8.2f} us/tick  ({scan_elapsed / index_elapsed:.0f}x faster)")
+
+    # A fifth of the clients only want LTP
+    for client in range(0, CLIENTS, 5):
+        client_id = f"client-{client}"
+        registry.add(client_id, list(registry.tokens_for(client_id)), MODE_LTP)
+    encode_ticks = ticks[:ENCODE_TICKS]
+    start = time.perf_counter()
+    per_client = encode_per_client(registry, encode_ticks)
+    per_client_elapsed = time.perf_counter() - start
+    start = time.perf_counter()
+    once = encode_once(registry, encode_ticks)
+    once_elapsed = time.perf_counter() - start
+    print(f"encode per client: {per_client_elapsed * 1e6 / ENCODE_TICKS:8.2f} us/tick ({per_client} encodes)")
+    print(f"encode once:       {once_elapsed * 1e6 / ENCODE_TICKS:8.2f} us/tick ({once} encodes)")
+
+    start = time.perf_counter()
+    for client in range(CLIENTS):
+        registry.remove_client(f"client-{client}")
+    print(f"unsubscribe all: {(time.perf_counter() - start) * 1e6 / CLIENTS:.1f} us/client")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Bytes and encode time per tick, JSON versus the kc.bin.v1 compact protocol.
+
+Encodes a quote-mode tick in the ``MARKET_DATA`` shape sent on
+``/options`` as JSON text (one message per tick), and as packed records
+batched ``BATCH`` to a frame. The binary side includes parsing the ISO
+timestamp the processed tick carries; as in a real burst, ticks share
+exchange timestamps, here one per 500 ticks.
+
+Run from the backend directory:
+    python -m benchmarks.protocol_bench
+"""
+import time
+
+from app.core.compact_protocol import HEADER, decode_frame, encode_frame, pack_tick
+from app.core.encoding import dumps
+
+TICKS = 100000
+BATCH = 50
+
+TICK = {
+    "instrument_token": 12345678,
+    "last_price": 152.35,
+    "volume": 1250000,
+    "oi": 870000,
+    "change": 3.2,
+    "timestamp": "2024-01-05T10:15:00.123456",
+    "last_quantity": 50,
+    "average_price": 150.8,
+    "buy_quantity": 35000,
+    "sell_quantity": 42000,
+    "ohlc": {"open": 148.0, "high": 155.5, "low": 146.1, "close": 149.0},
+}
+
+
+def main():
+    ticks = [
+        dict(TICK, instrument_token=TICK["instrument_token"] + i % 500, timestamp=f"2024-01-05T10:{i // 30000:02d}:{i // 500 % 60:02d}")
+        for i in range(TICKS)
+    ]
+
+    start = time.perf_counter()
+    json_bytes = 0
+    for tick in ticks:
+        json_bytes += len(dumps({"type": "MARKET_DATA", "data": tick}).encode())
+    json_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    bin_bytes = 0
+    for offset in range(0, TICKS, BATCH):
+        bin_bytes += len(encode_frame([pack_tick(tick) for tick in ticks[offset:offset + BATCH]]))
+    bin_elapsed = time.perf_counter() - start
+
+    decoded = decode_frame(encode_frame([pack_tick(TICK)]))[0]
+    assert decoded["last_price"] == TICK["last_price"] and decoded["oi"] == TICK["oi"]
+
+    print(f"{TICKS} ticks, binary frames of {BATCH} records ({HEADER.size} byte header)")
+    print(f"json:      {json_bytes / TICKS:7.1f} bytes/tick {json_elapsed * 1e6 / TICKS:6.2f} us/tick")
+    print(f"kc.bin.v1: {bin_bytes / TICKS:7.1f} bytes/tick {bin_elapsed * 1e6 / TICKS:6.2f} us/tick "
+          f"({json_bytes / bin_bytes:.1f}x smaller, {json_elapsed / bin_elapsed:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
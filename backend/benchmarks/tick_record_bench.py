@@ -0,0 +1,67 @@
+"""Per-tick cost of building a tick and converting it to dicts.
+
+Compares the old pipeline path (``KiteTick(**tick)`` followed by ``.dict()``
+for Redis and again for the DB batch) with ``TickRecord``.
+
+Run from the backend directory:
+    python -m benchmarks.tick_record_bench
+"""
+import timeit
+from datetime import datetime
+
+from app.core.tick_record import TickRecord
+from app.schemas.market_data import KiteTick
+
+N = 20000
+
+KITE_TICK = {
+    "tradable": True,
+    "mode": "full",
+    "instrument_token": 12345678,
+    "last_price": 22150.35,
+    "last_traded_quantity": 50,
+    "average_traded_price": 22110.8,
+    "volume_traded": 1250000,
+    "total_buy_quantity": 350000,
+    "total_sell_quantity": 420000,
+    "ohlc": {"open": 22050.0, "high": 22190.5, "low": 22010.1, "close": 22080.0},
+    "change": 0.32,
+    "oi": 870000,
+    "depth": {
+        "buy": [{"price": 22150.0 - i * 0.05, "quantity": 75 * (i + 1), "orders": i + 1} for i in range(5)],
+        "sell": [{"price": 22150.4 + i * 0.05, "quantity": 75 * (i + 1), "orders": i + 1} for i in range(5)],
+    },
+}
+
+# Field names the pydantic schema expects
+SCHEMA_TICK = {
+    "tradeable": True,
+    "mode": 3,
+    "instrument_token": KITE_TICK["instrument_token"],
+    "last_price": KITE_TICK["last_price"],
+    "last_quantity": KITE_TICK["last_traded_quantity"],
+    "average_price": KITE_TICK["average_traded_price"],
+    "volume": KITE_TICK["volume_traded"],
+    "buy_quantity": KITE_TICK["total_buy_quantity"],
+    "sell_quantity": KITE_TICK["total_sell_quantity"],
+    "ohlc": KITE_TICK["ohlc"],
+    "depth": KITE_TICK["depth"],
+}
+
+
+def pydantic_path():
+    tick = KiteTick(**SCHEMA_TICK, timestamp=datetime.utcnow())
+    tick.dict()  # Redis
+    tick.dict()  # DB batch
+
+
+def record_path():
+    tick = TickRecord.from_kite(KITE_TICK, datetime.utcnow())
+    tick.to_redis_mapping()
+    tick.to_db_row()
+
+
+if __name__ == "__main__":
+    for name, fn in (("pydantic KiteTick", pydantic_path), ("TickRecord", record_path)):
+        seconds = min(timeit.repeat(fn, number=N, repeat=3))
+        print(f"{name:>18}: {seconds / N * 1e6:8.2f} us/tick")
@@ -18,10 +18,15 @@ app.add_middleware(
 app.include_router(api_router, prefix="/api/v1")
 
 if __name__ == "__main__":
+    # Every worker would open its own ticker unless ingestion runs separately
+    workers = settings.API_WORKERS if settings.INGEST_MODE in ("shm", "stream") else 1
     uvicorn.run(
         "run:app",
         host="0.0.0.0",
         port=8000,
-        reload=settings.DEBUG,
-        workers=1
+        # uvicorn cannot reload a multi-worker server
+        reload=settings.DEBUG and workers == 1,
+        workers=workers,
+        # Compression is negotiated per connection; clients that do not offer it get plain frames
+        ws_per_message_deflate=settings.WS_PER_MESSAGE_DEFLATE,
     )
@@ -12,6 +12,7 @@ class WebSocketManager:
         self.settings = get_kite_settings()
         self.active_connections: Dict[str, WebSocket] = {}
         self.subscriptions: Dict[str, Set[int]] = {}  # client_id -> set of instrument tokens
+        self.token_subscribers: Dict[int, Set[str]] = {}  # instrument token -> client_ids
         self.kws = None
         self.initialize_ticker()
 
@@ -57,28 +58,33 @@ class WebSocketManager:
         """Subscribe to instruments for a client"""
         if client_id in self.subscriptions:
             self.subscriptions[client_id].update(instrument_tokens)
-            all_subscriptions = set().union(*self.subscriptions.values())
-            self.kws.subscribe(list(all_subscriptions))
+            for token in instrument_tokens:
+                self.token_subscribers.setdefault(token, set()).add(client_id)
+            self.kws.subscribe(list(self.token_subscribers))
             logger.info(f"Client {client_id} subscribed to {instrument_tokens}")
 
     def unsubscribe(self, client_id: str, instrument_tokens: list):
         """Unsubscribe from instruments for a client"""
         if client_id in self.subscriptions:
             self.subscriptions[client_id].difference_update(instrument_tokens)
-            all_subscriptions = set().union(*self.subscriptions.values())
-            self.kws.subscribe(list(all_subscriptions))
+            for token in instrument_tokens:
+                clients = self.token_subscribers.get(token)
+                if clients is not None:
+                    clients.discard(client_id)
+                    if not clients:
+                        del self.token_subscribers[token]
+            self.kws.subscribe(list(self.token_subscribers))
             logger.info(f"Client {client_id} unsubscribed from {instrument_tokens}")
 
     async def broadcast_to_subscribers(self, instrument_token: int, data: dict):
         """Broadcast data to all subscribers of an instrument"""
-        for client_id, subscribed_tokens in self.subscriptions.items():
-            if instrument_token in subscribed_tokens:
-                try:
-                    websocket = self.active_connections.get(client_id)
-                    if websocket:
-                        await websocket.send_text(json.dumps(data))
-                except Exception as e:
-                    logger.error(f"Error broadcasting to client {client_id}: {str(e)}")
+        for client_id in list(self.token_subscribers.get(instrument_token, ())):
+            try:
+                websocket = self.active_connections.get(client_id)
+                if websocket:
+                    await websocket.send_text(json.dumps(data))
+            except Exception as e:
+                logger.error(f"Error broadcasting to client {client_id}: {str(e)}")
 
     # Ticker callbacks
     def on_ticks(self, ws, ticks):
@@ -86,12 +92,17 @@ class WebSocketManager:
         for tick in ticks:
             instrument_token = tick.get('instrument_token')
             if instrument_token:
-                for client_id, websocket in self.active_connections.items():
-                    if instrument_token in self.subscriptions.get(client_id, set()):
-                        try:
-                            websocket.send_text(json.dumps(tick))
-                        except Exception as e:
-                            logger.error(f"Error sending tick to client {client_id}: {str(e)}")
+                message = None
+                for client_id in list(self.token_subscribers.get(instrument_token, ())):
+                    websocket = self.active_connections.get(client_id)
+                    if not websocket:
+                        continue
+                    if message is None:
+                        message = json.dumps(tick)
+                    try:
+                        websocket.send_text(message)
+                    except Exception as e:
+                        logger.error(f"Error sending tick to client {client_id}: {str(e)}")
 
     def on_connect(self, ws, response):
         """Callback when connection is established"""
@@ -0,0 +1,113 @@
+from app.core.ticker_pool import TickerPool
+
+# Drives TickerPool's sharding, rebalance and reconnect handling through stub
+# tickers handed in with ticker_factory; no Kite session or network needed.
+# Run from the backend directory: python test_ticker_pool.py
+
+calls = []  # (ticker id, action, tokens) in the order the pool issued them
+tickers = []
+
+
+class StubTicker:
+    """Records what the pool asks of a KiteTicker; callbacks are fired by hand"""
+
+    def __init__(self, api_key, access_token, **kwargs):
+        self.id = len(tickers)
+        self.connected = False
+        self.closed = False
+        tickers.append(self)
+
+    def connect(self, threaded=False):
+        calls.append((self.id, "connect", None))
+
+    def subscribe(self, tokens):
+        calls.append((self.id, "subscribe", sorted(tokens)))
+
+    def set_mode(self, mode, tokens):
+        calls.append((self.id, "mode:" + mode, sorted(tokens)))
+
+    def unsubscribe(self, tokens):
+        calls.append((self.id, "unsubscribe", sorted(tokens)))
+
+    def close(self):
+        self.closed = True
+
+
+def shard_tokens(pool):
+    return [sorted(shard.tokens) for shard in pool.shards]
+
+
+disconnected = []
+pool = TickerPool(
+    "api_key",
+    "access_token",
+    on_ticks=lambda ticks: None,
+    max_connections=2,
+    max_tokens_per_connection=3,
+    ticker_factory=StubTicker,
+    on_disconnect=disconnected.extend,
+)
+
+try:
+    # Sharding: four tokens at the default rate split evenly, capacity 3 each
+    pool.subscribe([101, 102, 103, 104], mode="full")
+    print("Shards after subscribe:", shard_tokens(pool))
+    assert len(tickers) == 2, "one ticker per shard in use"
+    assert sorted(sum(shard_tokens(pool), [])) == [101, 102, 103, 104]
+    assert all(len(tokens) == 2 for tokens in shard_tokens(pool))
+
+    # Nothing goes upstream until a shard connects, then it subscribes all it owns
+    assert not [c for c in calls if c[1] == "subscribe"]
+    for ticker in tickers:
+        ticker.on_connect(ticker, {})
+    for shard, ticker in zip(pool.shards, tickers):
+        assert (ticker.id, "subscribe", sorted(shard.tokens)) in calls
+        assert (ticker.id, "mode:full", sorted(shard.tokens)) in calls
+    print("Connected shards subscribed their tokens")
+
+    # Rebalance: make both tokens of shard 0 busy, one of them moves to shard 1
+    busy = sorted(pool.shards[0].tokens)
+    calls.clear()
+    pool.subscribe([], expected_rates={token: 20.0 for token in busy})
+    print("Shards after rebalance:", shard_tokens(pool), "loads:", [m["expected_ticks_per_sec"] for m in pool.metrics()])
+    moved = [token for token in busy if pool.token_shard[token] == 1]
+    assert len(moved) == 1, "exactly one busy token moves"
+    subscribed = calls.index((1, "subscribe", moved))
+    unsubscribed = calls.index((0, "unsubscribe", moved))
+    assert subscribed < unsubscribed, "moved tokens are subscribed on the new shard before leaving the old one"
+    print(f"Moved {moved} from shard 0 to shard 1, subscribe before unsubscribe")
+
+    # Reconnect: a dropped shard reports its tokens, then re-subscribes them all on connect
+    ticker = tickers[1]
+    ticker.on_close(ticker, 1006, "connection dropped")
+    assert not pool.shards[1].connected
+    assert sorted(disconnected) == sorted(pool.shards[1].tokens)
+    ticker.on_reconnect(ticker, 1)
+    calls.clear()
+    ticker.on_connect(ticker, {})
+    assert pool.shards[1].connected and pool.shards[1].reconnects == 1
+    assert (1, "subscribe", sorted(pool.shards[1].tokens)) in calls
+    print("Shard 1 reconnected and re-subscribed", sorted(pool.shards[1].tokens))
+
+    # Giving up on reconnecting replaces the shard's ticker with a fresh one
+    ticker.on_noreconnect(ticker)
+    assert len(tickers) == 3 and pool.shards[1].ticker is tickers[2]
+    calls.clear()
+    tickers[2].on_connect(tickers[2], {})
+    assert (2, "subscribe", sorted(pool.shards[1].tokens)) in calls
+    print("Shard 1 restarted on a new ticker and re-subscribed")
+
+    # Unsubscribing goes to the shard that owns the token
+    token = moved[0]
+    calls.clear()
+    pool.unsubscribe([token])
+    assert (2, "unsubscribe", [token]) in calls and token not in pool.token_shard
+    print("Unsubscribed", token, "from its shard")
+
+    pool.close()
+    assert all(t.closed for t in (tickers[0], tickers[2]))
+    print("Success! Ticker pool checks passed")
+
+except AssertionError as e:
+    print(f"Failed: {e}")
+    raise
@@ -15,6 +15,9 @@ export const useMarketData = (symbol: string, expiry: string) => {
     const wsRef = useRef<WebSocket | null>(null);
     const reconnectAttempts = useRef(0);
     const heartbeatInterval = useRef<NodeJS.Timeout>();
+    // Stream position, sent on reconnect so the server can replay only missed deltas
+    const streamEpoch = useRef<number | null>(null);
+    const lastSeq = useRef<number | null>(null);
     const { optionChainData, error, isLoading } = useSelector((state: RootState) => state.optionChain);
 
     // Handle market data updates
@@ -63,25 +66,6 @@ export const useMarketData = (symbol: string, expiry: string) => {
         }));
     }, [optionChainData, dispatch]);
 
-    // Subscribe to instruments
-    const subscribeToInstruments = useCallback(() => {
-        if (!wsRef.current || !optionChainData || wsRef.current.readyState !== WebSocket.OPEN) return;
-
-        const instruments = optionChainData.strikes.flatMap((strike: StrikeData) => {
-            const tokens: number[] = [];
-            if (strike.call?.instrument_token) tokens.push(strike.call.instrument_token);
-            if (strike.put?.instrument_token) tokens.push(strike.put.instrument_token);
-            return tokens;
-        });
-
-        if (instruments.length > 0) {
-            wsRef.current.send(JSON.stringify({
-                type: 'subscribe',
-                instruments
-            }));
-        }
-    }, [optionChainData]);
-
     // Setup WebSocket connection
     const setupWebSocket = useCallback(() => {
         const token = localStorage.getItem('access_token');
@@ -93,31 +77,52 @@ export const useMarketData = (symbol: string, expiry: string) => {
             clearInterval(heartbeatInterval.current);
         }
 
-        const ws = new WebSocket(`ws://localhost:8000/options/${symbol}/${expiry}?token=${token}`);
+        // With a known position and chain, ask to resume instead of refetching the chain
+        const resume = optionChainData && streamEpoch.current !== null && lastSeq.current !== null
+            ? `&epoch=${streamEpoch.current}&last_seq=${lastSeq.current}`
+            : '';
+        const ws = new WebSocket(`ws://localhost:8000/options/${symbol}/${expiry}?token=${token}${resume}`);
         wsRef.current = ws;
 
         ws.onmessage = (event) => {
             try {
-                const message = JSON.parse(event.data) as WSMessage;
+                // With batched frames one frame carries a JSON array of messages
+                const parsed = JSON.parse(event.data) as WSMessage | WSMessage[];
+                for (const message of Array.isArray(parsed) ? parsed : [parsed]) {
+                    // Deltas arrive out of order, only snapshots and POSITION move the resume position
+                    if (message.type === 'OPTION_CHAIN' && message.epoch !== undefined) {
+                        streamEpoch.current = message.epoch;
+                        lastSeq.current = message.seq ?? null;
+                    } else if (message.type === 'POSITION' && message.epoch === streamEpoch.current && message.seq !== undefined
+                        && (lastSeq.current === null || message.seq > lastSeq.current)) {
+                        lastSeq.current = message.seq;
+                    }
                 
-                switch (message.type) {
-                    case 'MARKET_DATA':
-                        if (message.data) handleMarketData(message.data as MarketData);
-                        break;
-                    case 'OPTION_CHAIN':
-                        if (message.data) {
-                            dispatch(setOptionChainData(message.data as OptionChainData));
-                            subscribeToInstruments();
-                        }
-                        break;
-                    case 'ERROR':
-                        dispatch(setError(message.error || 'Unknown error occurred'));
-                        break;
-                    case 'pong':
-                        // Heartbeat response received
-                        break;
-                    default:
-                        console.warn('Unknown message type:', message.type);
+                    switch (message.type) {
+                        case 'MARKET_DATA':
+                            if (message.data) handleMarketData(message.data as MarketData);
+                            break;
+                        case 'OPTION_CHAIN':
+                            if (message.data) {
+                                // The chain topic already streams every chain token, nothing to subscribe
+                                dispatch(setOptionChainData(message.data as OptionChainData));
+                            }
+                            break;
+                        case 'ERROR':
+                            dispatch(setError(message.error || 'Unknown error occurred'));
+                            break;
+                        case 'RESUMED':
+                            // Missed updates were replayed, the chain is current again
+                            break;
+                        case 'POSITION':
+                            // Resume position, handled above
+                            break;
+                        case 'pong':
+                            // Heartbeat response received
+                            break;
+                        default:
+                            console.warn('Unknown message type:', message.type);
+                    }
                 }
             } catch (err) {
                 console.error('Error processing WebSocket message:', err);
@@ -148,7 +153,6 @@ export const useMarketData = (symbol: string, expiry: string) => {
         ws.onopen = () => {
             console.log('WebSocket connection established');
             reconnectAttempts.current = 0;
-            subscribeToInstruments();
 
             // Setup heartbeat
             heartbeatInterval.current = setInterval(() => {
@@ -157,7 +161,7 @@ export const useMarketData = (symbol: string, expiry: string) => {
                 }
             }, HEARTBEAT_INTERVAL);
         };
-    }, [symbol, expiry, dispatch, handleMarketData, subscribeToInstruments]);
+    }, [symbol, expiry, dispatch, handleMarketData]);
 
     useEffect(() => {
         setupWebSocket();
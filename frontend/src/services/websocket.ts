@@ -9,6 +9,9 @@ class WebSocketService {
     private subscribedInstruments: Set<number> = new Set();
     private currentSymbol: string | null = null;
     private currentExpiry: string | null = null;
+    // Stream position, sent on reconnect so the server can replay only missed deltas
+    private streamEpoch: number | null = null;
+    private lastSeq: number | null = null;
 
     constructor() {
         this.connect = this.connect.bind(this);
@@ -20,7 +23,7 @@ class WebSocketService {
         this.unsubscribe = this.unsubscribe.bind(this);
     }
 
-    connect(symbol: string, expiry: string) {
+    connect(symbol: string, expiry: string, resume: boolean = false) {
         if (this.ws?.readyState === WebSocket.OPEN) {
             this.disconnect();
         }
@@ -34,7 +37,14 @@ class WebSocketService {
         this.currentSymbol = symbol;
         this.currentExpiry = expiry;
 
-        const wsUrl = `ws://localhost:8000/options/${symbol}/${expiry}?token=${token}`;
+        if (!resume) {
+            this.streamEpoch = null;
+            this.lastSeq = null;
+        }
+        const resumeParams = resume && this.streamEpoch !== null && this.lastSeq !== null
+            ? `&epoch=${this.streamEpoch}&last_seq=${this.lastSeq}`
+            : '';
+        const wsUrl = `ws://localhost:8000/options/${symbol}/${expiry}?token=${token}${resumeParams}`;
         console.log('Connecting to WebSocket:', wsUrl);
         
         this.ws = new WebSocket(wsUrl);
@@ -42,16 +52,28 @@ class WebSocketService {
         this.ws.onopen = () => {
             console.log('WebSocket connected');
             this.reconnectAttempts = 0;
-            // Subscribe to option chain updates
-            this.sendMessage({
-                type: 'subscribe'
-            });
+            // The chain topic streams its own tokens; only re-send instruments held beyond it
+            const instruments = Array.from(this.subscribedInstruments);
+            if (instruments.length > 0) {
+                this.sendMessage({ type: 'subscribe', instruments });
+            }
         };
 
         this.ws.onmessage = (event) => {
             try {
-                const message = JSON.parse(event.data);
-                this.messageHandlers.forEach(handler => handler(message));
+                // With batched frames one frame carries a JSON array of messages
+                const parsed = JSON.parse(event.data);
+                for (const message of Array.isArray(parsed) ? parsed : [parsed]) {
+                    // Deltas arrive out of order, only snapshots and POSITION move the resume position
+                    if (message.type === 'OPTION_CHAIN' && message.epoch !== undefined) {
+                        this.streamEpoch = message.epoch;
+                        this.lastSeq = message.seq ?? null;
+                    } else if (message.type === 'POSITION' && message.epoch === this.streamEpoch && message.seq !== undefined
+                        && (this.lastSeq === null || message.seq > this.lastSeq)) {
+                        this.lastSeq = message.seq;
+                    }
+                    this.messageHandlers.forEach(handler => handler(message));
+                }
             } catch (error) {
                 console.error('Error parsing WebSocket message:', error);
             }
@@ -68,7 +90,7 @@ class WebSocketService {
                 this.reconnectAttempts++;
                 setTimeout(() => {
                     if (this.currentSymbol && this.currentExpiry) {
-                        this.connect(this.currentSymbol, this.currentExpiry);
+                        this.connect(this.currentSymbol, this.currentExpiry, true);
                     }
                 }, this.reconnectTimeout);
             }
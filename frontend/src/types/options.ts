@@ -55,13 +55,15 @@ export interface MarketData {
 }
 
 // WebSocket message types
-export type WSMessageType = 'MARKET_DATA' | 'OPTION_CHAIN' | 'ERROR' | 'pong';
+export type WSMessageType = 'MARKET_DATA' | 'OPTION_CHAIN' | 'RESUMED' | 'POSITION' | 'ERROR' | 'pong';
 
 // WebSocket message
 export interface WSMessage {
     type: WSMessageType;
     data?: MarketData | OptionChainData;
     error?: string;
+    epoch?: number;  // server stream epoch, on OPTION_CHAIN, RESUMED and POSITION
+    seq?: number;  // position in the (symbol, expiry) stream; on POSITION, delivered up to here
 }
 
 // API Response Types